@@ -0,0 +1,288 @@
+"""Vectorized analysis of section topics
+
+Usage:
+    topics = TopicFrame.from_store(storage.Store(), section='politics')
+    topics.top(10, by='views')
+    topics.by_poster().head(20)
+    topics.activity('D')                    # topics, comments and views per day of last activity
+    topics.frame[topics.title_contains('buhari', 'pmb') & topics.title_contains('recession')]
+
+Topic records are converted to columns once. Every method after that is a pandas/numpy
+operation over whole columns, never a loop over rows.
+"""
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import hack
+
+COLUMNS = ['section', 'page', 'poster', 'title', 'url', 'comments', 'views', 'last_commenter', 'other_meta']
+CATEGORY_COLUMNS = ['section', 'poster', 'last_commenter']
+
+# other_meta holds the time of the last comment, as nairaland shows it on section pages:
+# '2:42pm' today, '2:42pm Apr 18' (or '2:42pm On Apr 18') this year, '2:42pm Apr 18, 2016' before.
+# Old topics may show only the date.
+LAST_ACTIVITY = re.compile(
+    r"(?:(?P<hour>\d{1,2}):(?P<minute>\d{2})\s*(?P<half>[ap]m))?\s*(?:On\s+)?"
+    r"(?:(?P<month>[A-Z][a-z]{2})\s+(?P<day>\d{1,2})(?:,\s*(?P<year>\d{4}))?)?", re.IGNORECASE)
+TOPIC_ID = r"^(?:[a-z]+://[^/]+)?/(\d+)(?:/|$)" # hack.topic_id of a whole column
+MONTHS = {name : number for number, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+
+def parse_last_activity(other_meta, crawled):
+    """Timestamps of the last comments described by other_meta
+
+    Parameters
+    -----------
+    other_meta : pandas.Series
+        other_meta of each topic
+    crawled : pandas.Series
+        datetime64 of when each topic was scraped. It supplies the date of '2:42pm'
+        and the year of '2:42pm Apr 18'.
+
+    Returns
+    --------
+    pandas.Series
+        datetime64, NaT where other_meta holds no time or date
+
+    Notes
+    ------
+    Only distinct other_meta values are run through the regex; there are few of them
+    (at most one per minute of the day per date), even for millions of topics.
+    """
+    codes, uniques = pd.factorize(other_meta.astype(object).where(other_meta.notna(), ''))
+    parts = pd.Series(uniques, dtype=object).str.extract(LAST_ACTIVITY)
+
+    hour = pd.to_numeric(parts['hour']).to_numpy()
+    minute = pd.to_numeric(parts['minute']).to_numpy()
+    pm = (parts['half'].str.lower() == 'pm').to_numpy()
+    month = parts['month'].str.lower().map(MONTHS).to_numpy(dtype=float)
+    day = pd.to_numeric(parts['day']).to_numpy()
+    year = pd.to_numeric(parts['year']).to_numpy()
+
+    # 12:05am is 00:05 and 12:05pm is 12:05
+    minutes = (np.mod(hour, 12) + np.where(pm, 12, 0)) * 60 + minute
+    has_time = ~np.isnan(minutes)
+    has_date = ~np.isnan(month) & ~np.isnan(day)
+
+    # expand the per-unique parts to rows
+    minutes, has_time, has_date = minutes[codes], has_time[codes], has_date[codes]
+    month, day, year = month[codes], day[codes], year[codes]
+    crawled = pd.to_datetime(crawled).to_numpy(dtype='datetime64[ns]')
+    crawl_day = crawled.astype('datetime64[D]')
+    crawl_year = crawl_day.astype('datetime64[Y]').astype(int) + 1970
+
+    no_year = has_date & np.isnan(year)
+    year = np.where(no_year, crawl_year, year)
+    dates = pd.to_datetime(
+        pd.DataFrame({'year' : year, 'month' : month, 'day' : day})[has_date], errors='coerce')
+    dates = dates.reindex(range(len(codes))).to_numpy(dtype='datetime64[D]')
+    # 'Dec 31' seen on Jan 2 is last year's
+    future = no_year & (dates > crawl_day)
+    if future.any():
+        dates[future] = (pd.DatetimeIndex(dates[future]) - pd.DateOffset(years=1)).to_numpy(dtype='datetime64[D]')
+    dates = np.where(has_date, dates, np.where(has_time, crawl_day, np.datetime64('NaT', 'D')))
+
+    stamps = dates.astype('datetime64[ns]') + np.where(has_time, minutes, 0).astype('timedelta64[m]')
+    return pd.Series(stamps, index=other_meta.index, name='last_activity')
+
+class TopicFrame(object):
+    """Topics of one or more sections held as typed columns
+
+    Parameters
+    -----------
+    frame : pandas.DataFrame
+        Columns of COLUMNS plus 'crawled' (datetime64). Use the from_* constructors.
+
+    Notes
+    ------
+    comments and views are int64, with counts that could not be read set to 0.
+    section, poster and last_commenter are categoricals, so grouping on them works on integer codes.
+    last_activity is parsed from other_meta once, when the frame is built.
+    """
+    def __init__(self, frame):
+        frame = frame.reset_index(drop=True)
+        for column in ('comments', 'views'):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0).astype('int64')
+        frame['page'] = pd.to_numeric(frame['page'], errors='coerce').fillna(-1).astype('int32')
+        for column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        frame['last_activity'] = parse_last_activity(frame['other_meta'], frame['crawled'])
+        self.frame = frame
+
+    def __str__(self):
+        return "TopicFrame: {} topics in {} sections".format(len(self.frame), len(self.frame['section'].cat.categories))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @classmethod
+    def from_columns(cls, columns, crawled=None):
+        """Build from a mapping of column name to sequence
+
+        crawled is a datetime or epoch seconds, now by default. A 'crawled' column of epoch seconds,
+        as the Store keeps, takes precedence. Epoch seconds are read as UTC.
+        """
+        frame = pd.DataFrame({column : columns.get(column) for column in COLUMNS})
+        if 'crawled' in columns:
+            frame['crawled'] = pd.to_datetime(columns['crawled'], unit='s')
+        else:
+            frame['crawled'] = _timestamp(crawled)
+        return cls(frame)
+
+    @classmethod
+    def from_records(cls, topics, section=None, page=None, crawled=None):
+        """Build from hack.Topic records, e.g. a page of TopicCollector.scrap_topics_for_range_of_pages"""
+        records = list(topics)
+        columns = {field : [getattr(topic, field) for topic in records] for field in hack.Topic._fields}
+        columns['section'] = [section] * len(records)
+        columns['page'] = [page] * len(records)
+        return cls.from_columns(columns, crawled)
+
+    @classmethod
+    def from_pages(cls, pages, section=None, start=0, crawled=None):
+        """Build from the pages yielded by TopicCollector.scrap_topics_for_range_of_pages"""
+        columns = {column : [] for column in COLUMNS}
+        for number, page in enumerate(pages, start=start):
+            for topic in page or (): # a page a Checkpoint dead-lettered is None
+                for field in hack.Topic._fields:
+                    columns[field].append(getattr(topic, field))
+                columns['section'].append(section)
+                columns['page'].append(number)
+        return cls.from_columns(columns, crawled)
+
+    @classmethod
+    def from_store(cls, store, section=None):
+        """Build from the topics table of a storage.Store, optionally of one section"""
+        store.flush()
+        query = "SELECT {}, crawled FROM topics".format(", ".join(COLUMNS))
+        parameters = []
+        if section is not None:
+            query += " WHERE section = ?"
+            parameters.append(section)
+        rows = store.db.execute(query, parameters).fetchall()
+        columns = dict(zip(COLUMNS + ['crawled'], zip(*rows))) if rows else {column : [] for column in COLUMNS + ['crawled']}
+        return cls.from_columns({column : list(values) for column, values in columns.items()})
+
+    @classmethod
+    def from_parquet(cls, path, crawled=None):
+        """Build from a file written by hack.export_topics_to_parquet. crawled defaults to the file's mtime."""
+        frame = pd.read_parquet(path)
+        frame['crawled'] = _timestamp(os.path.getmtime(path) if crawled is None else crawled)
+        return cls(frame)
+
+    @classmethod
+    def from_excel(cls, paths, section=None, crawled=None):
+        """Build from files written by hack.export_topics_to_excel. crawled defaults to each file's mtime."""
+        frames = []
+        for path in paths:
+            frame = pd.read_excel(path, dtype={'OTHERS' : str})
+            frame.columns = ['poster', 'title', 'url', 'comments', 'views', 'last_commenter', 'other_meta']
+            frame['section'] = section
+            frame['page'] = None
+            frame['crawled'] = _timestamp(os.path.getmtime(path) if crawled is None else crawled)
+            frames.append(frame)
+        return cls(pd.concat(frames, ignore_index=True))
+
+    def dedupe(self):
+        """A TopicFrame without the topics met again on a later page, keyed on the numeric topic id
+
+        Excel exports made before dedupe_topic_pages list a topic once for every page it was bumped onto.
+        The first row of a topic is kept; rows whose url holds no id are all kept.
+        """
+        ids = pd.to_numeric(self.frame['url'].astype(object).str.extract(TOPIC_ID, expand=False))
+        return TopicFrame(self.frame[ids.isna() | ~ids.duplicated()])
+
+    def engagement(self):
+        """comments / views of every topic, NaN for topics without views"""
+        views = self.frame['views'].to_numpy(dtype=float)
+        views[views == 0] = np.nan
+        return pd.Series(self.frame['comments'].to_numpy() / views, index=self.frame.index, name='engagement')
+
+    def _aggregate(self, by):
+        grouped = self.frame.groupby(by, observed=True, sort=False)
+        summary = grouped.agg(
+            topics=('url', 'size'), comments=('comments', 'sum'), views=('views', 'sum'),
+            max_views=('views', 'max'), last_activity=('last_activity', 'max'))
+        views = summary['views'].to_numpy(dtype=float)
+        views[views == 0] = np.nan
+        summary['engagement'] = summary['comments'].to_numpy() / views
+        summary['views_per_topic'] = summary['views'] / summary['topics']
+        return summary.sort_values(['topics', 'views'], ascending=False)
+
+    def by_poster(self):
+        """Topics, comments, views and engagement of every poster, most prolific first"""
+        return self._aggregate('poster')
+
+    def by_section(self):
+        """Topics, comments, views and engagement of every section, largest first"""
+        return self._aggregate('section')
+
+    def top(self, k=10, by='views'):
+        """The k topics with the most `by` ('views', 'comments' or 'engagement'), largest first"""
+        values = self.engagement().to_numpy() if by == 'engagement' else self.frame[by].to_numpy()
+        values = np.nan_to_num(values, nan=-np.inf)
+        k = min(k, len(values))
+        if not k:
+            return self.frame.iloc[:0]
+        # argpartition finds the k largest in linear time; only those k are sorted
+        largest = np.argpartition(values, len(values) - k)[len(values) - k:]
+        largest = largest[np.argsort(values[largest], kind='stable')[::-1]]
+        return self.frame.iloc[largest]
+
+    def activity(self, freq='D', by=None):
+        """Topics, comments and views bucketed by time of last activity
+
+        Parameters
+        -----------
+        freq : str
+            pandas frequency of the buckets: 'h', 'D', 'W', 'MS', ...
+        by : str
+            'section' or 'poster' to bucket each of them separately
+
+        Returns
+        --------
+        pandas.DataFrame
+            indexed by (`by` and) bucket start. Topics without a readable time, and buckets
+            without topics, are left out.
+        """
+        stamps = self.frame['last_activity']
+        readable = stamps.notna().to_numpy()
+        try:
+            # flooring and grouping on the result is much faster than resampling with pd.Grouper
+            buckets = stamps[readable].dt.floor(freq)
+        except ValueError:
+            # Weeks, months, business days... have no fixed length to floor to.
+            # The counts and sums of days add up into any of them.
+            daily = self.activity('D', by)
+            keys = [pd.Grouper(level='last_activity', freq=freq)]
+            if by is not None:
+                keys.insert(0, daily.index.get_level_values(by))
+            summary = daily.groupby(keys, observed=True).sum()
+            return summary[summary['topics'] > 0]
+
+        keys = [buckets]
+        if by is not None:
+            keys.insert(0, self.frame[by][readable])
+        return self.frame.loc[readable, ['comments', 'views']].groupby(keys, observed=True).agg(
+            topics=('comments', 'size'), comments=('comments', 'sum'), views=('views', 'sum'))
+
+    def hour_of_day(self):
+        """Topics whose last comment fell in each hour of the day, 0 to 23"""
+        hours = self.frame['last_activity'].dropna().dt.hour.to_numpy()
+        return pd.Series(np.bincount(hours, minlength=24), name='topics')
+
+    def title_contains(self, *words):
+        """Boolean mask of topics whose title contains any of words, ignoring case"""
+        pattern = "|".join(re.escape(word) for word in words)
+        return self.frame['title'].str.contains(pattern, case=False, regex=True, na=False)
+
+def _timestamp(value):
+    if value is None:
+        value = time.time()
+    if isinstance(value, (int, float)):
+        return pd.to_datetime(value, unit='s')
+    return pd.Timestamp(value)
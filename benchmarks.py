@@ -0,0 +1,602 @@
+"""Offline benchmarks for hack.py
+
+Usage:
+    python benchmarks.py                       # run every benchmark
+    python benchmarks.py excel_export_memory   # run only the named ones
+
+Every run is appended to output/benchmarks.jsonl with the commit it ran on, and each
+result is printed next to its value in the last saved run of a different commit.
+Timings are the best of several repeats, in milliseconds.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+
+from unittest import mock
+from operator import itemgetter
+from collections import namedtuple, OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl as OP
+
+import hack
+
+from replay import ReplayServer, comment_blocks, synthetic_post_page, synthetic_user_page, synthetic_section_page
+
+TEST_DIR = os.path.join(hack.BASE_DIR, 'test-dir')
+RESULTS_FILE = os.path.join(hack.OUTPUT_DIR, 'benchmarks.jsonl')
+REPEAT = 5
+
+def fixture_blocks():
+    """Comment blocks of the test-dir pages followed by those of the comment block collection"""
+    blocks = []
+    for name in sorted(os.listdir(TEST_DIR)):
+        with open(os.path.join(TEST_DIR, name), 'r', encoding='utf-8') as rh:
+            blocks.append(rh.read())
+    return blocks + comment_blocks()
+
+def best_time(function, setup=lambda: (), repeat=REPEAT):
+    """Best of `repeat` timings of function(*setup()) in milliseconds. setup is not timed."""
+    timings = []
+    for _ in range(repeat):
+        args = setup()
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 2)
+
+class InMemoryPageCache(object):
+    """Stands in for hack.PageCache, serving prepared pages without any network"""
+    def __init__(self, pages):
+        self.pages = pages
+
+    def fetch(self, url, max_age=0):
+        return self.pages[url]
+
+def synthetic_topic_pages(pages, topics_per_page=60):
+    """Yield `pages` lazy pages of synthetic topics, shaped like TopicCollector pages"""
+    def page(number):
+        for n in range(topics_per_page):
+            topic_id = number * topics_per_page + n
+            yield hack.Topic(
+                'poster{}'.format(topic_id % 997), 'Synthetic topic number {} about nothing in particular'.format(topic_id),
+                'http://www.nairaland.com/{}/synthetic-topic'.format(topic_id), topic_id % 500, topic_id * 7,
+                'commenter{}'.format(topic_id % 991), '10:15am On Oct 18')
+    for number in range(pages):
+        yield page(number)
+
+def _in_memory_topics_workbook(pages, destination_file):
+    """The export as it was before write-only mode, for comparison"""
+    work_book = OP.Workbook()
+    active_sheet = work_book.active
+    row_number = 2
+    for page in list(pages):
+        for topic in list(page):
+            for column, value in enumerate(topic, start=1):
+                active_sheet.cell(row=row_number, column=column, value=value)
+            row_number += 1
+    work_book.save(destination_file)
+
+def _peak_memory(function, *args):
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_excel_export_memory(pages=1000):
+    """Peak traced memory in bytes of export_topics_to_excel over `pages` synthetic pages of 60 topics"""
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch('hack.OUTPUT_DIR', output_dir), \
+            mock.patch('hack.os.startfile', create=True), \
+            mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages') as scrap:
+
+        for number_of_pages in (10, pages):
+            scrap.side_effect = lambda **kwargs: synthetic_topic_pages(number_of_pages)
+            peak = _peak_memory(hack.export_topics_to_excel, 'synthetic', 0, number_of_pages - 1)
+            results['streaming_{}_pages'.format(number_of_pages)] = peak
+
+        destination_file = os.path.join(output_dir, 'in_memory.xlsx')
+        peak = _peak_memory(_in_memory_topics_workbook, synthetic_topic_pages(pages), destination_file)
+        results['in_memory_{}_pages'.format(pages)] = peak
+    return results
+
+def benchmark_html_export(pages=1000, pages_per_file=100):
+    """Milliseconds and peak traced memory in bytes of export_topics_to_html over `pages` synthetic pages of 60 topics"""
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch('hack.OUTPUT_DIR', output_dir), \
+            mock.patch('hack.os.startfile', create=True), \
+            mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages') as scrap:
+        scrap.side_effect = lambda **kwargs: synthetic_topic_pages(pages)
+        for label, split in (('single_file', None), ('split', pages_per_file)):
+            export = lambda: hack.export_topics_to_html('synthetic', 0, pages - 1, pages_per_file=split)
+            results['{}_ms'.format(label)] = best_time(export, repeat=1)
+            results['{}_peak_bytes'.format(label)] = _peak_memory(export)
+        results['largest_file_bytes'] = max(
+            os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir) if 'part' in name)
+    return results
+
+def _class_mutated_topic(poster, title, url, comments, views, last_commenter, other_meta):
+    """How topics were built before hack.Topic: a new class per record, fields set on the class"""
+    Post = namedtuple('Post', ['poster', 'title', 'url', 'comments', 'views', 'last_commenter', 'other_meta'])
+    Post.poster, Post.title, Post.url, Post.comments = poster, title, url, comments
+    Post.views, Post.last_commenter, Post.other_meta = views, last_commenter, other_meta
+    return Post
+
+def _bytes_per_record(make_record, records):
+    fields = [('poster{}'.format(n), 'Topic {}'.format(n), 'http://www.nairaland.com/{}/topic'.format(n), n % 500, n * 7,
+               'commenter{}'.format(n), '10:15am') for n in range(records)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [make_record(*each) for each in fields]
+        return (tracemalloc.get_traced_memory()[0] - before) // len(kept)
+    finally:
+        tracemalloc.stop()
+
+def benchmark_record_memory(records=20000):
+    """Bytes held per topic record (field values excluded) by the old class-per-record builder and by hack.Topic"""
+    return {
+        'class_mutated_bytes_per_record' : _bytes_per_record(_class_mutated_topic, records),
+        'topic_tuple_bytes_per_record' : _bytes_per_record(hack.Topic, records),
+    }
+
+def benchmark_parse_workers(pages=60, workers=(0, 1, 2, 4, 8), parser='html5lib'):
+    """Post pages parsed per second against the number of parser processes (0 parses in-process)"""
+    blocks = comment_blocks()
+    post_url = 'http://nairaland.test/1234/synthetic'
+    cache = InMemoryPageCache({
+        '{}/{}'.format(post_url, number) : synthetic_post_page(number, blocks) for number in range(pages)})
+
+    results = {'cpu_count' : os.cpu_count()}
+    with mock.patch('hack.page_cache', return_value=cache):
+        collector = hack.PostCollector(post_url, parser=parser)
+        collector._scrap_comment_for_single_page = lambda url: hack.scrap_post_page(hack.make_soup(cache.fetch(url), parser))
+        for number_of_workers in workers:
+            started = time.perf_counter()
+            for _ in collector.scrap_comments_for_range_of_post_pages(0, pages - 1, parse_workers=number_of_workers):
+                pass
+            results['pages_per_second_{}_workers'.format(number_of_workers)] = round(pages / (time.perf_counter() - started), 1)
+    return results
+
+def benchmark_comment_parsing(parser='html5lib'):
+    """Milliseconds to run each comment parsing function over every fixture comment block"""
+    blocks = fixture_blocks()
+    fresh_blocks = lambda: ([hack.make_soup(block, parser).body for block in blocks],)
+    br_elements = [br for body in fresh_blocks()[0] for br in body.find_all('br')]
+    br_tuples = [[hack.get_left_right_of_html_br_element(br) for br in body.find_all('br')] for body in fresh_blocks()[0]]
+
+    results = {'blocks' : len(blocks), 'br_elements' : len(br_elements)}
+    results['get_left_right_of_html_br_element_ms'] = best_time(
+        lambda: [hack.get_left_right_of_html_br_element(br) for br in br_elements])
+    results['join_br_tuples_ms'] = best_time(lambda: [hack.join_br_tuples(each) for each in br_tuples])
+    # both functions decompose blockquotes, so each repeat gets freshly parsed blocks
+    results['format_comments_ms'] = best_time(lambda bodies: [hack.format_comments(body) for body in bodies], fresh_blocks)
+    results['parse_comment_block_ms'] = best_time(
+        lambda bodies: [hack.parse_comment_block(body) for body in bodies], fresh_blocks)
+    return results
+
+def _sibling_format_comments(comment_block):
+    """format_comments as it was before comment_paragraphs: sibling lookups around every <br>"""
+    br_elements = comment_block.find_all('br')
+    if br_elements == []:
+        return hack.tag_text(comment_block)
+    return hack.join_br_tuples([hack.get_left_right_of_html_br_element(br) for br in br_elements])
+
+def benchmark_comment_extraction(parser='html5lib'):
+    """Milliseconds to extract the text of every fixture comment block, before and after comment_paragraphs"""
+    blocks = fixture_blocks()
+    bodies = [hack.make_soup(block, parser).body for block in blocks]
+    sibling = best_time(lambda: [_sibling_format_comments(body) for body in bodies])
+    single_pass = best_time(lambda: [hack.format_comments(body) for body in bodies])
+    native_bodies = [hack.make_soup(block, hack.NATIVE_PARSER).body for block in blocks]
+    return {
+        'sibling_lookups_ms' : sibling,
+        'single_pass_ms' : single_pass,
+        'speedup' : round(sibling / single_pass, 2),
+        'single_pass_native_ms' : best_time(lambda: [hack.format_comments(body) for body in native_bodies]),
+    }
+
+def benchmark_single_page_scraping(posts=3000, parser='html5lib'):
+    """Milliseconds for each _scrap_*_for_single_page method to get through `posts` comments or topics"""
+    blocks = comment_blocks()
+    base_url = 'http://nairaland.test'
+    kinds = {
+        'post' : (30, lambda number: synthetic_post_page(number, blocks)),
+        'user' : (25, lambda number: synthetic_user_page(number, blocks)),
+        'section' : (60, synthetic_section_page),
+    }
+    pages = {}
+    for kind, (per_page, make_page) in kinds.items():
+        for number in range(-(-posts // per_page)):
+            pages['{}/{}/{}'.format(base_url, kind, number)] = make_page(number)
+    cache = InMemoryPageCache(pages)
+
+    results = {}
+    with mock.patch('hack.page_cache', return_value=cache), \
+            mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True):
+        scrapers = {
+            'post' : hack.PostCollector('{}/post'.format(base_url), parser=parser)._scrap_comment_for_single_page,
+            'user' : hack.UserCommentHistory('someone', parser=parser)._scrap_comment_for_single_page,
+            'section' : lambda url: list(hack.TopicCollector(parser=parser)._scrap_topics_for_a_single_page(url)),
+        }
+        for kind, scrap in scrapers.items():
+            urls = [url for url in pages if url.startswith('{}/{}/'.format(base_url, kind))]
+            results['{}_pages'.format(kind)] = len(urls)
+            results['{}_ms'.format(kind)] = best_time(lambda: [scrap(url) for url in urls], repeat=1)
+    return results
+
+def benchmark_exports(pages=20):
+    """Milliseconds each export_* function takes to write `pages` already scraped pages"""
+    blocks = comment_blocks()
+    post_pages = [hack.scrap_post_page(hack.make_soup(synthetic_post_page(n, blocks), hack.NATIVE_PARSER)) for n in range(pages)]
+    user_pages = [hack.scrap_user_page(hack.make_soup(synthetic_user_page(n, blocks), hack.NATIVE_PARSER)) for n in range(pages)]
+    topic_pages = [list(hack.scrap_topics_page(hack.make_soup(synthetic_section_page(n), hack.NATIVE_PARSER)))
+                   for n in range(pages)]
+    replay = lambda pages: lambda *args, **kwargs: iter(pages)
+
+    exports = {
+        'export_user_comments_to_html' : lambda: hack.export_user_comments_to_html('someone', pages),
+        'export_user_comments_to_excel' : lambda: hack.export_user_comments_to_excel('someone', pages),
+        'export_topics_to_html' : lambda: hack.export_topics_to_html('synthetic', 0, pages - 1),
+        'export_topics_to_excel' : lambda: hack.export_topics_to_excel('synthetic', 0, pages - 1),
+        'export_post_docx' : lambda: hack.export_post_docx('http://nairaland.test/1/synthetic'),
+        'export_post_to_markdown' : lambda: hack.export_post_to_markdown('http://nairaland.test/1/synthetic'),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch('hack.OUTPUT_DIR', output_dir), \
+            mock.patch('hack.os.startfile', create=True), \
+            mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True), \
+            mock.patch.object(hack.PostCollector, 'get_title', return_value='Synthetic post'), \
+            mock.patch.object(hack.PostCollector, 'scrap_comments_for_range_of_post_pages', replay(post_pages)), \
+            mock.patch.object(hack.UserCommentHistory, 'scrap_comments_for_range_of_user_pages', replay(user_pages)), \
+            mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages', replay(topic_pages)):
+        for name, export in exports.items():
+            results['{}_ms'.format(name)] = best_time(export)
+    return results
+
+def benchmark_crawl_throughput(pages=40, latency=0.02, jitter=0.02, error_rate=0.0, concurrency=8,
+                               parser=hack.NATIVE_PARSER):
+    """Pages per second and p50/p99 request latency of every collector crawling a local ReplayServer"""
+    server = ReplayServer(latency=latency, jitter=jitter, error_rate=error_rate,
+                          page_counts={'section' : pages, 'post' : pages, 'user' : pages}, seed=0)
+    transport = hack.Transport(pool_size=concurrency, backoff=0.05)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch('hack.BASE_URL', server.base_url), \
+                mock.patch.object(hack.Nairaland, 'site_url', server.base_url + '/'), \
+                mock.patch('hack.TRANSPORT', transport), \
+                mock.patch('hack.PAGE_CACHE', hack.PageCache(cache_dir)):
+            collectors = {
+                'section' : hack.TopicCollector('politics', parser=parser).scrap_topics_for_range_of_pages,
+                'post' : hack.PostCollector(
+                    '{}/1234/synthetic'.format(server.base_url), parser=parser).scrap_comments_for_range_of_post_pages,
+                'user' : hack.UserCommentHistory('someone', parser=parser).scrap_comments_for_range_of_user_pages,
+            }
+            for kind, scrap_range in collectors.items():
+                transport.stats = hack.TransportStats()
+                started = time.perf_counter()
+                for _ in scrap_range(0, pages - 1, concurrency=concurrency):
+                    pass
+                stats = transport.stats.summary()
+                results['{}_pages_per_second'.format(kind)] = round(pages / (time.perf_counter() - started), 1)
+                results['{}_p50_ms'.format(kind)] = round(stats['p50'] * 1000, 1)
+                results['{}_p99_ms'.format(kind)] = round(stats['p99'] * 1000, 1)
+                results['{}_retries'.format(kind)] = stats['retries']
+            hack.PAGE_CACHE.close()
+    finally:
+        transport.close()
+        server.stop()
+    return results
+
+def benchmark_frontier_scaling(pages=120, latency=0.05, processes=(1, 2, 4), concurrency=1):
+    """Pages per second of run_workers draining a frontier of `pages` section pages from a local ReplayServer"""
+    import frontier
+    server = ReplayServer(latency=latency, page_counts={'section' : pages}, seed=0)
+    results = {}
+    try:
+        with mock.patch('hack.BASE_URL', server.base_url): # worker processes are forked with it
+            for workers in processes:
+                with tempfile.TemporaryDirectory() as directory:
+                    frontier_path = os.path.join(directory, 'frontier.sqlite')
+                    with frontier.Frontier(frontier_path) as queue:
+                        queue.add_section('politics', 0, pages - 1)
+                    server.requests.clear()
+                    started = time.perf_counter()
+                    frontier.run_workers(
+                        workers, frontier_path, os.path.join(directory, 'crawl.sqlite'),
+                        cache_dir=os.path.join(directory, 'cache'), concurrency=concurrency, parser=hack.NATIVE_PARSER)
+                    elapsed = time.perf_counter() - started
+                    gets = [count for (method, _), count in server.requests.items() if method == 'GET']
+                    results['{}_workers_pages_per_second'.format(workers)] = round(pages / elapsed, 1)
+                    results['{}_workers_duplicate_fetches'.format(workers)] = sum(gets) - len(gets)
+    finally:
+        server.stop()
+    return results
+
+def benchmark_rate_limiter(pages=300, rate_limit=40.0, latency=0.02, concurrency=8):
+    """Pages per second, 429s and lost pages fetching from a ReplayServer that allows `rate_limit` requests/s,
+    with the adaptive HostRateLimiter and with pacing turned off"""
+    server = ReplayServer(latency=latency, page_counts={'section' : pages}, rate_limit=rate_limit, seed=0)
+    urls = ['{}/politics/{}'.format(server.base_url, page) for page in range(pages)]
+    results = {}
+    try:
+        for name, limiter in (('adaptive', None), ('unpaced', False)):
+            transport = hack.Transport(pool_size=concurrency, backoff=0.05, limiter=limiter)
+            server.served.clear()
+            time.sleep(1) # let the server's budget refill
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                statuses = [response.status_code for response in executor.map(transport.get, urls)]
+            elapsed = time.perf_counter() - started
+            transport.close()
+            results['{}_pages_per_second'.format(name)] = round(statuses.count(200) / elapsed, 1)
+            results['{}_429s'.format(name)] = server.served[429]
+            results['{}_lost_pages'.format(name)] = len(statuses) - statuses.count(200)
+            if limiter is None:
+                results['adaptive_final_rate'] = transport.limiter.summary()[urlsplit(server.base_url).netloc]['rate']
+    finally:
+        server.stop()
+    return results
+
+def _synthetic_comment_pages(comments, comments_per_page=30):
+    """(page, OrderedDict of {username : ParsedComment}) of `comments` comments of words drawn from the
+    comment block collection, the common ones far more often, as in real text"""
+    import re
+    import numpy as np
+    words = sorted(set(re.findall(r"[a-z]{3,}", " ".join(comment_blocks()).lower())))
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(5, 60, comments)
+    picks = (rng.zipf(1.3, int(lengths.sum())) - 1) % len(words)
+    users = rng.zipf(1.5, comments) % 50000
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    page = OrderedDict()
+    for n in range(comments):
+        body = " ".join(words[word] for word in picks[offsets[n]:offsets[n + 1]])
+        page['user{}**{}'.format(users[n], n % comments_per_page)] = hack.ParsedComment(body, OrderedDict())
+        if len(page) == comments_per_page:
+            yield n // comments_per_page, page
+            page = OrderedDict()
+    if page:
+        yield comments // comments_per_page, page
+
+def benchmark_search(comments=1000000, sections=('Politics', 'Romance', 'Sports', 'Jobs', 'Travel')):
+    """Milliseconds of full-text queries over `comments` stored synthetic comments, and of storing them"""
+    import storage
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for indexed in (False, True):
+            store = storage.Store(os.path.join(directory, '{}.sqlite'.format(indexed)), batch_size=5000)
+            if not indexed:
+                store.db.executescript("DROP TRIGGER comments_fts_insert; DROP TRIGGER quotes_fts_insert;")
+            started = time.perf_counter()
+            for page, comments_page in _synthetic_comment_pages(comments):
+                store.add_post_page('post{}'.format(page // 20), page % 20, comments_page, sections[page % len(sections)])
+            store.flush()
+            results['{}_store_seconds'.format('indexed' if indexed else 'unindexed')] = round(time.perf_counter() - started, 1)
+            if not indexed:
+                store.close()
+        store.db.execute("CREATE VIRTUAL TABLE temp.vocab USING fts5vocab(main, comments_fts, 'row')")
+        terms = store.db.execute("SELECT term, doc FROM temp.vocab ORDER BY doc DESC").fetchall()
+        common, rare = terms[0], terms[len(terms) // 2]
+        results['common_word_matches'] = common[1]
+        results['rare_word_matches'] = rare[1]
+        queries = {
+            'rare_word' : lambda: store.search(rare[0]),
+            'rare_word_ranked' : lambda: store.search(rare[0], ranked=True),
+            'common_word' : lambda: store.search(common[0]),
+            'common_word_ranked' : lambda: store.search(common[0], ranked=True),
+            'phrase' : lambda: store.search('"{} {}"'.format(common[0], terms[1][0])),
+            'phrase_ranked' : lambda: store.search('"{} {}"'.format(common[0], terms[1][0]), ranked=True),
+            'prefix' : lambda: store.search(rare[0][:4] + '*'),
+            'boolean' : lambda: store.search('{} AND {} NOT {}'.format(rare[0], common[0], terms[2][0])),
+            'common_word_by_user' : lambda: store.search(common[0], username='user300'),
+            'common_word_in_section' : lambda: store.search(common[0], section='Jobs'),
+        }
+        for name, query in queries.items():
+            results['{}_ms'.format(name)] = best_time(query)
+        store.close()
+    return results
+
+def benchmark_topic_dedupe(topics=3000000, highest_id=8000000, duplicates=0.1):
+    """Peak memory and nanoseconds per topic of TopicSet and TopicBitmap over `topics` topic ids
+    up to highest_id, a `duplicates` fraction of them seen before"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    unique = rng.choice(highest_id, int(topics * (1 - duplicates)), replace=False)
+    ids = np.concatenate([unique, rng.choice(unique, topics - len(unique))])
+    rng.shuffle(ids)
+    ids = ids.tolist()
+    results = {}
+    for name, structure in (('set', hack.TopicSet), ('bitmap', hack.TopicBitmap)):
+        seen = structure()
+        started = time.perf_counter()
+        results['{}_unique'.format(name)] = sum(map(seen.add, ids))
+        results['{}_ns_per_topic'.format(name)] = round((time.perf_counter() - started) * 1e9 / topics)
+        del seen
+        tracemalloc.start() # timed apart, as tracing slows every allocation
+        seen = structure()
+        for topic_id in ids:
+            seen.add(topic_id)
+        results['{}_peak_mb'.format(name)] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+        del seen
+    return results
+
+def benchmark_metrics_overhead(calls=1000000):
+    """Nanoseconds an instrumented call site costs with METRICS disabled and enabled"""
+    metrics = hack.Metrics()
+    def call_site():
+        started = time.perf_counter()
+        if metrics.enabled:
+            metrics.observe('stage', time.perf_counter() - started)
+            metrics.count('counter')
+    def empty_loop():
+        for _ in range(calls):
+            pass
+    def instrumented_loop():
+        for _ in range(calls):
+            call_site()
+    def bare_loop():
+        for _ in range(calls):
+            time.perf_counter()
+
+    results = {}
+    baseline = best_time(empty_loop)
+    results['disabled_ns_per_call'] = round((best_time(instrumented_loop) - baseline) * 1e6 / calls, 1)
+    results['perf_counter_only_ns_per_call'] = round((best_time(bare_loop) - baseline) * 1e6 / calls, 1)
+    metrics.enable()
+    results['enabled_ns_per_call'] = round((best_time(instrumented_loop) - baseline) * 1e6 / calls, 1)
+    metrics.disable()
+    return results
+
+def benchmark_parquet_load(pages=1000):
+    """Milliseconds to load `pages` synthetic pages of 60 topics back from parquet and from excel"""
+    if hack.pa is None:
+        return {}
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, \
+            mock.patch('hack.OUTPUT_DIR', output_dir), \
+            mock.patch('hack.os.startfile', create=True), \
+            mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages') as scrap:
+        scrap.side_effect = lambda **kwargs: synthetic_topic_pages(pages)
+        parquet_file = hack.export_topics_to_parquet('synthetic', 0, pages - 1)
+        hack.export_topics_to_excel('synthetic', 0, pages - 1)
+        excel_file = os.path.join(output_dir, 'synthetic_page_0_{}_pages.xlsx'.format(pages - 1))
+
+        def load_excel():
+            work_book = OP.load_workbook(excel_file, read_only=True)
+            rows = list(work_book.active.iter_rows(values_only=True))
+            work_book.close()
+            return rows
+
+        results['parquet_bytes'] = os.path.getsize(parquet_file)
+        results['excel_bytes'] = os.path.getsize(excel_file)
+        results['parquet_load_ms'] = best_time(lambda: hack.pq.read_table(parquet_file))
+        results['excel_load_ms'] = best_time(load_excel, repeat=1)
+        try:
+            import pandas
+        except ImportError:
+            return results
+        results['parquet_to_pandas_ms'] = best_time(lambda: pandas.read_parquet(parquet_file))
+    return results
+
+def _synthetic_topic_columns(topics):
+    """Columns of `topics` synthetic topics over 5 sections, as TopicFrame.from_columns takes them"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    ids = np.arange(topics)
+    stamps = ["{}:{:02d}{}m {} {:02d}".format(hour, minute, half, month, day)
+              for hour in range(1, 13) for minute in range(0, 60, 7) for half in 'ap'
+              for month in ('Oct', 'Nov') for day in range(1, 29, 3)]
+    return {
+        'section' : np.array(['politics', 'romance', 'sports', 'jobs', 'travel'])[ids % 5],
+        'page' : ids // 60,
+        'poster' : np.char.add('poster', (rng.zipf(1.5, topics) % 20000).astype(str)),
+        'title' : np.char.add('Synthetic topic ', ids.astype(str)),
+        'url' : np.char.add('http://www.nairaland.com/', ids.astype(str)),
+        'comments' : rng.integers(0, 500, topics),
+        'views' : rng.integers(0, 50000, topics),
+        'last_commenter' : np.char.add('commenter', (ids % 991).astype(str)),
+        'other_meta' : np.array(stamps)[ids % len(stamps)],
+    }
+
+def _loop_by_poster(rows):
+    """Per-poster totals as the notebook loops would compute them"""
+    totals = {}
+    for poster, comments, views in rows:
+        topic_count, comment_count, view_count = totals.get(poster, (0, 0, 0))
+        totals[poster] = (topic_count + 1, comment_count + comments, view_count + views)
+    return totals
+
+def benchmark_topic_analytics(topics=1000000):
+    """Milliseconds of building a TopicFrame of `topics` synthetic topics and of each of its operations"""
+    import analytics
+    columns = _synthetic_topic_columns(topics)
+    results = {}
+    results['from_columns_ms'] = best_time(lambda: analytics.TopicFrame.from_columns(columns, '2018-11-20'), repeat=1)
+    frame = analytics.TopicFrame.from_columns(columns, '2018-11-20')
+    results['by_poster_ms'] = best_time(frame.by_poster)
+    results['by_section_ms'] = best_time(frame.by_section)
+    results['top_10_views_ms'] = best_time(lambda: frame.top(10))
+    results['top_10_engagement_ms'] = best_time(lambda: frame.top(10, by='engagement'))
+    results['daily_activity_ms'] = best_time(lambda: frame.activity('D'))
+    results['hourly_activity_by_section_ms'] = best_time(lambda: frame.activity('h', by='section'))
+
+    rows = list(zip(columns['poster'].tolist(), columns['comments'].tolist(), columns['views'].tolist()))
+    results['loop_by_poster_ms'] = best_time(lambda: _loop_by_poster(rows), repeat=1)
+    results['loop_top_10_views_ms'] = best_time(lambda: sorted(rows, key=itemgetter(2), reverse=True)[:10], repeat=1)
+    return results
+
+BENCHMARKS = {
+    'excel_export_memory' : benchmark_excel_export_memory,
+    'html_export' : benchmark_html_export,
+    'parse_workers' : benchmark_parse_workers,
+    'record_memory' : benchmark_record_memory,
+    'comment_parsing' : benchmark_comment_parsing,
+    'comment_extraction' : benchmark_comment_extraction,
+    'single_page_scraping' : benchmark_single_page_scraping,
+    'exports' : benchmark_exports,
+    'crawl_throughput' : benchmark_crawl_throughput,
+    'metrics_overhead' : benchmark_metrics_overhead,
+    'frontier_scaling' : benchmark_frontier_scaling,
+    'rate_limiter' : benchmark_rate_limiter,
+    'search' : benchmark_search,
+    'topic_dedupe' : benchmark_topic_dedupe,
+    'parquet_load' : benchmark_parquet_load,
+    'topic_analytics' : benchmark_topic_analytics,
+}
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=str(hack.BASE_DIR),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def load_runs(results_file=RESULTS_FILE):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, 'r', encoding='utf-8') as rh:
+        return [json.loads(line) for line in rh if line.strip()]
+
+def baseline(runs, commit, name):
+    """(commit, results) of benchmark `name` in the last saved run of another commit"""
+    for run in reversed(runs):
+        if run['commit'] != commit and name in run['results']:
+            return run['commit'], run['results'][name]
+    return None, {}
+
+def save_run(run, results_file=RESULTS_FILE):
+    with open(results_file, 'a', encoding='utf-8') as wh:
+        wh.write(json.dumps(run) + "\n")
+
+def main(names):
+    commit = current_commit()
+    runs = load_runs()
+    run = {'commit' : commit, 'time' : time.time(), 'python' : platform.python_version(), 'results' : {}}
+    for name in names or BENCHMARKS:
+        print(name)
+        results = run['results'][name] = BENCHMARKS[name]()
+        previous_commit, previous = baseline(runs, commit, name)
+        for key, value in results.items():
+            change = ""
+            if previous.get(key):
+                change = "{:+.1%} vs {}".format((value - previous[key]) / previous[key], previous_commit)
+            print("    {:<40} {:>14,} {}".format(key, value, change))
+    save_run(run)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
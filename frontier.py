@@ -0,0 +1,381 @@
+"""Crawl frontier shared by any number of worker processes
+
+Usage:
+    frontier = Frontier()
+    frontier.add_section('politics', 0, 999)
+    frontier.add_users(usernames, 0, 9, priority=1)
+    run_workers(processes=4) # or run_worker(Frontier(), storage.Store()) in each of your own processes
+
+Every page of a section, post or comment history is one task, keyed on its url. Workers lease
+tasks in priority order, scrape them with the matching collector and write the pages into a
+storage.Store. A page is handed to one worker at a time and, once done, is never handed out again.
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import random
+import sqlite3
+import argparse
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import hack
+import storage
+
+DEFAULT_FRONTIER = os.path.join(hack.OUTPUT_DIR, 'frontier.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT PRIMARY KEY,
+    kind TEXT,
+    target TEXT,
+    page INTEGER,
+    priority INTEGER,
+    state TEXT,
+    attempts INTEGER,
+    available REAL,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    finished REAL
+);
+-- pending tasks in the order they are leased, and leases by expiry
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (state, priority DESC, available, kind, target, page);
+CREATE INDEX IF NOT EXISTS tasks_leases ON tasks (state, lease_expires);
+"""
+
+# state is 'pending', 'leased', 'done' or 'dead'. attempts counts leases, so a page that
+# kills its worker every time ends up dead like one that raises.
+
+Task = namedtuple('Task', ['url', 'kind', 'target', 'page', 'priority', 'attempts'])
+
+# the range method of each collector; scraping page n is the range n..n
+RANGE_METHODS = {
+    'section' : 'scrap_topics_for_range_of_pages',
+    'post' : 'scrap_comments_for_range_of_post_pages',
+    'user' : 'scrap_comments_for_range_of_user_pages',
+}
+
+def task_url(kind, target, page):
+    """Url of page `page` of a section name, post url or username, as its collector fetches it"""
+    if kind == 'section':
+        return '{}/{}/{}'.format(hack.BASE_URL, target, page)
+    if kind == 'post':
+        return '{}/{}'.format(target, page)
+    if kind == 'user':
+        return '{}/{}/posts/{}'.format(hack.BASE_URL, target.lower(), page)
+    raise ValueError("Unknown task kind {}. Choose one of {}".format(kind, tuple(RANGE_METHODS)))
+
+class Frontier(object):
+    """SQLite queue of page tasks with leases, deduplication, priorities and retries
+
+    Parameters
+    -----------
+    path : str
+        Database file. Every worker on the machine opens the same file.
+    lease_seconds : float
+        How long a leased task belongs to its worker. A task whose lease runs out is
+        handed to the next worker that asks, so a worker that dies loses nothing.
+    max_attempts : int
+        Leases a task gets before it is marked dead
+    backoff : float
+        A failed task waits a random time up to backoff * 2**attempts before it is leased again
+
+    Notes
+    ------
+    1. Tasks are keyed on their url. Adding a page that is already known does nothing,
+       except raise the priority of a task still pending.
+    2. Leasing selects the tasks, marks them leased and reads them back inside one immediate
+       transaction, so two workers can never lease the same task.
+    3. complete() and fail() only act on a task still leased by the caller. A worker whose
+       lease ran out cannot overwrite the work of the worker that took the task over.
+    """
+    def __init__(self, path=DEFAULT_FRONTIER, lease_seconds=300, max_attempts=3, backoff=5.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        if path != ':memory:':
+            self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def __str__(self):
+        return "Frontier: {}".format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _transaction(self, statements):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements()
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return result
+
+    def add(self, kind, target, pages, priority=0):
+        """Queue pages of a section name, post url or username. Returns the number of new tasks."""
+        rows = [(task_url(kind, target, page), kind, target, page, priority) for page in pages]
+        def insert():
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO tasks (url, kind, target, page, priority, state, attempts, available) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', 0, 0)", rows)
+            added = self.db.total_changes - before
+            if added == len(rows):
+                return added
+            self.db.executemany(
+                "UPDATE tasks SET priority = ? WHERE url = ? AND state = 'pending' AND priority < ?",
+                [(priority, url, priority) for url, _, _, _, _ in rows])
+            return added
+        return self._transaction(insert)
+
+    def add_section(self, section, start=0, stop=None, priority=0):
+        """Queue pages start to stop of a section. stop=None counts the section's pages first."""
+        if stop is None:
+            stop = hack.TopicCollector(section).max_pages() - 1
+        return self.add('section', section, range(start, stop + 1), priority)
+
+    def add_post(self, post_url, start=0, stop=None, priority=0):
+        """Queue pages start to stop of a post. stop=None counts the post's pages first."""
+        if stop is None:
+            stop = hack.PostCollector(post_url).max_page() - 1
+        return self.add('post', post_url, range(start, stop + 1), priority)
+
+    def add_users(self, usernames, start=0, stop=0, priority=0):
+        """Queue pages start to stop of the comment history of every user in usernames"""
+        return sum(self.add('user', username, range(start, stop + 1), priority) for username in usernames)
+
+    def lease(self, owner, count=1):
+        """Lease up to count tasks to owner, highest priority first
+
+        Returns
+        --------
+        list
+            Task namedtuples, in priority then page order. Empty when nothing is ready.
+        """
+        now = time.time()
+        def take():
+            self.db.execute(
+                "UPDATE tasks SET state = 'dead', owner = NULL, error = 'lease expired {} times' "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?".format(self.max_attempts),
+                (now, self.max_attempts))
+            # expired leases first, they have waited longest; both queries walk an index and stop at count
+            urls = [url for url, in self.db.execute(
+                "SELECT url FROM tasks WHERE state = 'leased' AND lease_expires < ? LIMIT ?", (now, count))]
+            urls += [url for url, in self.db.execute(
+                "SELECT url FROM tasks WHERE state = 'pending' AND available <= ? "
+                "ORDER BY priority DESC, available, kind, target, page LIMIT ?", (now, count - len(urls)))]
+            # no UPDATE ... RETURNING, which needs SQLite 3.35; the transaction keeps the read consistent
+            placeholders = ", ".join("?" * len(urls))
+            self.db.execute(
+                "UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE url IN ({})".format(placeholders), [owner, now + self.lease_seconds] + urls)
+            return self.db.execute(
+                "SELECT url, kind, target, page, priority, attempts FROM tasks WHERE url IN ({})".format(placeholders),
+                urls).fetchall()
+        tasks = [Task(*row) for row in self._transaction(take)]
+        return sorted(tasks, key=lambda task: (-task.priority, task.kind, task.target, task.page))
+
+    def complete(self, urls, owner):
+        """Mark tasks done. Returns the number that were still leased by owner."""
+        now = time.time()
+        def finish():
+            before = self.db.total_changes
+            self.db.executemany(
+                "UPDATE tasks SET state = 'done', finished = ?, owner = NULL, lease_expires = NULL, error = NULL "
+                "WHERE url = ? AND owner = ? AND state = 'leased'", [(now, url, owner) for url in urls])
+            return self.db.total_changes - before
+        return self._transaction(finish)
+
+    def fail(self, url, owner, error, permanent=False):
+        """Give a task back after a failure. It is retried after a backoff, or dead after max_attempts."""
+        def give_back():
+            row = self.db.execute(
+                "SELECT attempts FROM tasks WHERE url = ? AND owner = ? AND state = 'leased'", (url, owner)).fetchone()
+            if row is None:
+                return False
+            if permanent or row[0] >= self.max_attempts:
+                self.db.execute(
+                    "UPDATE tasks SET state = 'dead', owner = NULL, lease_expires = NULL, error = ? WHERE url = ?",
+                    (error, url))
+            else:
+                available = time.time() + random.uniform(0, self.backoff * 2 ** row[0])
+                self.db.execute(
+                    "UPDATE tasks SET state = 'pending', owner = NULL, lease_expires = NULL, available = ?, error = ? "
+                    "WHERE url = ?", (available, error, url))
+            return True
+        return self._transaction(give_back)
+
+    def release(self, owner):
+        """Hand every task leased by owner back untouched, e.g. when the worker is stopped"""
+        return self._transaction(lambda: self.db.execute(
+            "UPDATE tasks SET state = 'pending', owner = NULL, lease_expires = NULL, attempts = attempts - 1 "
+            "WHERE owner = ? AND state = 'leased'", (owner,)).rowcount)
+
+    def retry_dead(self):
+        """Queue dead tasks again with fresh attempts"""
+        return self._transaction(lambda: self.db.execute(
+            "UPDATE tasks SET state = 'pending', attempts = 0, available = 0 WHERE state = 'dead'").rowcount)
+
+    def counts(self):
+        """Return {state : number of tasks}"""
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+    def outstanding(self):
+        """Number of tasks not yet done or dead"""
+        return self.db.execute("SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def dead_letters(self):
+        """Return [(url, error)] of dead tasks"""
+        return self.db.execute("SELECT url, error FROM tasks WHERE state = 'dead' ORDER BY url").fetchall()
+
+    def close(self):
+        self.db.close()
+
+def _store_page(store, task, collector, page):
+    if task.kind == 'section':
+        store.add_topics(task.target, task.page, page)
+    elif task.kind == 'post':
+        store.add_post_page(task.target, task.page, page)
+    else:
+        store.add_user_page(task.target, collector.user_post_page, task.page, page)
+
+def run_worker(frontier, store, owner=None, concurrency=1, batch=None, parser='html5lib', wait=1.0, max_tasks=None):
+    """Lease, scrape and store tasks until the frontier has none left
+
+    Parameters
+    -----------
+    frontier : Frontier
+        This process's connection to the shared frontier
+    store : storage.Store
+        Where scraped pages are written
+    owner : str
+        Name of the worker in the leases. Default is host:pid:random.
+    concurrency : int
+        Pages fetched at the same time by this worker
+    batch : int
+        Tasks leased at a time. Default is concurrency.
+    wait : float
+        Seconds to wait when no task is ready but others are still leased or backing off
+    max_tasks : int
+        Stop after this many tasks. Default is to run until the frontier is drained.
+
+    Returns
+    --------
+    int
+        Number of tasks this worker completed
+
+    Notes
+    ------
+    A batch is written to the store and flushed before its tasks are marked done, so a
+    worker killed in between only costs a refetch of pages that the store upserts anyway.
+    """
+    owner = owner or '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+    batch = batch or max(concurrency or 1, 1)
+    collectors = {}
+
+    def collector(kind, target):
+        key = (kind, target)
+        if key not in collectors:
+            collectors[key] = hack.PAGE_KINDS[kind](target, parser=parser)
+        return collectors[key]
+
+    def scrap(task):
+        try:
+            task_collector = collector(task.kind, task.target)
+            pages = getattr(task_collector, RANGE_METHODS[task.kind])(task.page, task.page)
+            page = next(iter(pages))
+            return task, task_collector, list(page) if task.kind == 'section' else page, None, False
+        except hack.NonExistentNairalandUser as exception:
+            return task, None, None, "{}: {}".format(type(exception).__name__, exception), True
+        except Exception as exception: # one failing page must not end the worker
+            return task, None, None, "{}: {}".format(type(exception).__name__, exception), False
+
+    completed = 0
+    try:
+        while max_tasks is None or completed < max_tasks:
+            size = batch if max_tasks is None else min(batch, max_tasks - completed)
+            tasks = frontier.lease(owner, size)
+            if not tasks:
+                if not frontier.outstanding():
+                    break
+                time.sleep(wait)
+                continue
+            done = []
+            for task, task_collector, page, error, permanent in hack.ordered_concurrent_map(scrap, tasks, concurrency):
+                if error is not None:
+                    frontier.fail(task.url, owner, error, permanent)
+                    continue
+                _store_page(store, task, task_collector, page)
+                done.append(task.url)
+            store.flush()
+            completed += frontier.complete(done, owner)
+            if hack.METRICS.enabled:
+                hack.METRICS.count('frontier_tasks', len(done))
+    finally:
+        frontier.release(owner)
+    return completed
+
+def _worker_process(frontier_path, database, options, cache_dir=None, processes=1):
+    # a forked process must not share the parent's sqlite connections or pooled sockets.
+    # Its rate limiter can't be shared either, so each process takes its part of every host's budget.
+    hack.PAGE_CACHE = None
+    hack.TRANSPORT = hack.Transport(
+        pool_size=max(options.get('concurrency') or 1, 1), limiter=hack.HostRateLimiter(share=1.0 / processes))
+    if cache_dir is not None:
+        hack.configure_page_cache(directory=cache_dir)
+    with Frontier(frontier_path) as frontier, storage.Store(database) as store:
+        return run_worker(frontier, store, **options)
+
+def run_workers(processes=2, frontier_path=DEFAULT_FRONTIER, database=storage.DEFAULT_DATABASE, cache_dir=None,
+                **worker_options):
+    """Drain the frontier with `processes` worker processes. Returns the number of tasks completed.
+
+    worker_options go to run_worker. Each process opens its own Frontier and Store on the
+    same files; cache_dir gives them a page cache directory other than the default.
+
+    Notes
+    ------
+    Each process paces its requests with its own HostRateLimiter, started at 1/processes of
+    the default rates, so together they keep to one process's per-host budget. They do not share
+    what they learn: a 429 or Retry-After slows down only the process that received it, until
+    the others are throttled in turn.
+    """
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_worker_process, frontier_path, database, worker_options, cache_dir, processes)
+                   for _ in range(processes)]
+        return sum(future.result() for future in futures)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frontier', default=DEFAULT_FRONTIER)
+    parser.add_argument('--database', default=storage.DEFAULT_DATABASE)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--parser', default='html5lib', choices=hack.PARSER_BACKENDS)
+    parser.add_argument('--section', action='append', default=[], help="queue every page of a section")
+    parser.add_argument('--post', action='append', default=[], help="queue every page of a post")
+    options = parser.parse_args(argv)
+
+    with Frontier(options.frontier) as frontier:
+        for section in options.section:
+            frontier.add_section(section)
+        for post_url in options.post:
+            frontier.add_post(post_url)
+    completed = run_workers(
+        options.processes, options.frontier, options.database, concurrency=options.concurrency, parser=options.parser)
+    with Frontier(options.frontier) as frontier:
+        print("{} tasks completed. {}".format(completed, frontier.counts()))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
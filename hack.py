@@ -1,25 +1,47 @@
 import re
 import os
 import sys
-import codecs
-import logging
+import json
+import time
+import zlib
+import copy
+import random
+import sqlite3
+import hashlib
+import threading
+import queue
 
 from pathlib import Path
 from operator import itemgetter
 from itertools import filterfalse
-from collections import OrderedDict, namedtuple, Counter
+from collections import OrderedDict, namedtuple, Counter, deque
+from functools import partial, wraps
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from html import escape as escape_html
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import bs4
+from bs4 import NavigableString
 from docx import Document
 import requests
 import requests.exceptions as rqe
 import openpyxl as OP
 
 from openpyxl.styles import Alignment
+from requests.adapters import HTTPAdapter
 
-from pywebber import Ripper
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError: # only needed for the 'lxml' and 'lxml-native' parser backends
+    lxml = None
 
-logging.disable(logging.CRITICAL)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # only needed for the parquet exports
+    pa = None
 
 BASE_DIR = Path().resolve()
 OUTPUT_DIR = Path.joinpath(BASE_DIR, 'output')
@@ -27,6 +49,9 @@ if not Path.exists(OUTPUT_DIR):
     Path.mkdir(OUTPUT_DIR)
 TEST_DIR = Path.joinpath(BASE_DIR, 'test-dir')
 
+# Every url is built on BASE_URL. Point it at a local replay server (see replay.py) to crawl without the live site.
+BASE_URL = os.environ.get('NAIRALAND_BASE_URL', 'https://www.nairaland.com').rstrip('/')
+
 class Error(Exception):
     pass
 
@@ -36,24 +61,814 @@ class NonExistentNairalandUser(Error):
 class MaximumPageNotFound(Error):
     pass
 
-def new_logger(log_file_name):
-    FORMATTER = logging.Formatter("%(asctime)s:%(funcName)s:%(levelname)s\n%(message)s")
-    # console_logger = logging.StreamHandler(sys.stdout)
-    file_logger = logging.FileHandler(log_file_name)
-    file_logger.setFormatter(FORMATTER)
+class RateLimited(Error):
+    """Nairaland kept answering 429 or 503, so whether the page exists is unknown"""
+    pass
+
+DIAGNOSTICS_DIR = os.path.join(OUTPUT_DIR, 'diagnostics')
+
+class Diagnostics(object):
+    """Capture of the raw html seen by the comment parsers, for debugging the scrapers
+
+    Off by default. While it is off the parsers only pay for one attribute check:
+    call sites are written as
+
+        if DIAGNOSTICS.enabled:
+            DIAGNOSTICS.capture('channel', render)
+
+    where render is a callable (e.g. block.prettify), so nothing is rendered unless a
+    capture is actually taken.
 
-    logger = logging.getLogger(log_file_name)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_logger)
-    logger.propagate = False
-    return logger
+    Notes
+    ------
+    1. Only a `sample_rate` fraction of captures is kept.
+    2. Captures are queued and written by a background thread. When the queue is full
+       captures are dropped (and counted in .dropped) rather than slowing the parsers down.
+    3. Each channel is written to <directory>/<channel>.html, one capture per entry followed by
+       "End of file.", the format of comment-blocks/comment-block-collection.html.
+       Files are rotated at max_bytes and only backup_count old files are kept.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.dropped = 0
+        self._queue = None
+        self._writer = None
 
-PARSE_BR_element_LOGGER = new_logger('log_html_br_element.log')
-PARSE_COMMENT_BLOCK_LOGGER = new_logger('log_parse_comment_block.log')
-FORMAT_COMMENTS_LOGGER = new_logger('log_format_comments.log')
+    def __str__(self):
+        return "Diagnostics: {}".format('enabled' if self.enabled else 'disabled')
+
+    def enable(self, directory=DIAGNOSTICS_DIR, sample_rate=1.0, max_bytes=10 * 1024 * 1024, backup_count=3,
+               queue_size=10000):
+        if self.enabled:
+            self.disable()
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_captures, name='diagnostics-writer', daemon=True)
+        self._writer.start()
+        self.enabled = True
+        return self
+
+    def disable(self):
+        """Stop capturing, write out everything still queued and close the files"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._queue.put(None)
+        self._writer.join()
+        self._queue = self._writer = None
+
+    def capture(self, channel, render):
+        captures = self._queue
+        if captures is None or random.random() >= self.sample_rate:
+            return
+        try:
+            captures.put_nowait((channel, render()))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until every queued capture has been written"""
+        if self.enabled:
+            self._queue.join()
+
+    def capture_path(self, channel):
+        return os.path.join(self.directory, "{}.html".format(channel))
+
+    def _rotate(self, channel):
+        path = self.capture_path(channel)
+        for number in range(self.backup_count - 1, 0, -1):
+            older = "{}.{}".format(path, number)
+            if os.path.exists(older):
+                os.replace(older, "{}.{}".format(path, number + 1))
+        if self.backup_count > 0:
+            os.replace(path, "{}.1".format(path))
+        else:
+            os.remove(path)
+
+    def _write_captures(self):
+        files = {} # {channel : [file handle, bytes written]}
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=1.0)
+                except queue.Empty:
+                    for handle, _ in files.values():
+                        handle.flush()
+                    continue
+                try:
+                    if item is None:
+                        return
+                    channel, text = item
+                    entry = "{}End of file.\n\n".format(text).encode('utf-8')
+                    if channel in files and files[channel][1] + len(entry) > self.max_bytes:
+                        files.pop(channel)[0].close()
+                        self._rotate(channel)
+                    if channel not in files:
+                        path = self.capture_path(channel)
+                        files[channel] = [open(path, 'ab'), os.path.getsize(path) if os.path.exists(path) else 0]
+                    files[channel][0].write(entry)
+                    files[channel][1] += len(entry)
+                finally:
+                    self._queue.task_done()
+        finally:
+            for handle, _ in files.values():
+                handle.close()
+
+DIAGNOSTICS = Diagnostics()
+
+METRICS_LOG_FILE = os.path.join(OUTPUT_DIR, 'metrics.jsonl')
+
+class Metrics(object):
+    """Timers and counters for every stage of a crawl
+
+    Off by default. Like DIAGNOSTICS, call sites only pay for an attribute check while it is off:
+
+        started = time.perf_counter()
+        ...
+        if METRICS.enabled:
+            METRICS.observe('parse', time.perf_counter() - started)
+            METRICS.count('pages_parsed')
+
+    Stages timed: 'probe' (page count HEAD probes), 'fetch' (every HTTP request), 'parse'
+    (building the document), 'parse_comment_block', 'export' and 'store' (storage.Store writes).
+    Counters: 'probes', 'fetches', 'bytes', 'retries', 'cache_fresh', 'cache_revalidated',
+    'cache_downloaded', 'pages_parsed', 'comment_pages', 'comments', 'topic_pages', 'topics',
+    'rows_written'.
+
+    Notes
+    ------
+    1. summary() returns everything as a dictionary, prometheus() in the Prometheus text format.
+    2. With a log_file, enable() starts a thread appending summary() to it as a JSON line every
+       `interval` seconds; with a prometheus_file the same thread rewrites that file, for the
+       node exporter textfile collector. disable() writes one last time.
+    3. Pages parsed in parse_workers processes are not counted by the parse stages.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._reporter = None
+        self._stopped = None
+        self.reset()
+
+    def __str__(self):
+        return "Metrics: {}".format('enabled' if self.enabled else 'disabled')
+
+    def reset(self):
+        with self._lock:
+            self.counters = Counter()
+            self.timers = {} # {stage : [count, total seconds, max seconds]}
+            self.started = time.time()
+
+    def enable(self, log_file=None, interval=60.0, prometheus_file=None):
+        if self.enabled:
+            self.disable()
+        self.log_file = log_file
+        self.prometheus_file = prometheus_file
+        self.interval = interval
+        self.enabled = True
+        if log_file or prometheus_file:
+            self._stopped = threading.Event()
+            self._reporter = threading.Thread(target=self._report_periodically, name='metrics-reporter', daemon=True)
+            self._reporter.start()
+        return self
+
+    def disable(self):
+        """Stop collecting. The periodic reports are written one last time."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._reporter is not None:
+            self._stopped.set()
+            self._reporter.join()
+            self._reporter = self._stopped = None
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timer = self.timers.setdefault(stage, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def summary(self):
+        """Return {'counters' : {...}, 'timers' : {stage : {count, seconds, mean, max}}} and a few ratios"""
+        with self._lock:
+            counters = dict(self.counters)
+            timers = {stage : {'count' : count, 'seconds' : total, 'mean' : total / count if count else 0.0, 'max' : longest}
+                      for stage, (count, total, longest) in self.timers.items()}
+        cache_reads = sum(counters.get(key, 0) for key in ('cache_fresh', 'cache_revalidated', 'cache_downloaded'))
+        return {
+            'time' : time.time(),
+            'elapsed' : time.time() - self.started,
+            'counters' : counters,
+            'timers' : timers,
+            'comments_per_page' : counters.get('comments', 0) / counters['comment_pages'] if counters.get('comment_pages') else 0.0,
+            'cache_hit_rate' : (cache_reads - counters.get('cache_downloaded', 0)) / cache_reads if cache_reads else 0.0,
+        }
+
+    def prometheus(self, prefix='nairaland'):
+        """Return the counters and timers in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = []
+        for name, value in sorted(summary['counters'].items()):
+            lines.append("# TYPE {}_{}_total counter".format(prefix, name))
+            lines.append("{}_{}_total {}".format(prefix, name, value))
+        for stage, timer in sorted(summary['timers'].items()):
+            lines.append("# TYPE {}_{}_seconds summary".format(prefix, stage))
+            lines.append("{}_{}_seconds_sum {}".format(prefix, stage, timer['seconds']))
+            lines.append("{}_{}_seconds_count {}".format(prefix, stage, timer['count']))
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """Append summary() to log_file and rewrite prometheus_file"""
+        if self.log_file:
+            with open(self.log_file, 'a', encoding='utf-8') as wh:
+                wh.write(json.dumps(self.summary()) + "\n")
+        if self.prometheus_file:
+            temporary = "{}.tmp".format(self.prometheus_file)
+            with open(temporary, 'w', encoding='utf-8') as wh:
+                wh.write(self.prometheus())
+            os.replace(temporary, self.prometheus_file) # scrapers never see a half written file
+
+    def _report_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+        self.report()
+
+METRICS = Metrics()
+
+class TransportStats(object):
+    """Thread safe request counters and latencies for a Transport
+
+    Only the latest `keep` latencies are kept for the percentiles.
+    """
+    def __init__(self, keep=10000):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=keep)
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.status_codes = Counter()
+
+    def record(self, seconds, status_code=None):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.latencies.append(seconds)
+            if status_code is None:
+                self.errors += 1
+            else:
+                self.status_codes[status_code] += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def percentile(self, fraction):
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        """Return a dictionary of the counters and the p50/p99 latency in seconds"""
+        return {
+            'requests' : self.requests,
+            'retries' : self.retries,
+            'errors' : self.errors,
+            'status_codes' : dict(self.status_codes),
+            'mean' : self.total_seconds / self.requests if self.requests else 0.0,
+            'p50' : self.percentile(0.50),
+            'p99' : self.percentile(0.99),
+        }
+
+THROTTLED_STATUS_CODES = (429, 503)
+
+def retry_after_seconds(response, now=None):
+    """Seconds asked for by a response's Retry-After header (delta-seconds or an HTTP date), or None"""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+class HostBucket(object):
+    """Token bucket and AIMD state of one host. Only touched under HostRateLimiter's lock."""
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        self.blocked_until = 0.0
+        self.slow_start = True # double the rate every second until the first congestion signal
+        self.last_decrease = 0.0
+        self.latency = None # moving average
+        self.base_latency = None # lowest latency seen
+        self.throttled = 0
+        self.waited = 0.0
+
+    def __str__(self):
+        return "HostBucket: {:.1f} requests/s".format(self.rate)
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class HostRateLimiter(object):
+    """Per-host request rate limit that finds the fastest rate a host sustains
+
+    Parameters
+    -----------
+    rate : float
+        Requests per second each host starts at
+    min_rate, max_rate : float
+        Bounds of the adapted rate
+    burst : int
+        Requests a host can take at once after being idle (the size of its token bucket)
+    increase : float
+        Additive increase: requests per second added per second of responses without congestion
+    decrease : float
+        Multiplicative decrease: the rate is multiplied by this on a 429 or 503
+    latency_factor, latency_slack : float
+        Latency counts as congestion once its moving average passes
+        latency_factor * the lowest latency seen + latency_slack seconds.
+        The rate is then cut by a tenth.
+    max_retry_after : float
+        Longest Retry-After honored, in seconds
+    share : float
+        Fraction of every host's budget this limiter uses, e.g. 0.25 in each of 4 processes crawling
+        the same hosts. The rates, burst and increases are scaled by it.
+
+    Notes
+    ------
+    1. acquire(host) blocks until the host has a token. Every fetch goes through the shared
+       Transport, so every collector, thread and export shares the same per-host budget.
+    2. Each host starts in slow start: every good response adds one request per second, so the
+       rate doubles about every second until the first 429/503, timeout or latency spike.
+       After that, additive increase / multiplicative decrease keeps it just below what
+       the host tolerates.
+    3. The rate is cut at most once per round trip, so a burst of 429s from requests that were
+       already in flight counts as one signal.
+    4. A Retry-After header stops all requests to the host until it has passed.
+    """
+    def __init__(self, rate=8.0, min_rate=0.2, max_rate=100.0, burst=8, increase=1.0, decrease=0.5,
+                 latency_factor=3.0, latency_slack=0.5, max_retry_after=600.0, share=1.0):
+        self.share = share
+        self.rate = rate * share
+        self.min_rate = min_rate * share
+        self.max_rate = max_rate * share
+        self.burst = max(1, int(round(burst * share)))
+        self.increase = increase * share
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack
+        self.max_retry_after = max_retry_after
+        self.hosts = {}
+        self.clock = time.monotonic
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "HostRateLimiter: {} hosts".format(len(self.hosts))
+
+    def _bucket(self, host, now):
+        bucket = self.hosts.get(host)
+        if bucket is None:
+            bucket = self.hosts[host] = HostBucket(self.rate, self.burst, now)
+        return bucket
+
+    def acquire(self, host):
+        """Wait for a token of host. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                bucket = self._bucket(host, now)
+                bucket.refill(now)
+                if now < bucket.blocked_until:
+                    wait = bucket.blocked_until - now
+                elif bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    bucket.waited += waited
+                    break
+                else:
+                    wait = (1 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+            waited += wait
+        if METRICS.enabled and waited:
+            METRICS.observe('rate_limit_wait', waited)
+        return waited
+
+    def _decrease(self, bucket, now, factor):
+        round_trip = max(bucket.latency or 0.0, 1.0 / bucket.rate)
+        if now - bucket.last_decrease < round_trip:
+            return
+        bucket.slow_start = False
+        bucket.last_decrease = now
+        bucket.rate = max(self.min_rate, bucket.rate * factor)
+
+    def record(self, host, status_code=None, seconds=None, retry_after=None):
+        """Adapt the rate of host to a response (status_code None for a connection error or timeout)"""
+        if METRICS.enabled and status_code in THROTTLED_STATUS_CODES:
+            METRICS.count('throttled')
+        with self._lock:
+            now = self.clock()
+            bucket = self._bucket(host, now)
+            if status_code in THROTTLED_STATUS_CODES or status_code is None:
+                bucket.throttled += status_code is not None
+                self._decrease(bucket, now, self.decrease)
+                if retry_after:
+                    bucket.blocked_until = max(bucket.blocked_until, now + min(retry_after, self.max_retry_after))
+                return
+            if seconds is not None:
+                bucket.latency = seconds if bucket.latency is None else 0.8 * bucket.latency + 0.2 * seconds
+                bucket.base_latency = seconds if bucket.base_latency is None else min(bucket.base_latency, seconds)
+                if bucket.latency > self.latency_factor * bucket.base_latency + self.latency_slack:
+                    self._decrease(bucket, now, 0.9)
+                    return
+            step = self.share if bucket.slow_start else self.increase / bucket.rate
+            bucket.rate = min(self.max_rate, bucket.rate + step)
+
+    def summary(self):
+        """Return {host : {'rate', 'throttled', 'waited', 'latency'}}"""
+        with self._lock:
+            return {host : {'rate' : round(bucket.rate, 2), 'throttled' : bucket.throttled,
+                            'waited' : round(bucket.waited, 3), 'latency' : bucket.latency}
+                    for host, bucket in self.hosts.items()}
+
+class Transport(object):
+    """HTTP transport shared by every collector
+
+    Parameters
+    -----------
+    pool_size : int
+        Number of keep-alive connections kept per host. Should be at least the
+        concurrency used for range scraping.
+    timeout : tuple
+        (connect timeout, read timeout) in seconds
+    retries : int
+        Number of retries after a connection error, a timeout, a 429 or a 5xx response
+    backoff : float
+        Base delay in seconds. Retry n waits a random time between 0 and backoff * 2**n
+        (capped at max_backoff), so concurrent workers don't retry in lockstep.
+    limiter : HostRateLimiter
+        Paces the requests to each host. Default is a new HostRateLimiter(); False turns pacing off.
+
+    Notes
+    ------
+    Responses with status codes below 500, other than 429, are returned as they are. The last
+    429/5xx response is returned once the retries are used up; the last connection error is raised.
+    A Retry-After header holds back every request to that host, not only the retry.
+    """
+    def __init__(self, pool_size=20, timeout=(10.0, 30.0), retries=3, backoff=0.5, max_backoff=30.0, limiter=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = TransportStats()
+        self.limiter = HostRateLimiter() if limiter is None else limiter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __str__(self):
+        return "Transport"
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire(host)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (rqe.ConnectionError, rqe.Timeout):
+                self.stats.record(time.perf_counter() - started)
+                if self.limiter:
+                    self.limiter.record(host)
+                if attempt >= self.retries:
+                    raise
+            else:
+                seconds = time.perf_counter() - started
+                self.stats.record(seconds, response.status_code)
+                if self.limiter:
+                    self.limiter.record(host, response.status_code, seconds, retry_after_seconds(response))
+                if METRICS.enabled:
+                    METRICS.observe('fetch', seconds)
+                    METRICS.count('fetches')
+                    METRICS.count('bytes', len(response.content))
+                if (response.status_code < 500 and response.status_code != 429) or attempt >= self.retries:
+                    return response
+            self.stats.record_retry()
+            if METRICS.enabled:
+                METRICS.count('retries')
+            time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        # like requests.head: a redirect is reported as it is, not as the page it points to
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+TRANSPORT = Transport()
+
+def configure_transport(**kwargs):
+    """Replace the shared transport with one built from kwargs (see Transport)"""
+    global TRANSPORT
+    TRANSPORT.close()
+    TRANSPORT = Transport(**kwargs)
+    return TRANSPORT
+
+def configure_base_url(base_url):
+    """Crawl base_url instead of nairaland.com, e.g. a replay.ReplayServer's base_url
+
+    Collectors created afterwards, and parser processes, use the new base url.
+    The cached section map belonged to the old site and is forgotten.
+    """
+    global BASE_URL
+    BASE_URL = base_url.rstrip('/')
+    os.environ['NAIRALAND_BASE_URL'] = BASE_URL # parser processes started with spawn re-read it
+    Nairaland.site_url = BASE_URL + "/"
+    Nairaland.clear_sections_cache()
+    return BASE_URL
+
+PAGE_CACHE_DIR = os.path.join(OUTPUT_DIR, 'page_cache')
+
+# Seconds a cached page is served without asking the server. Past that the page is
+# revalidated with a conditional GET, which costs a 304 if nothing changed.
+CACHE_MAX_AGE = {
+    'section' : 5 * 60, # topics are reordered every time one is bumped
+    'user' : 15 * 60,
+    'post' : 60 * 60, # older pages of a thread almost never change
+}
+
+def cache_max_age(policy, refresh=False, max_age=None):
+    """Return the max-age for a collector.
+
+    refresh=True always revalidates (max-age 0), an explicit max_age wins over the policy.
+    max_age=float('inf') never revalidates.
+    """
+    if refresh:
+        return 0
+    if max_age is not None:
+        return max_age
+    return CACHE_MAX_AGE[policy]
+
+class PageCache(object):
+    """Content-addressed cache of raw pages with HTTP validators
+
+    Parameters
+    -----------
+    directory : str
+        Where the index and the page bodies are stored
+    max_bytes : int
+        Maximum total size of the compressed bodies. The least recently used pages are
+        evicted when it is exceeded.
+
+    Notes
+    ------
+    1. An sqlite index maps each url to the sha256 of its body plus its ETag and
+       Last-Modified headers.
+    2. Bodies are zlib-compressed and stored once per digest under objects/, so identical
+       pages fetched from different urls share storage.
+    """
+    def __init__(self, directory=PAGE_CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.objects = os.path.join(directory, 'objects')
+        self.max_bytes = max_bytes
+        self.stats = Counter() # fresh, revalidated, downloaded, evicted
+        os.makedirs(self.objects, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, digest TEXT, etag TEXT, "
+                "last_modified TEXT, validated REAL, accessed REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS bodies (digest TEXT PRIMARY KEY, size INTEGER)")
+
+    def __str__(self):
+        return "PageCache: {}".format(self.directory)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        if METRICS.enabled:
+            METRICS.count('cache_{}'.format(key))
+
+    def _body_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def lookup(self, url):
+        """Return (digest, etag, last_modified, validated) for url, or None"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT digest, etag, last_modified, validated FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def read(self, url, digest):
+        """Return the cached body of url or None if it was evicted"""
+        try:
+            with open(self._body_path(digest), 'rb') as rh:
+                body = zlib.decompress(rh.read()).decode('utf-8')
+        except (OSError, zlib.error):
+            return None
+        with self._lock, self._db:
+            self._db.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+        return body
+
+    def revalidated(self, url):
+        """Record that the server confirmed (304) that the cached copy of url is current"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("UPDATE pages SET validated = ?, accessed = ? WHERE url = ?", (now, now, url))
+
+    def store(self, url, body, etag=None, last_modified=None):
+        data = body.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        body_path = self._body_path(digest)
+        if not os.path.exists(body_path):
+            compressed = zlib.compress(data, 6)
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            temporary_path = "{}.{}.tmp".format(body_path, threading.get_ident())
+            with open(temporary_path, 'wb') as fh:
+                fh.write(compressed)
+            os.replace(temporary_path, body_path)
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO bodies VALUES (?, ?)", (digest, len(compressed)))
+
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (url, digest, etag, last_modified, now, now))
+        self.evict()
+        return digest
+
+    def size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used pages until the bodies fit in max_bytes"""
+        if self.size() <= self.max_bytes:
+            return
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+            lru = self._db.execute("SELECT url, digest FROM pages ORDER BY accessed").fetchall()
+            for url, digest in lru:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self.stats['evicted'] += 1 # already holding the lock
+                if self._db.execute("SELECT 1 FROM pages WHERE digest = ?", (digest,)).fetchone():
+                    continue # body still used by another url
+                size = self._db.execute("SELECT size FROM bodies WHERE digest = ?", (digest,)).fetchone()
+                self._db.execute("DELETE FROM bodies WHERE digest = ?", (digest,))
+                total -= size[0] if size else 0
+                try:
+                    os.remove(self._body_path(digest))
+                except OSError:
+                    pass
+
+    def fetch(self, url, max_age=0):
+        """Return the body of url, from the cache if it is fresh enough.
+
+        A cached page older than max_age seconds is revalidated with If-None-Match /
+        If-Modified-Since. Uncached pages are downloaded. Raises RateLimited if the server
+        still answers 429/503 after the transport's retries.
+        """
+        cached = self.lookup(url)
+        headers = {}
+        if cached is not None:
+            digest, etag, last_modified, validated = cached
+            if time.time() - validated < max_age:
+                body = self.read(url, digest)
+                if body is not None:
+                    self._count('fresh')
+                    return body
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = TRANSPORT.get(url, headers=headers)
+        if response.status_code in THROTTLED_STATUS_CODES: # not the page; never scrape or cache it
+            raise RateLimited("{} still answered {} after {} retries".format(url, response.status_code, TRANSPORT.retries))
+        if response.status_code == 304 and cached is not None:
+            body = self.read(url, cached[0])
+            if body is not None:
+                self.revalidated(url)
+                self._count('revalidated')
+                return body
+            response = TRANSPORT.get(url) # body was evicted under us; fetch unconditionally
+
+        body = response.text
+        self._count('downloaded')
+        if response.status_code == 200:
+            self.store(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return body
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+PAGE_CACHE = None
+
+def configure_page_cache(**kwargs):
+    """Replace the shared page cache with one built from kwargs (see PageCache)"""
+    global PAGE_CACHE
+    if PAGE_CACHE is not None:
+        PAGE_CACHE.close()
+    PAGE_CACHE = PageCache(**kwargs)
+    return PAGE_CACHE
+
+def page_cache():
+    """Return the shared page cache, creating it on first use"""
+    if PAGE_CACHE is None:
+        configure_page_cache()
+    return PAGE_CACHE
+
+NATIVE_PARSER = 'lxml-native'
+PARSER_BACKENDS = ('html5lib', 'lxml', 'html.parser', NATIVE_PARSER)
+
+def make_soup(page, parser='html5lib'):
+    """Parse a html string with one of PARSER_BACKENDS
+
+    Notes
+    ------
+    'html5lib', 'lxml' and 'html.parser' are BeautifulSoup tree builders and return a BeautifulSoup.
+    NATIVE_PARSER skips BeautifulSoup altogether and returns the root lxml.html element; it is
+    several times faster. format_comments, parse_comment_block and the page scrapers accept either.
+    """
+    if parser not in PARSER_BACKENDS:
+        raise ValueError("Unknown parser {}. Choose one of {}".format(parser, PARSER_BACKENDS))
+    if parser == NATIVE_PARSER:
+        if lxml is None:
+            raise ImportError("The {} parser backend needs lxml. pip install lxml".format(NATIVE_PARSER))
+        started = time.perf_counter()
+        document = lxml.html.document_fromstring(page)
+    else:
+        started = time.perf_counter()
+        document = bs4.BeautifulSoup(page, parser)
+    if METRICS.enabled:
+        METRICS.observe('parse', time.perf_counter() - started)
+        METRICS.count('pages_parsed')
+    return document
+
+def is_native(document):
+    """Return True if document was built by the NATIVE_PARSER backend"""
+    return lxml is not None and isinstance(document, lxml.html.HtmlElement)
+
+def rip_page(url, parser='html5lib', max_age=0):
+    """Return the parsed document of a page, read through the shared page cache
+
+    Parameters
+    -----------
+    str
+        Page url
+    parser : str
+        One of PARSER_BACKENDS
+    max_age : float
+        Seconds a cached copy is used without asking the server. 0 always revalidates.
+    """
+    return make_soup(page_cache().fetch(url, max_age=max_age), parser)
 
 def check_if_url_exists_and_is_valid(url):
-    r = requests.head(url)
+    """True if url answers 200, False if it does not. Raises RateLimited instead of guessing on a 429/503."""
+    r = TRANSPORT.head(url)
+    if r.status_code in THROTTLED_STATUS_CODES:
+        raise RateLimited("{} still answered {} after {} retries".format(url, r.status_code, TRANSPORT.retries))
     return r.status_code == 200
 
 def unique_everseen(iterable, key=None):
@@ -95,8 +910,8 @@ def get_left_right_of_html_br_element(br_element):
     p_sibling = br_element.previous_sibling
     n_sibling = br_element.next_sibling
 
-    PARSE_BR_element_LOGGER.debug("previous sibling\n{}".format(p_sibling))
-    PARSE_BR_element_LOGGER.debug("next sibling\n{}".format(n_sibling))
+    if DIAGNOSTICS.enabled:
+        DIAGNOSTICS.capture('br_element', lambda: "previous sibling\n{}\nnext sibling\n{}\n".format(p_sibling, n_sibling))
 
     return_value = [None, None]
     try:
@@ -129,6 +944,7 @@ def join_br_tuples(list_of_tuples):
     unique_everseen removes duplicates.
     This is needed in cases where a next_sibling and a
     previous_sibling point to the same string.
+    format_comments no longer uses it; see comment_paragraphs.
     """
 #     remove_nones = [[filter(lambda x: x is not None, each)] for each in list_of_tuples]
 
@@ -149,33 +965,133 @@ def join_br_tuples(list_of_tuples):
     phrase_collection = [phrase.strip().strip("\n:") for each in remove_nones for phrase in each]
     return "\n".join(unique_everseen(phrase_collection))
 
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+def collapse_whitespace_string(string):
+    """Collapse a whitespace-only string to a single newline or space.
+
+    BeautifulSoup's lxml and html.parser tree builders do this as they build the tree,
+    html5lib does not. Doing it for every backend makes their text identical.
+    """
+    if string.strip(ASCII_SPACES):
+        return string
+    return '\n' if '\n' in string else ' '
+
+def tag_text(tag):
+    """Return tag.text with whitespace-only strings collapsed"""
+    return "".join(collapse_whitespace_string(string) for string in tag.strings)
+
+# Elements that start a new paragraph, as they would in a browser. <br> ends one.
+BLOCK_ELEMENTS = frozenset([
+    'address', 'blockquote', 'center', 'dd', 'div', 'dl', 'dt', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'li', 'ol', 'p', 'pre', 'table', 'td', 'th', 'tr', 'ul'])
+SKIPPED_ELEMENTS = frozenset(['script', 'style'])
+WHITESPACE_RUN = re.compile('[{}]+'.format(ASCII_SPACES))
+COLON_AND_SPACES = ':' + ASCII_SPACES
+
+def comment_paragraphs(comment_block, removed=()):
+    """Return the paragraphs of a comment block, in one walk over it
+
+    Parameters
+    -----------
+    comment_block
+        BeautifulSoup tag, or lxml.html element from the NATIVE_PARSER backend
+    removed : set
+        lxml elements to leave out, as if they had been decomposed
+
+    Returns
+    --------
+    list
+        Non-empty paragraphs. Text is gathered node by node, so inline markup (<b>, <a>,
+        emoticon <img>s) no longer splits or drops a paragraph. Runs of whitespace are collapsed
+        to a space, and each paragraph is stripped of surrounding whitespace and colons.
+
+    Notes
+    ------
+    Replaces the sibling lookups of get_left_right_of_html_br_element and join_br_tuples,
+    which only kept paragraphs made of a single string and removed repeated paragraphs.
+    """
+    paragraphs = []
+    line = []
+    append = line.append
+
+    def end_paragraph():
+        if line:
+            paragraph = (line[0] if len(line) == 1 else "".join(line)).strip()
+            if '  ' in paragraph or '\n' in paragraph or '\t' in paragraph or '\r' in paragraph or '\x0c' in paragraph:
+                paragraph = WHITESPACE_RUN.sub(' ', paragraph)
+            paragraph = paragraph.strip(COLON_AND_SPACES)
+            if paragraph:
+                paragraphs.append(paragraph)
+            line.clear()
+
+    def walk_soup(tag):
+        for child in tag.contents:
+            name = child.name
+            if name is None: # a string
+                if type(child) is NavigableString: # not comments, doctypes or script text
+                    append(child)
+            elif name == 'br':
+                end_paragraph()
+            elif name in BLOCK_ELEMENTS:
+                end_paragraph()
+                walk_soup(child)
+                end_paragraph()
+            elif name not in SKIPPED_ELEMENTS:
+                walk_soup(child)
+
+    def walk_native(element):
+        if element.text is not None:
+            append(element.text)
+        for child in element:
+            if child not in removed:
+                name = child.tag
+                if name == 'br':
+                    end_paragraph()
+                elif name in BLOCK_ELEMENTS:
+                    end_paragraph()
+                    walk_native(child)
+                    end_paragraph()
+                elif isinstance(name, str) and name not in SKIPPED_ELEMENTS: # lxml comments have a function for tag
+                    walk_native(child)
+            if child.tail is not None:
+                append(child.tail)
+
+    if is_native(comment_block):
+        walk_native(comment_block)
+    else:
+        walk_soup(comment_block)
+    end_paragraph()
+    return paragraphs
+
+def quote_paragraphs(blockquote, commenter, removed=()):
+    """Paragraphs of a blockquote without its leading "<commenter>:" attribution"""
+    paragraphs = comment_paragraphs(blockquote, removed)
+    if paragraphs and paragraphs[0] == WHITESPACE_RUN.sub(' ', commenter).strip(COLON_AND_SPACES):
+        del paragraphs[0]
+    return paragraphs
+
 def format_comments(bs4_comment_block_object):
     """Format a comment block into proper paragraphs
 
     Parameters
     ------------
     BeautifulSoup
-        BeautifulSoup object of comment block
+        BeautifulSoup object of comment block. A lxml.html element from the
+        NATIVE_PARSER backend is also accepted.
 
     Returns
     --------
     str
         A properly paragraphed string
     """
+    if is_native(bs4_comment_block_object):
+        return _native_format_comments(bs4_comment_block_object)
 
-    FORMAT_COMMENTS_LOGGER.debug(bs4_comment_block_object.prettify())
-
-    comment = []
-    br_elements = bs4_comment_block_object.find_all('br')
-
-    if br_elements == []:
-        return bs4_comment_block_object.text
-    for el in br_elements:
-        content = get_left_right_of_html_br_element(el) # returns a tuple
-        comment.append(content)
+    if DIAGNOSTICS.enabled:
+        DIAGNOSTICS.capture('format_comments', bs4_comment_block_object.prettify)
 
-    return_string = join_br_tuples(comment)
-    return return_string
+    return "\n".join(comment_paragraphs(bs4_comment_block_object))
 
 def parse_comment_block(bs4_comment_block_object):
     """Return quoted string.
@@ -195,23 +1111,16 @@ def parse_comment_block(bs4_comment_block_object):
     Notes
     ------
     Every comment block must be parsed with this function.
-    This function also has a side effect of producing a properly formatted html of all comments it encounters.
+    With DIAGNOSTICS enabled, the comment blocks it parses are captured to the 'comment_blocks' channel.
+    A lxml.html element from the NATIVE_PARSER backend is also accepted.
     """
+    if is_native(bs4_comment_block_object):
+        return _native_parse_comment_block(bs4_comment_block_object)
 
-    PARSE_COMMENT_BLOCK_LOGGER.debug(bs4_comment_block_object.prettify())
-
-    save_dir = os.path.join(BASE_DIR, "comment-blocks")
-    if os.path.exists(save_dir) is False:
-        os.mkdir(save_dir)
-
-    # Side effect
-    save = os.path.join(save_dir, "comment-block-collection.html")
-    with codecs.open(save, 'a+', encoding='utf-8') as f:
-        f.write(bs4_comment_block_object.prettify())
-        f.write("End of file.\n\n")
+    if DIAGNOSTICS.enabled:
+        DIAGNOSTICS.capture('comment_blocks', bs4_comment_block_object.prettify)
 
     collected_quotes = OrderedDict()
-    output_named_tuple = namedtuple('ParsedComment', ['focus_user_comment', 'quotes_ordered_dict'])
     blockquotes = bs4_comment_block_object.find_all('blockquote')
 
     # collect comments from other users which were quoted by the focus user
@@ -220,17 +1129,444 @@ def parse_comment_block(bs4_comment_block_object):
     else:
         for blockquote in blockquotes:
             try:
-                commenter = blockquote.find('b').text
+                commenter = tag_text(blockquote.find('b'))
             except AttributeError:
                 commenter = 'Anonymous'
 
-            collected_quotes[commenter] = format_comments(blockquote).strip().strip("\n:")
+            collected_quotes[commenter] = "\n".join(quote_paragraphs(blockquote, commenter))
             blockquote.decompose() # remove the block from the tree
 
     # after decomposing all the <blockquote> elements, whatever remains belong to the focus user
-    output_named_tuple.focus_user_comment = format_comments(bs4_comment_block_object).strip().strip("\n:")
-    output_named_tuple.quotes_ordered_dict = collected_quotes
-    return output_named_tuple
+    focus_user_comment = format_comments(bs4_comment_block_object).strip().strip("\n:")
+    return ParsedComment(focus_user_comment, collected_quotes)
+
+# Records are plain tuples: no per-instance dict, immutable, picklable, and one class each for the whole run.
+ParsedComment = namedtuple('ParsedComment', ['focus_user_comment', 'quotes_ordered_dict'])
+Comment = namedtuple('Comment', ['topic', 'parsed_comment'])
+Topic = namedtuple('Topic', ['poster', 'title', 'url', 'comments', 'views', 'last_commenter', 'other_meta'])
+
+def parse_count(text):
+    """'1,234' -> 1234. Text that is not a count is returned stripped."""
+    text = text.strip()
+    digits = text.replace(',', '')
+    return int(digits) if digits.isdigit() else text
+
+# lxml-native backend.
+# These mirror format_comments and parse_comment_block node for node. lxml keeps text in
+# .text/.tail instead of separate string nodes, so _native_child_nodes rebuilds the
+# BeautifulSoup view of an element's children: strings and elements in document order.
+# Blockquotes are never removed from the lxml tree (that would merge the text around them);
+# they are skipped through the `removed` set instead, exactly as decompose() leaves them.
+
+def _native_is_element(node):
+    return not isinstance(node, str) and isinstance(node.tag, str)
+
+def _native_child_nodes(element, removed=()):
+    if element.text is not None:
+        yield element.text
+    for child in element:
+        if child not in removed:
+            yield child
+        if child.tail is not None:
+            yield child.tail
+
+def _native_strings(element, removed=()):
+    """Equivalent of BeautifulSoup's .strings; comments are left out"""
+    for node in _native_child_nodes(element, removed):
+        if isinstance(node, str):
+            yield node
+        elif _native_is_element(node):
+            yield from _native_strings(node, removed)
+
+def _native_text(element, removed=()):
+    return "".join(collapse_whitespace_string(string) for string in _native_strings(element, removed))
+
+def _native_iter_tags(element, tag, removed=()):
+    """Descendants of element named tag in document order, skipping removed subtrees"""
+    for child in element:
+        if child in removed or not _native_is_element(child):
+            continue
+        if child.tag == tag:
+            yield child
+        yield from _native_iter_tags(child, tag, removed)
+
+def _native_format_comments(element, removed=()):
+    return "\n".join(comment_paragraphs(element, removed))
+
+def _native_parse_comment_block(element):
+    if DIAGNOSTICS.enabled:
+        DIAGNOSTICS.capture('comment_blocks', lambda: lxml.html.tostring(element, encoding='unicode', pretty_print=True))
+
+    collected_quotes = OrderedDict()
+    removed = set()
+    for blockquote in _native_iter_tags(element, 'blockquote'):
+        bold = next(_native_iter_tags(blockquote, 'b'), None)
+        commenter = 'Anonymous' if bold is None else _native_text(bold)
+        collected_quotes[commenter] = "\n".join(quote_paragraphs(blockquote, commenter))
+        removed.add(blockquote)
+
+    focus_user_comment = _native_format_comments(element, removed).strip().strip("\n:")
+    return ParsedComment(focus_user_comment, collected_quotes)
+
+# Tree queries shared by every parser backend. The page scrapers below are written once
+# against these; BeautifulSoup documents get the usual find/find_all, lxml documents get
+# the equivalent compiled XPath.
+
+_NATIVE_QUERIES = {}
+
+def _native_query(tag, attrs):
+    key = (tag, tuple(sorted(attrs.items())))
+    query = _NATIVE_QUERIES.get(key)
+    if query is None:
+        predicates = []
+        for name, value in sorted(attrs.items()):
+            name = name.rstrip('_') # class_
+            if value is True:
+                predicates.append("[@{}]".format(name))
+            elif value is False:
+                predicates.append("[not(@{})]".format(name))
+            elif name == 'class': # like BeautifulSoup: one of the classes or the whole attribute
+                predicates.append(
+                    "[normalize-space(@class)='{0}' or contains(concat(' ', normalize-space(@class), ' '), ' {0} ')]".format(value))
+            else:
+                predicates.append("[@{}='{}']".format(name, value))
+        query = _NATIVE_QUERIES[key] = etree.XPath("descendant::{}{}".format(tag, "".join(predicates)))
+    return query
+
+def _find_all(node, tag, **attrs):
+    if is_native(node):
+        return _native_query(tag, attrs)(node)
+    return node.find_all(tag, **attrs)
+
+def _find(node, tag, **attrs):
+    if is_native(node):
+        found = _native_query(tag, attrs)(node)
+        return found[0] if found else None
+    return node.find(tag, **attrs)
+
+def _text(node):
+    if is_native(node):
+        return _native_text(node)
+    return tag_text(node)
+
+def _decompose(node):
+    if is_native(node):
+        node.getparent().remove(node)
+    else:
+        node.decompose()
+
+def _parent(node):
+    return node.getparent() if is_native(node) else node.parent
+
+def scrap_post_page(soup):
+    """Return comments and commenters on a single post page
+
+    Parameters
+    -----------
+    soup
+        Document of the post page, from any of PARSER_BACKENDS
+
+    Returns
+    --------
+    OrderedDict
+        Dictionary of {commenter : comments}
+    """
+
+    # User posts are contained in a table with summary='posts' attribute.
+    # Each commenter name is contained inside a <tr>
+    # Each comment is contained in <tr> just below the name of the commenter
+
+    # Handle supposed anomaly by decomposing all such occurrences from the tree
+    for each in _find_all(soup, 'td', class_="l pu pd"):
+        _decompose(_parent(each))
+    rows = _find_all(_find(soup, 'table', summary='posts'), 'tr')
+
+    output_ordered_dict = OrderedDict()
+    for i in range(0, len(rows), 2):
+
+        topic_classes = ['bold l pu', 'bold l pu nocopy'] # topic div should be either of these classes
+        for class_ in topic_classes:
+            try:
+                username = _text(_find(_find(rows[i], 'td', class_=class_), 'a', href=True, class_=True)).strip()
+                break
+            except AttributeError:
+                pass
+            username = "Nobody" # set to nobody after exhausting all options. We cannot use finally in this case
+
+        comment_classes = ['l w pd', 'l w pd nocopy'] # comment div should be either of these classes
+        for class_ in comment_classes:
+            try:
+                comment_block = _find(_find(rows[i+1], 'td', id=True, class_=class_), 'div', class_='narrow')
+                break
+            except AttributeError:
+                pass
+        started = time.perf_counter()
+        parsed_block = parse_comment_block(comment_block)
+        if METRICS.enabled:
+            METRICS.observe('parse_comment_block', time.perf_counter() - started)
+
+        # If a username already exists (i.e. a user has already commented), append an integer to the
+        # present one to differentiate them.
+        if username not in output_ordered_dict:
+            output_ordered_dict[username] = parsed_block
+        else:
+            username = "{}**{}".format(username, i)
+            output_ordered_dict[username] = parsed_block
+    if METRICS.enabled:
+        METRICS.count('comment_pages')
+        METRICS.count('comments', len(output_ordered_dict))
+    return output_ordered_dict
+
+def scrap_user_page(soup):
+    """Return comments and commenters on a single page of a user's comment history
+
+    Parameters
+    -----------
+    soup
+        Document of the comment history page, from any of PARSER_BACKENDS
+
+    Returns
+    --------
+    OrderedDict
+        Dictionary of {section : namedtuple}
+    """
+
+    # User comments are contained in a table with neither summary nor id attribute.
+    # Then follows the rows containing the section, topic, and username and the comment itself just below it
+    for each in _find_all(soup, 'td', class_="l pu pd"):
+        _decompose(_parent(each)) # remove these trees as they are unneeded
+    rows = _find_all(_find(soup, 'table', id=False, summary=False), 'tr')
+
+    output_ordered_dict = OrderedDict()
+    for i in range(0, len(rows), 2): # go to every second row
+
+        topic_classes = ['bold l pu', 'bold l pu nocopy']
+        for class_ in topic_classes:
+            try:
+                section_topic = _find_all(_find(rows[i], 'td', class_=class_), 'a', href=True, class_=False)
+            except AttributeError:
+                pass
+
+        comment_classes = ['l w pd', 'l w pd nocopy']
+        for class_ in comment_classes:
+            try:
+                comment_block = _find(_find(rows[i+1], 'td', class_=class_), 'div', class_='narrow')
+            except AttributeError:
+                pass
+
+        section = _text(section_topic[0]).strip()
+        topic = _text(section_topic[1]).lstrip("Re:").strip()
+
+        started = time.perf_counter()
+        parsed_block = parse_comment_block(comment_block)
+        if METRICS.enabled:
+            METRICS.observe('parse_comment_block', time.perf_counter() - started)
+
+        Comm = Comment(topic, parsed_block)
+
+        if section not in output_ordered_dict:
+            output_ordered_dict[section] = Comm
+        else:
+            section = "{}**{}".format(section, i)
+            output_ordered_dict[section] = Comm
+    if METRICS.enabled:
+        METRICS.count('comment_pages')
+        METRICS.count('comments', len(output_ordered_dict))
+    return output_ordered_dict
+
+def scrap_topics_page(soup):
+    """
+    Yield all topics on a section page
+
+    Parameters
+    -----------
+    soup
+        Document of the section page, from any of PARSER_BACKENDS
+
+    Yields
+    -------
+    Topic
+        'poster', 'title', 'url', 'comments' and 'views' (ints), 'last_commenter', 'other_meta'
+    """
+    post_table = _find(soup, 'table', id=False, summary=False)
+
+    topics = 0
+    for td in _find_all(post_table, 'td', id=True):
+        title_component = _find(_find(td, 'b'), 'a', href=True)
+        title = _text(title_component).strip()
+        url = BASE_URL + title_component.get('href').strip()
+
+        # there is a maximum of 7 <b> tags
+        meta_component = _find_all(_find(td, 'span', class_='s'), 'b')
+
+        yield Topic(
+            poster=_text(meta_component[0]).strip(),
+            title=title,
+            url=url,
+            comments=parse_count(_text(meta_component[1])), # count includes the post itself
+            views=parse_count(_text(meta_component[2])),
+            last_commenter=_text(meta_component[-1]).strip(),
+            # Join all other meta as a single string
+            other_meta=" ".join([_text(each).strip() for each in meta_component[3:-1]]))
+        topics += 1
+    if METRICS.enabled:
+        METRICS.count('topic_pages')
+        METRICS.count('topics', topics)
+
+TOPIC_ID = re.compile(r"^/(\d+)(?:/|$)")
+
+def topic_id(url):
+    """Numeric id of a topic url ('.../4523456/some-title' is 4523456), None if it has none
+
+    The id stays the same when a topic is renamed, so its url slug changes.
+    """
+    match = TOPIC_ID.match(urlsplit(url).path)
+    return int(match.group(1)) if match else None
+
+class TopicSet(object):
+    """Ids of the topics seen by a crawl, in memory. Right for crawls of up to a few hundred thousand topics."""
+    def __init__(self):
+        self.ids = set()
+
+    def __str__(self):
+        return "TopicSet: {} topics".format(len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, topic_id):
+        return topic_id in self.ids
+
+    def add(self, topic_id):
+        """Record topic_id. Returns True if it had not been seen before."""
+        if topic_id in self.ids:
+            return False
+        self.ids.add(topic_id)
+        return True
+
+# number of bits set in each byte value, for counting the ids in a TopicBitmap
+BITS_SET = bytes(bin(byte).count('1') for byte in range(256))
+
+class TopicBitmap(object):
+    """Ids of the topics seen by a crawl, one bit per id, optionally kept in a file
+
+    Parameters
+    -----------
+    path : str
+        File the bitmap is loaded from and saved to by save() and close(). None keeps it in memory only.
+
+    Notes
+    ------
+    Topic ids are numbered in order of creation, so they are dense: every topic nairaland has
+    ever had fits in about a megabyte. That is exact where a Bloom filter of the same size would
+    drop some unseen topics as false positives, and a fraction of the memory of a TopicSet
+    of a few million ids.
+    Kept in a file, it carries over between crawls: a later crawl only yields topics no earlier one did.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.bits = bytearray()
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as rh:
+                self.bits = bytearray(rh.read())
+        self.count = sum(self.bits.translate(BITS_SET))
+
+    def __str__(self):
+        return "TopicBitmap: {} topics in {} bytes".format(self.count, len(self.bits))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, topic_id):
+        byte = topic_id >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (topic_id & 7)))
+
+    def add(self, topic_id):
+        """Record topic_id. Returns True if it had not been seen before."""
+        byte, bit = topic_id >> 3, 1 << (topic_id & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits)))) # at least double
+        if self.bits[byte] & bit:
+            return False
+        self.bits[byte] |= bit
+        self.count += 1
+        return True
+
+    def save(self):
+        if self.path is None:
+            return
+        temporary = "{}.tmp".format(self.path)
+        with open(temporary, 'wb') as wh:
+            wh.write(self.bits)
+        os.replace(temporary, self.path) # a crash never leaves half a bitmap
+
+    def close(self):
+        self.save()
+
+def dedupe_topic_pages(pages, seen):
+    """Yield each of pages without the topics seen on an earlier one
+
+    Parameters
+    -----------
+    pages : iterable
+        Pages of topics, as scrap_topics_for_range_of_pages yields them
+    seen : TopicSet or TopicBitmap
+        Ids already seen. The ids of the topics yielded are added to it.
+
+    Yields
+    -------
+    list
+        Topics of each page, in order. A page keeps its place even when all its topics were seen,
+        and a page dead-lettered by a Checkpoint stays None.
+
+    Notes
+    ------
+    Topics are bumped to the front of a section when they get a comment, pushing the others
+    one place back, so walking a busy section meets some topics twice.
+    Topics without a numeric id are never dropped.
+    """
+    for page in pages:
+        if page is None:
+            yield None
+            continue
+        unique, duplicates = [], 0
+        for topic in page:
+            number = topic_id(topic.url)
+            if number is None or seen.add(number):
+                unique.append(topic)
+            else:
+                duplicates += 1
+        if METRICS.enabled and duplicates:
+            METRICS.count('duplicate_topics', duplicates)
+        yield unique
+
+def parse_page(kind, page, parser='html5lib'):
+    """Parse the raw html of one page into plain, picklable rows
+
+    Parameters
+    -----------
+    kind : str
+        'post', 'user' or 'section' (the cache_policy of the collector)
+    page : str
+        Raw html
+    parser : str
+        One of PARSER_BACKENDS
+
+    Returns
+    --------
+    list
+        The page's rows in the form of the collector's _page_rows(). This is the function
+        run by the parser processes of a parse_workers pipeline.
+    """
+    collector = PAGE_KINDS[kind]
+    scrap = {'post' : scrap_post_page, 'user' : scrap_user_page, 'section' : scrap_topics_page}[kind]
+    return collector._page_rows(scrap(make_soup(page, parser)))
 
 def sort_dictionary_by_value(dictionary_to_sort):
     """
@@ -247,17 +1583,421 @@ def sort_dictionary_by_value(dictionary_to_sort):
 
 assert sort_dictionary_by_value({5:'goat', 10:'cat', 1:'dog'}) == [5, 1, 10]
 
+def ordered_concurrent_map(func, iterable, concurrency=1):
+    """Yield func(item) for every item in iterable, in input order.
+
+    Parameters
+    -----------
+    func : callable
+        Function applied to each item. Usually fetches and scraps one page.
+    iterable : iterable
+        Items (page urls) to map over
+    concurrency : int
+        Maximum number of calls to func in flight at any time. 1 (the default)
+        runs everything sequentially in the calling thread.
+
+    Notes
+    ------
+    Results are yielded in the same order as the input even when later items
+    finish first. At most `concurrency` items are scheduled ahead of the one
+    being waited on, so the caller can stop early without the whole range
+    being fetched.
+    """
+    if concurrency is None or concurrency <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending: # caller stopped early; drop what has not started
+                future.cancel()
+
+CHECKPOINT_DIR = os.path.join(OUTPUT_DIR, 'checkpoints')
+
+class Checkpoint(object):
+    """Durable progress record of a range crawl
+
+    Parameters
+    -----------
+    name : str
+        Name of the crawl. Progress is kept in <directory>/<name>.jsonl
+    max_attempts : int
+        Times a page is tried before it goes to the dead-letter list
+    retry_dead_letters : bool
+        Try dead-lettered pages again instead of skipping them
+
+    Notes
+    ------
+    1. Every finished page is appended (and fsync'ed) as one json line holding its url,
+       page index and extracted rows. Nothing is lost when the crawl dies.
+    2. Passing the same checkpoint to a new crawl over the range resumes it: finished pages
+       are yielded from the checkpoint without being fetched again.
+    3. A page that still raises after max_attempts is recorded in .dead_letters as
+       {url : (page, error)} and yielded as None instead of ending the crawl.
+    """
+    def __init__(self, name, directory=CHECKPOINT_DIR, max_attempts=3, retry_dead_letters=False):
+        self.path = os.path.join(directory, "{}.jsonl".format(name))
+        self.max_attempts = max_attempts
+        self.retry_dead_letters = retry_dead_letters
+        self.completed = {} # {url : (page, rows)}
+        self.dead_letters = {} # {url : (page, error)}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __str__(self):
+        return "Checkpoint: {}".format(self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as rh:
+            for line in rh:
+                try:
+                    entry = json.loads(line)
+                except ValueError: # a line cut short by a crash
+                    continue
+                if 'rows' in entry:
+                    self.completed[entry['url']] = (entry['page'], entry['rows'])
+                    self.dead_letters.pop(entry['url'], None)
+                else:
+                    self.dead_letters[entry['url']] = (entry['page'], entry['error'])
+
+    def _append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(entry) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def record(self, url, page, rows):
+        self._append({'url' : url, 'page' : page, 'rows' : rows})
+        self.completed[url] = (page, rows)
+        self.dead_letters.pop(url, None)
+
+    def record_failure(self, url, page, error):
+        self._append({'url' : url, 'page' : page, 'error' : error})
+        self.dead_letters[url] = (page, error)
+
+    def completed_pages(self):
+        return sorted(page for page, _ in self.completed.values())
+
+    def crawl(self, pages, scrap_page, to_rows, from_rows, concurrency=1):
+        """Yield the scraped page for every (page, url) in pages, skipping finished and dead pages
+
+        scrap_page(url) scraps one page, to_rows(page) turns it into json-able rows and
+        from_rows(rows) turns stored rows back into a page. A dead-lettered page is yielded as None,
+        so callers numbering the pages with enumerate keep the right number for every later page.
+        """
+        def attempt(page_and_url):
+            page, url = page_and_url
+            if url in self.completed:
+                return None, None
+            if url in self.dead_letters and not self.retry_dead_letters:
+                return None, None
+            error = None
+            for _ in range(self.max_attempts):
+                try:
+                    return scrap_page(url), None
+                except Exception as exception: # any failure on one page must not end the crawl
+                    error = "{}: {}".format(type(exception).__name__, exception)
+            return None, error
+
+        pages = list(pages)
+        for (page, url), (scraped_page, error) in zip(pages, ordered_concurrent_map(attempt, pages, concurrency)):
+            if url in self.completed:
+                yield from_rows(self.completed[url][1])
+            elif scraped_page is not None:
+                self.record(url, page, to_rows(scraped_page))
+                yield scraped_page
+            else:
+                if error is not None:
+                    self.record_failure(url, page, error)
+                yield None
+
+class PageCounter(object):
+    """Discover how many pages a paginated nairaland url has
+
+    Parameters
+    -----------
+    exists : callable
+        exists(url) returns True if the page at url exists
+    fetch_text : callable
+        fetch_text(url) returns the text of page 0, to be searched for `marker`. Optional.
+    marker : str
+        Regex whose first group is the number of pages, e.g. the "(of N pages)" marker
+        on section pages. Optional.
+    ttl : int
+        Number of seconds a discovered count is reused for the same url
+    max_pages : int
+        Probing stops here. A url whose page max_pages still exists raises MaximumPageNotFound,
+        as a host that answers every page (e.g. by redirecting) would otherwise be probed forever.
+
+    Notes
+    ------
+    1. If page 0 does not exist the count is 0.
+    2. If the marker is found on page 0, its number is returned without any probing.
+    3. Otherwise pages 1, 2, 4, 8... are probed until one is missing, then the last
+       existing page is found by binary search between the last two probes.
+       A 1,000 page thread costs about 20 requests instead of 1,000.
+       Given a count known from an earlier crawl, pages known, known + 1, known + 3... are probed
+       instead, so a thread that gained a page or two costs a few requests and page 0 is not fetched.
+    4. Counts are cached per url in a process-wide cache shared by all collectors.
+    """
+
+    _cache = {} # {url : (count, time discovered)}
+
+    def __init__(self, exists, fetch_text=None, marker=None, ttl=600, max_pages=2 ** 20):
+        self.exists = exists
+        self.fetch_text = fetch_text
+        self.marker = marker
+        self.ttl = ttl
+        self.max_pages = max_pages
+
+    def __str__(self):
+        return "PageCounter"
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
+
+    def page_exists(self, url, page):
+        started = time.perf_counter()
+        exists = self.exists("{}/{}".format(url, page))
+        if METRICS.enabled:
+            METRICS.observe('probe', time.perf_counter() - started)
+            METRICS.count('probes')
+        return exists
+
+    def count(self, url, refresh=False, known_pages=0):
+        """Return the number of pages at url, i.e. one more than the last zero-indexed page.
+        known_pages is a count from an earlier crawl to probe onwards from."""
+        cached = self._cache.get(url)
+        if cached is not None and not refresh and time.time() - cached[1] < self.ttl:
+            return cached[0]
+
+        number_of_pages = self._discover(url, known_pages)
+        if number_of_pages: # a missing url is not remembered; it may only be missing for now
+            self._cache[url] = (number_of_pages, time.time())
+        return number_of_pages
+
+    def _discover(self, url, known_pages=0):
+        # a thread can lose pages to deletions, so the known count is only used if its last page is still there
+        base = known_pages - 1 if known_pages > 1 and self.page_exists(url, known_pages - 1) else 0
+        if not base:
+            if not self.page_exists(url, 0):
+                return 0
+            if self.marker and self.fetch_text:
+                found = re.search(self.marker, self.fetch_text(url))
+                if found:
+                    return int(found.group(1))
+
+        # exponential probing: lower always exists, upper never does
+        lower, upper = base, base + 1
+        while self.page_exists(url, upper):
+            if upper >= self.max_pages:
+                raise MaximumPageNotFound("{} still has pages after {}".format(url, upper))
+            lower, upper = upper, min(base + 2 * (upper - base), self.max_pages)
+
+        # binary search for the last page in (lower, upper)
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if self.page_exists(url, middle):
+                lower = middle
+            else:
+                upper = middle
+        return lower + 1
+
+PAGE_COUNT_MARKER = r"\(of\s*(\d+)\s*pages\)"
+
+CommenterActivity = namedtuple('CommenterActivity', ['comments', 'first_seen', 'last_seen', 'quotes_made', 'quoted_by'])
+
+class CommenterStats(object):
+    """Commenter aggregates of a post, built in one pass over its pages
+
+    Feed it pages of PostCollector.scrap_comments_for_range_of_post_pages with add_page(page number, page).
+    A page that is added again (e.g. the last page of a thread, which fills up) replaces its earlier
+    version, so new pages can be added as the thread grows.
+
+    Attributes
+    -----------
+    counts : Counter
+        {username : number of comments}
+    quotes : Counter
+        {(quoting user, quoted user) : number of times}, the edges of the quote graph
+    pages : set
+        Page numbers added so far
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.quotes = Counter()
+        self._appearances = {} # {username : [first (page, position), last (page, position)]}
+        self._pages = {} # {page number : [(username, position, (quoted users...))]}
+
+    def __str__(self):
+        return "CommenterStats: {} pages, {} commenters".format(len(self._pages), len(self.counts))
+
+    @property
+    def pages(self):
+        return set(self._pages)
+
+    @property
+    def last_page(self):
+        return max(self._pages) if self._pages else None
+
+    def add_page(self, page_number, page):
+        """Add {commenter : ParsedComment} of page page_number"""
+        comments = [(username.split("**")[0], position, tuple(quoted.strip() for quoted in parsed.quotes_ordered_dict))
+                    for position, (username, parsed) in enumerate(page.items())]
+        replaced = self._pages.pop(page_number, None)
+        if replaced is not None:
+            self._subtract(replaced)
+
+        self._pages[page_number] = comments
+        for username, position, quoted_users in comments:
+            self.counts[username] += 1
+            for quoted in quoted_users:
+                self.quotes[username, quoted] += 1
+            seen = (page_number, position)
+            appearances = self._appearances.get(username)
+            if appearances is None:
+                self._appearances[username] = [seen, seen]
+            else:
+                appearances[0] = min(appearances[0], seen)
+                appearances[1] = max(appearances[1], seen)
+
+        if replaced is not None: # users that were only on the old version of the page may have gone
+            self._recount_appearances(set(username for username, _, _ in replaced))
+
+    def _subtract(self, comments):
+        for username, _, quoted_users in comments:
+            self.counts[username] -= 1
+            for quoted in quoted_users:
+                self.quotes[username, quoted] -= 1
+        self.counts += Counter() # drops users and edges whose count fell to 0
+        self.quotes += Counter()
+
+    def _recount_appearances(self, usernames):
+        for username in usernames:
+            self._appearances.pop(username, None)
+        for page_number, comments in self._pages.items():
+            for username, position, _ in comments:
+                if username in usernames:
+                    seen = (page_number, position)
+                    appearances = self._appearances.setdefault(username, [seen, seen])
+                    appearances[0] = min(appearances[0], seen)
+                    appearances[1] = max(appearances[1], seen)
+
+    def activity(self):
+        """Return {username : CommenterActivity}, busiest commenters first
+
+        first_seen and last_seen are (page, position on page). quotes_made and quoted_by are the
+        user's out and in degree in the quote graph: the number of distinct users they quoted and
+        that quoted them.
+        """
+        quotes_made, quoted_by = Counter(), Counter()
+        for quoting, quoted in self.quotes:
+            quotes_made[quoting] += 1
+            quoted_by[quoted] += 1
+        return OrderedDict(
+            (username, CommenterActivity(
+                count, tuple(self._appearances[username][0]), tuple(self._appearances[username][1]),
+                quotes_made[username], quoted_by[username]))
+            for username, count in self.counts.most_common())
+
+SECTIONS_CACHE_FILE = os.path.join(OUTPUT_DIR, 'sections.json')
+SECTIONS_TTL = 24 * 60 * 60 # sections rarely change; re-read the homepage once a day
+
 class Nairaland(object):
     """The base nairaland class
     sections are contained in a table with class='boards'
+
+    Notes
+    ------
+    Creating a collector makes no network calls. The section map is only downloaded the
+    first time `.sections` is read, then kept for SECTIONS_TTL seconds in memory (shared by
+    all collectors in the process) and in SECTIONS_CACHE_FILE (shared across runs).
     """
+    site_url = BASE_URL + "/"
+
+    _sections = None # (sections dictionary, time fetched)
+    _sections_lock = threading.Lock()
+
     def __init__(self):
-        self.site_url = "https://www.nairaland.com/"
+        self.site_url = Nairaland.site_url
+
+    def _scrap_range(self, base_url, start, stop, scrap_page, concurrency=1, checkpoint=None, parse_workers=0):
+        """Yield scrap_page(url) for pages start to stop of base_url, in page order
+
+        With parse_workers, scrap_page is replaced by a pipeline: threads download the raw
+        pages and hand them to a pool of parse_workers processes which run parse_page.
+        """
+        if parse_workers:
+            # enough download threads to keep every parser process busy
+            download_threads = max(concurrency or 1, 2 * parse_workers)
+            with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+                scrap_page = partial(self._scrap_page_in_process, executor)
+                yield from self._scrap_range(base_url, start, stop, scrap_page, download_threads, checkpoint)
+            return
+
+        page_urls = [(page, "{}/{}".format(base_url, page)) for page in range(start, stop + 1)]
+        if checkpoint is None:
+            yield from ordered_concurrent_map(lambda page_url: scrap_page(page_url[1]), page_urls, concurrency)
+        else:
+            yield from checkpoint.crawl(page_urls, scrap_page, self._page_rows, self._page_from_rows, concurrency)
+
+    def _scrap_page_in_process(self, executor, page_url):
+        page = page_cache().fetch(page_url, max_age=self.max_age)
+        rows = executor.submit(parse_page, self.cache_policy, page, self.parser).result()
+        return self._page_from_rows(rows)
+
+    @property
+    def sections(self):
+        """Dictionary of {section : section url}"""
+        with Nairaland._sections_lock:
+            if not self._fresh(Nairaland._sections):
+                Nairaland._sections = self._read_sections_cache_file()
+            if not self._fresh(Nairaland._sections):
+                Nairaland._sections = (self._fetch_sections(), time.time())
+                self._write_sections_cache_file(Nairaland._sections)
+            return Nairaland._sections[0]
+
+    @classmethod
+    def clear_sections_cache(cls):
+        cls._sections = None
+        if os.path.exists(SECTIONS_CACHE_FILE):
+            os.remove(SECTIONS_CACHE_FILE)
+
+    @staticmethod
+    def _fresh(cached_sections):
+        return cached_sections is not None and time.time() - cached_sections[1] < SECTIONS_TTL
+
+    @staticmethod
+    def _read_sections_cache_file():
+        try:
+            with open(SECTIONS_CACHE_FILE, 'r', encoding='utf-8') as rh:
+                cached = json.load(rh)
+            return (cached['sections'], cached['fetched'])
+        except (OSError, ValueError, KeyError):
+            return None
 
-        soup = Ripper(self.site_url, parser='html5lib', refresh=True).soup
+    @staticmethod
+    def _write_sections_cache_file(cached_sections):
+        with open(SECTIONS_CACHE_FILE, 'w', encoding='utf-8') as fh:
+            json.dump({'sections' : cached_sections[0], 'fetched' : cached_sections[1]}, fh)
+
+    def _fetch_sections(self):
+        soup = rip_page(self.site_url, parser='html5lib', max_age=0)
         boards = soup.find("table", class_="boards")
         links = boards.find_all('a')
-        self.sections = {link.text : link.get('href') for each in links}
+        return {link.text : link.get('href') for link in links}
 
     def __str__(self):
         return "Nairaland base class"
@@ -270,38 +2010,43 @@ class PostCollector(Nairaland):
     ----------
     str
         Post url
+    refresh : bool
+        Revalidate every cached page with the server
+    max_age : float
+        Seconds cached pages are used without revalidation. Default is CACHE_MAX_AGE['post']
+    parser : str
+        One of PARSER_BACKENDS. Default is 'html5lib'
     """
 
     def __str__(self):
         return "PostCollector: {}".format(self.post_url)
 
-    def __init__(self, post_url, refresh=True):
+    cache_policy = 'post'
+
+    def __init__(self, post_url, refresh=False, max_age=None, parser='html5lib'):
         super().__init__()
-        self.save_path = os.path.join(OUTPUT_DIR, 'page_rips_post')
         self.post_url = post_url # Page (0) of the post
-        self.refresh = refresh
+        self.max_age = cache_max_age(self.cache_policy, refresh, max_age)
+        self.parser = parser
         self.title = self.post_url.split('/')[-1]
 
-        if not os.path.exists(self.save_path):
-            os.mkdir(self.save_path)
+    def max_page(self, refresh=False, known_pages=0):
+        """Returns the maximum number of pages of comments, starting from a zero index.
+        refresh recounts instead of reusing a count discovered in the last few minutes,
+        probing onwards from known_pages if an earlier crawl counted them."""
+        counter = PageCounter(
+            self._check_if_url_exists_and_is_valid, fetch_text=self._page_text, marker=PAGE_COUNT_MARKER)
+        return counter.count(self.post_url, refresh=refresh, known_pages=known_pages)
 
-    def max_page(self):
-        """Returns the maximum number of pages of comments, starting from a zero index."""
-        stop = 0
-        while True:
-            if self._check_if_url_exists_and_is_valid("{}/{}".format(self.post_url, stop)): # check if next url exists
-                stop += 1
-            else:
-                break
-        return stop
+    def _page_text(self, url):
+        return rip_page(url, parser='html5lib', max_age=0).text
 
     @staticmethod
-    def _check_if_url_exists_and_is_valid(url): # ConnectionError happens here
-        r = requests.head(url)
-        return r.status_code == 200
+    def _check_if_url_exists_and_is_valid(url): # ConnectionError and RateLimited happen here
+        return check_if_url_exists_and_is_valid(url)
 
     def get_title(self):
-        soup = Ripper(self.post_url, parser='html5lib', save_path=self.save_path, refresh=self.refresh).soup
+        soup = rip_page(self.post_url, parser='html5lib', max_age=self.max_age)
         return soup.find_all('h2')[0].text
 
     def _scrap_comment_for_single_page(self, page_url):
@@ -313,71 +2058,80 @@ class PostCollector(Nairaland):
             Dictionary of {commenter : comments}
         """
 
-        # User posts are contained in a table with summary='posts' attribute.
-        # Each commenter name is contained inside a <tr>
-        # Each comment is contained in <tr> just below the name of the commenter
-        soup = Ripper(page_url, parser='html5lib', save_path=self.save_path, refresh=self.refresh).soup
+        soup = rip_page(page_url, parser=self.parser, max_age=self.max_age)
+        return scrap_post_page(soup)
 
-        # Handle supposed anomaly by decomposing all such occurrences from the tree
-        for each in soup.find_all('td', class_="l pu pd"):
-            each.parent.decompose()
-        rows = soup.find('table', summary='posts').find_all('tr')
+    def scrap_comments_for_range_of_post_pages(self, start=0, stop=1, _all_pages=False, concurrency=1, checkpoint=None,
+                                               parse_workers=0):
+        """Get contents for a range of pages from start to stop
 
-        output_ordered_dict = OrderedDict()
-        for i in range(0, len(rows), 2):
+        Pages are fetched `concurrency` at a time but always yielded in page order.
+        With a Checkpoint, finished pages are skipped on resume and failing pages are dead-lettered
+        and yielded as None.
+        With parse_workers, pages are parsed in that many processes while threads download.
+        """
+        if _all_pages: # since we're starting from a zero index, we have to subtract 1 from self.max_page()
+            stop = self.max_page() - 1
+        yield from self._scrap_range(
+            self.post_url, start, stop, self._scrap_comment_for_single_page, concurrency, checkpoint, parse_workers)
 
-            topic_classes = ['bold l pu', 'bold l pu nocopy'] # topic div should be either of these classes
-            for class_ in topic_classes:
-                try:
-                    username = rows[i].find('td', class_=class_).find('a', href=True, class_=True).text.strip()
-                    break
-                except AttributeError:
-                    pass
-                username = "Nobody" # set to nobody after exhausting all options. We cannot use finally in this case
+    @staticmethod
+    def _page_rows(page):
+        return [[username, parsed.focus_user_comment, list(parsed.quotes_ordered_dict.items())]
+                for username, parsed in page.items()]
 
-            comment_classes = ['l w pd', 'l w pd nocopy'] # comment div should be either of these classes
-            for class_ in comment_classes:
-                try:
-                    comment_block = rows[i+1].find('td', id=True, class_=class_).find('div', class_='narrow')
-                    break
-                except AttributeError:
-                    pass
-            parsed_block = parse_comment_block(comment_block)
+    @staticmethod
+    def _page_from_rows(rows):
+        return OrderedDict(
+            (username, ParsedComment(focus_user_comment, OrderedDict(quotes)))
+            for username, focus_user_comment, quotes in rows)
 
-            # If a username already exists (i.e. a user has already commented), append an integer to the
-            # present one to differentiate them.
-            if username not in output_ordered_dict:
-                output_ordered_dict[username] = parsed_block
-            else:
-                username = "{}**{}".format(username, i)
-                output_ordered_dict[username] = parsed_block
-        return output_ordered_dict
+    def commenter_stats(self, update=False, concurrency=1):
+        """Return the CommenterStats of the post, scraping it in one pass the first time
 
-    def scrap_comments_for_range_of_post_pages(self, start=0, stop=1, _all_pages=False):
-        """Get contents for a range of pages from start to stop"""
-        if _all_pages: # since we're starting from a zero index, we have to subtract 1 from self.max_page()
-            stop = self.max_page() - 1
-        while start <= stop:
-            next_url = "{}/{}".format(self.post_url, start)
-            next_page = self._scrap_comment_for_single_page(next_url)
-            yield next_page
-            start += 1
+        Parameters
+        -----------
+        update : bool
+            Bring cached stats up to date: the last page seen is fetched again, bypassing the page cache,
+            along with any page after it
+        concurrency : int
+            Number of pages fetched at the same time
+
+        Notes
+        ------
+        The stats are cached on the collector, so all_commenters, unique_commenters and
+        commenters_activity_summary share one scrape of the thread.
+        """
+        stats = getattr(self, '_commenter_stats', None)
+        if stats is not None and not update:
+            return stats
+        if stats is None:
+            stats = CommenterStats()
+        start = stats.last_page or 0
+        stop = self.max_page(refresh=update) - 1
+        collector = self
+        if update:
+            # the last page seen may have gained comments since, so its cached copy is revalidated
+            collector = copy.copy(self)
+            collector.max_age = 0
+        pages = collector.scrap_comments_for_range_of_post_pages(start, stop, concurrency=concurrency)
+        for page_number, page in enumerate(pages, start=start):
+            stats.add_page(page_number, page)
+        self._commenter_stats = stats
+        return stats
 
     def all_commenters(self):
         """Return list of all commenters on a post"""
         # Remember we user ** to separate a username and the number of times it is appearing on a post
-        return sorted([key.split("**")[0] for each in list(self.scrap_comments_for_range_of_post_pages(stop=self.max_page())) for key, value in each.items()])
+        return sorted(self.commenter_stats().counts.elements())
 
     def unique_commenters(self):
         """Return list of unique commenters on a post"""
-        return sorted(set(self.all_commenters()))
+        return sorted(self.commenter_stats().counts)
 
     def commenters_activity_summary(self):
-        """Return count of number of times a user commented on a post
-        To be finished..."""
-        return sort_dictionary_by_value(
-            Counter(self.all_commenters())
-        )
+        """Return commenters sorted by the number of times they commented on the post, busiest first"""
+        return sort_dictionary_by_value(self.commenter_stats().counts)
 
 class UserCommentHistory(Nairaland):
     """
@@ -387,18 +2141,30 @@ class UserCommentHistory(Nairaland):
     ------------
     user_name : str
         User's name to crawl. Default is 'seun'
+    refresh : bool
+        Revalidate every cached page with the server
+    max_age : float
+        Seconds cached pages are used without revalidation. Default is CACHE_MAX_AGE['user']
+    parser : str
+        One of PARSER_BACKENDS. Default is 'html5lib'
+
+    Raises
+    -------
+    NonExistentNairalandUser
+        The profile page is missing
+    RateLimited
+        Nairaland would not say, answering 429/503 to every retry
     """
 
     def __str__(self):
         return "UserCommentHistory: {}".format(self.user_post_page)
 
-    def __init__(self, nairaland_username, refresh=True):
+    cache_policy = 'user'
+
+    def __init__(self, nairaland_username, refresh=False, max_age=None, parser='html5lib'):
         super().__init__()
-        self.refresh = refresh
-        BASE_URL = 'https://www.nairaland.com'
-        self.save_path = os.path.join(OUTPUT_DIR, 'page_rips_user')
-        if not os.path.exists(self.save_path):
-            os.mkdir(self.save_path)
+        self.max_age = cache_max_age(self.cache_policy, refresh, max_age)
+        self.parser = parser
 
         p = '{}/{}'.format(BASE_URL, nairaland_username.lower())
         if self._check_if_url_exists_and_is_valid(p):
@@ -409,8 +2175,7 @@ class UserCommentHistory(Nairaland):
 
     @staticmethod
     def _check_if_url_exists_and_is_valid(url):
-        r = requests.head(url)
-        return r.status_code == 200
+        return check_if_url_exists_and_is_valid(url)
 
     def user_profile(self):
         """Returns a dictionary of the user's profile"""
@@ -418,12 +2183,13 @@ class UserCommentHistory(Nairaland):
 
     def max_pages(self):
         """Return number of pages of comment for user"""
-        soup = Ripper(self.user_post_page, save_path=self.save_path, refresh=True).soup
         pattern = r"\<b\>\s*(\d+)\s*\<\/b\>" # pattern to search for number of pages of comments
-        try:
-            return int(re.search(pattern, str(soup)).group(1))
-        except AttributeError:
+        fetch_text = lambda url: str(rip_page(url, parser='html.parser', max_age=0))
+        counter = PageCounter(self._check_if_url_exists_and_is_valid, fetch_text=fetch_text, marker=pattern)
+        number_of_pages = counter.count(self.user_post_page)
+        if number_of_pages == 0:
             raise MaximumPageNotFound("Could not find max page")
+        return number_of_pages
 
     def _scrap_comment_for_single_page(self, page_url):
         """Return comments and commenters on a single post page
@@ -434,56 +2200,34 @@ class UserCommentHistory(Nairaland):
             Dictionary of {section : namedtuple}
         """
 
-        # User comments are contained in a table with neither summary nor id attribute.
-        # Then follows the rows containing the section, topic, and username and the comment itself just below it
-        soup = Ripper(page_url, parser='html5lib', save_path=self.save_path, refresh=self.refresh).soup
-
-        for each in soup.find_all('td', class_="l pu pd"):
-            each.parent.decompose() # remove these trees as they are unneeded
-        rows = soup.find('table', id=False, summary=False).find_all('tr')
-
-        output_ordered_dict = OrderedDict()
-        for i in range(0, len(rows), 2): # go to every second row
-
-            topic_classes = ['bold l pu', 'bold l pu nocopy']
-            for class_ in topic_classes:
-                try:
-                    section_topic = rows[i].find('td', class_=class_).find_all('a', href=True, class_=False)
-                except AttributeError:
-                    pass
-
-            comment_classes = ['l w pd', 'l w pd nocopy']
-            for class_ in comment_classes:
-                try:
-                    comment_block = rows[i+1].find('td', class_=class_).find('div', class_='narrow')
-                except AttributeError:
-                    pass
-
-            section = section_topic[0].text.strip()
-            topic = section_topic[1].text.lstrip("Re:").strip()
+        soup = rip_page(page_url, parser=self.parser, max_age=self.max_age)
+        return scrap_user_page(soup)
 
-            parsed_block = parse_comment_block(comment_block)
+    def scrap_comments_for_range_of_user_pages(self, start=0, stop=0, _all_pages=False, concurrency=1, checkpoint=None,
+                                               parse_workers=0):
+        """Get contents for a range of pages from start to stop
 
-            Comm = namedtuple('Comment', ['topic', 'parsed_comment'])
-            Comm.topic = topic
-            Comm.parsed_comment = parsed_block
-
-            if section not in output_ordered_dict:
-                output_ordered_dict[section] = Comm
-            else:
-                section = "{}**{}".format(section, i)
-                output_ordered_dict[section] = Comm
-        return output_ordered_dict
-
-    def scrap_comments_for_range_of_user_pages(self, start=0, stop=0, _all_pages=False):
-        """Get contents for a range of pages from start to stop """
+        Pages are fetched `concurrency` at a time but always yielded in page order.
+        With a Checkpoint, finished pages are skipped on resume and failing pages are dead-lettered
+        and yielded as None.
+        With parse_workers, pages are parsed in that many processes while threads download.
+        """
         if _all_pages:
             stop = self.max_pages() - 1
-        while start <= stop:
-            next_url = "{}/{}".format(self.user_post_page, start)
-            next_page = self._scrap_comment_for_single_page(next_url)
-            yield next_page
-            start += 1
+        yield from self._scrap_range(
+            self.user_post_page, start, stop, self._scrap_comment_for_single_page, concurrency, checkpoint, parse_workers)
+
+    @staticmethod
+    def _page_rows(page):
+        return [[section, comment.topic, comment.parsed_comment.focus_user_comment,
+                 list(comment.parsed_comment.quotes_ordered_dict.items())]
+                for section, comment in page.items()]
+
+    @staticmethod
+    def _page_from_rows(rows):
+        return OrderedDict(
+            (section, Comment(topic, ParsedComment(focus_user_comment, OrderedDict(quotes))))
+            for section, topic, focus_user_comment, quotes in rows)
 
 class TopicCollector(Nairaland):
     """
@@ -493,6 +2237,12 @@ class TopicCollector(Nairaland):
     -----------
     section : str
         Default section is politics
+    refresh : bool
+        Revalidate every cached page with the server
+    max_age : float
+        Seconds cached pages are used without revalidation. Default is CACHE_MAX_AGE['section']
+    parser : str
+        One of PARSER_BACKENDS. Default is 'html5lib'
 
     Notes
     ------
@@ -502,13 +2252,14 @@ class TopicCollector(Nairaland):
     def __str__(self):
         return "TopicCollector: {}".format(self.post_url)
 
-    def __init__(self, section='politics'):
+    cache_policy = 'section'
+
+    def __init__(self, section='politics', refresh=False, max_age=None, parser='html5lib'):
         super().__init__()
-        self.save_path = os.path.join(OUTPUT_DIR, 'page_rips_section')
         self.section = section
-        self.post_url = 'https://www.nairaland.com/{}'.format(self.section)
-        if os.path.exists(self.save_path) is False:
-            os.mkdir(self.save_path)
+        self.max_age = cache_max_age(self.cache_policy, refresh, max_age)
+        self.parser = parser
+        self.post_url = '{}/{}'.format(BASE_URL, self.section)
 
     def max_pages(self):
         """Return number of pages in this section
@@ -518,11 +2269,11 @@ class TopicCollector(Nairaland):
         int
             The number of pages in this section
         """
-        soup = Ripper(self.post_url, parser='html5lib', save_path=self.save_path, refresh=True).soup
-        number = re.search(r"\(of\s*(\d+)\s*pages\)", soup.text).group(1)
-        return int(number)
+        fetch_text = lambda url: rip_page(url, parser='html5lib', max_age=0).text
+        counter = PageCounter(check_if_url_exists_and_is_valid, fetch_text=fetch_text, marker=PAGE_COUNT_MARKER)
+        return counter.count(self.post_url)
 
-    def _scrap_topics_for_a_single_page(self, page_url, refresh=True):
+    def _scrap_topics_for_a_single_page(self, page_url, refresh=False):
         """
         Yield all topics on a page
 
@@ -531,48 +2282,313 @@ class TopicCollector(Nairaland):
         namedtuple
             collection of 'poster', 'title', 'url', 'number of comments'
         """
-        soup = Ripper(page_url, parser='html5lib', save_path=self.save_path, refresh=True).soup
-        post_table = soup.find('table', id=False, summary=False)
-
-        for td in post_table.find_all('td', id=True):
-            Post = namedtuple('Post', ['poster', 'title', 'url', 'comments', 'views', 'last_commenter', 'other_meta'])
-
-            title_component = td.find('b').find('a', href=True)
-            Post.title = title_component.text.strip()
-            Post.url = 'http://www.nairaland.com' + title_component.get('href').strip()
-
-            # there is a maximum of 7 <b> tags
-            meta_component = td.find('span', class_='s').find_all('b')
-
-            Post.poster = meta_component[0].text.strip()
-            Post.comments = meta_component[1].text.strip() # count includes the post itself
-            # Join all other meta as a single string
-            Post.views = meta_component[2].text.strip()
-            Post.last_commenter = meta_component[-1].text.strip()
-            Post.other_meta = " ".join([each.text.strip() for each in meta_component[3:-1]])
-            yield Post
+        soup = rip_page(page_url, parser=self.parser, max_age=0 if refresh else self.max_age)
+        yield from scrap_topics_page(soup)
 
-    def scrap_topics_for_range_of_pages(self, start=0, stop=0, _all_pages=False):
+    def scrap_topics_for_range_of_pages(self, start=0, stop=0, _all_pages=False, concurrency=1, checkpoint=None,
+                                        parse_workers=0, seen=None):
         """Yield all topics between 'start' and 'end' for a section
 
         Parameters
         -----------
         int
             Start and end values of section
+        concurrency : int
+            Number of pages fetched at the same time. Pages are still yielded in page order.
+        checkpoint : Checkpoint
+            Records finished pages so an interrupted crawl can be resumed, and dead-letters
+            pages that keep failing instead of ending the crawl. Those are yielded as None. Optional.
+        parse_workers : int
+            Parse pages in that many processes while threads download them. 0 parses in this process.
+        seen : TopicSet or TopicBitmap
+            Leave out topics already in it, and add the rest (see dedupe_topic_pages). Optional.
 
         Yields
         -------
-        tuple
-            same yields as for titles()
+        iterable
+            Topics on each page, same items as _scrap_topics_for_a_single_page().
+            A lazy generator when scraping one page at a time in this process, otherwise an already fetched list.
         """
+        if seen is not None:
+            pages = self.scrap_topics_for_range_of_pages(start, stop, _all_pages, concurrency, checkpoint, parse_workers)
+            yield from dedupe_topic_pages(pages, seen)
+            return
         if _all_pages:
             stop = self.max_pages() - 1
-        while start <= stop:
-            next_url = '{}/{}'.format(self.post_url, start)
-            yield self._scrap_topics_for_a_single_page(next_url)
-            start += 1
+        if (concurrency is None or concurrency <= 1) and checkpoint is None and not parse_workers:
+            for page in range(start, stop + 1):
+                yield self._scrap_topics_for_a_single_page('{}/{}'.format(self.post_url, page))
+            return
+        fetch_page = lambda page_url: list(self._scrap_topics_for_a_single_page(page_url))
+        yield from self._scrap_range(self.post_url, start, stop, fetch_page, concurrency, checkpoint, parse_workers)
+
+    def resweep(self, start, stop, seen, passes=1, **range_options):
+        """Fetch the pages between start and stop again and yield the topics that slid past the crawl
+
+        While a crawl walks a busy section, topics bumped to the front move every topic behind them
+        one place forward, so some move onto a page the crawl had already passed. Each pass
+        revalidates every page with the server and stops early once a pass finds nothing new.
+
+        Parameters
+        -----------
+        seen : TopicSet or TopicBitmap
+            The one the crawl used. New topics are added to it.
+        passes : int
+            Most passes over the range
+        range_options
+            Passed on to scrap_topics_for_range_of_pages, e.g. concurrency
+
+        Yields
+        -------
+        tuple
+            (page, list of topics missing from seen) for every page that had any
+        """
+        fresh = copy.copy(self)
+        fresh.max_age = 0
+        for _ in range(passes):
+            found = 0
+            pages = fresh.scrap_topics_for_range_of_pages(start, stop, seen=seen, **range_options)
+            for page, topics in enumerate(pages, start=start):
+                if topics: # None for a dead-lettered page
+                    found += len(topics)
+                    yield page, topics
+            if not found:
+                return
+
+    @staticmethod
+    def _page_rows(page):
+        return [list(topic) for topic in page]
 
-def export_user_comments_to_html(username=None, max_page=5):
+    @staticmethod
+    def _page_from_rows(rows):
+        return [Topic(*row) for row in rows]
+
+PAGE_KINDS = {collector.cache_policy : collector for collector in (PostCollector, UserCommentHistory, TopicCollector)}
+
+def instrumented_export(export):
+    """Time an export_* function as the 'export' stage of METRICS. The time includes the scraping it drives."""
+    @wraps(export)
+    def timed_export(*args, **kwargs):
+        if not METRICS.enabled:
+            return export(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return export(*args, **kwargs)
+        finally:
+            METRICS.observe('export', time.perf_counter() - started)
+    return timed_export
+
+# Html exports.
+# The scaffold is kept in a few constant templates so each export only renders its rows.
+# Every value from nairaland is escaped before it is interpolated.
+
+HTML_HEAD = """<html xmlns='http://www.w3.org/1999/xhtml'>
+\t<head>
+\t\t<link rel='stylesheet' href='https://stackpath.bootstrapcdn.com/bootswatch/4.1.3/superhero/bootstrap.min.css'>
+\t\t<meta name='viewport' content='width=device-width, initial-scale=1, shrink-to-fit=no'>
+\t\t<script src='https://stackpath.bootstrapcdn.com/bootstrap/4.1.1/js/bootstrap.min.js' integrity='sha384-smHYKdLADwkXOn1EmN1qk/HfnUcbVRZyYmZ4qpPea6sjB/pTJ0euyQp0Mk8ck+5T' crossorigin='anonymous' async></script>
+<script defer src='https://use.fontawesome.com/releases/v5.0.6/js/all.js' async></script>
+<script src='https://code.jquery.com/jquery-3.3.1.min.js' integrity='sha256-FgpCb/KJQlLNfOu91ta32o/NMZxltwRo8QtmkMRdAu8=' crossorigin='anonymous'></script>
+\t\t<title>{title} - Hack Nairaland</title>
+\t</head>
+\t<body style='margin-bottom:5rem;'>
+\t\t<nav class='navbar navbar-expand-lg navbar-dark bg-primary' id='topNav'>
+\t\t<a class='navbar-brand' style='font-size:36px;'>Hack Nairaland</a>
+\t\t<button type='button' class='navbar-toggler my-toggler' data-toggle='collapse' data-target='.navcontent'>
+\t\t<span class='sr-only'>Toggle navigation</span>
+\t\t<span class='navbar-toggler-icon'></span>
+\t\t</button>
+\t\t<div class='collapse navbar-collapse navcontent'>
+\t\t<ul class='nav navbar-nav lefthand-navigation'>
+\t\t<li class='nav-item'><a class='nav-link' href='{home}' title='Home'>Home</a></li>
+\t\t</ul>
+\t\t</div>
+\t\t</nav>
+\t\t<div class='container'>
+<h1>{heading}</h1>
+\t\t<nav aria-label='breadcrumb'>
+\t\t<ol class='breadcrumb'>
+\t\t<li class='breadcrumb-item'><a href='{home}'>Home</a></li>
+\t\t<li class='breadcrumb-item'>{breadcrumb}</li>
+\t\t</ol>
+\t\t</nav>
+"""
+
+HTML_FOOT = """\t\t\t<p class='float-right'><a href='#topNav' class='smooth-scroll'>Back to top</a></p>
+\t\t\t<p class='float-left'>Template by <a href='https://bootswatch.com/superhero/' target='_blank'>Bootswatch</a></p>
+\t\t</div>
+<script>
+$(document).ready(function(){
+\t $('.smooth-scroll').on('click', function(event) {
+\t\tif (this.hash !== '') {
+\t\t\tevent.preventDefault();
+\t\t\tvar hash = this.hash;
+\t\t\t$('html, body').animate({
+\t\t\t scrollTop: $(hash).offset().top
+\t\t\t}, 800, function(){
+\t\t\t window.location.hash = hash;
+\t\t\t});
+\t\t}
+\t});
+});
+</script>
+\t</body>
+</html>"""
+
+HTML_PAGE_START = ("\t\t\t<div id='js-scroll-target{0}'>\n"
+                   "\t\t\t<h2><a href='#js-scroll-target{1}' class='smooth-scroll'>Page {0}</a></h2>\n").format
+HTML_PAGE_END = "\t\t\t</div>\n"
+HTML_DIVIDER = "\t\t\t<div class='dropdown-divider' style='border:1px solid white;'></div>\n"
+HTML_PART_LINKS = "\t\t\t<ul class='pagination'>{}</ul>\n".format
+HTML_PART_LINK = "<li class='page-item'><a class='page-link' href='{}'>{}</a></li>".format
+
+HTML_TOPIC = (
+    "\t\t\t<h3><a href='{2}' target='_blank'>{1}</a></h3>\n"
+    "\t\t\t<h4>Posted by <a href='{7}/{0}/topics' target='_blank'>{0}</a></h4>\n"
+    "\t\t\t<h5>{3} <i class='fas fa-comment'></i> | {4} <i class='fas fa-eye'></i> | "
+    "Last commenter: {5} | Others: {6}</h5>\n" + HTML_DIVIDER).format # the fields of a Topic, then BASE_URL
+HTML_USER_COMMENT = (
+    "\t\t\t<h3>Section: {section}</h3>\n"
+    "\t\t\t<h4>Subject: {topic}</h4>\n"
+    "\t\t\t<p class='text-success'>{comment}</p>\n").format
+HTML_QUOTE = ("\t\t\t\t<h4 class='text-info'>{}</h4>\n"
+              "\t\t\t\t<p class='text-primary'><em>{}</em></p>\n").format
+
+def _escape_fields(*fields):
+    return [escape_html(str(field)) for field in fields]
+
+def topic_html(topic):
+    """Html of one topic of a section page"""
+    return HTML_TOPIC(*_escape_fields(
+        topic.poster, topic.title, topic.url, topic.comments, topic.views, topic.last_commenter, topic.other_meta, BASE_URL))
+
+def user_comment_html(section, topic_plus_comment):
+    """Html of one comment of a user's comment history, with the comments it quotes"""
+    parsed_comment = topic_plus_comment.parsed_comment
+    quotes = parsed_comment.quotes_ordered_dict
+    fields = _escape_fields(
+        section.split('**')[0], # remove the ** separating section and index
+        topic_plus_comment.topic, parsed_comment.focus_user_comment, *[part for quote in quotes.items() for part in quote])
+    parts = [HTML_USER_COMMENT(section=fields[0], topic=fields[1], comment=fields[2])]
+    for position in range(3, len(fields), 2):
+        parts.append(HTML_QUOTE(fields[position], fields[position + 1]))
+    parts.append(HTML_DIVIDER)
+    return "".join(parts)
+
+class HtmlWriter(object):
+    """Stream pages of rendered rows into one html file, or several linked files
+
+    Parameters
+    -----------
+    destination_file : str
+        Path of the export. When it is split, the index page goes here and the parts
+        next to it as <name>_part_<n>.html.
+    title : str
+        Plain text <title>
+    heading : str
+        Html of the <h1>. Escape what goes into it.
+    breadcrumb : str
+        Plain text of the breadcrumb
+    pages_per_file : int
+        Start a new part after this many pages. None writes a single file.
+    buffer_size : int
+        Bytes buffered before each write to disk
+
+    Notes
+    ------
+    Each page's rows are joined and written at once through a buffered file, so memory holds
+    one page at a time however many pages are exported.
+    """
+    def __init__(self, destination_file, title, heading, breadcrumb, pages_per_file=None, buffer_size=1 << 16):
+        self.destination_file = destination_file
+        self.title = title
+        self.heading = heading
+        self.breadcrumb = breadcrumb
+        self.pages_per_file = pages_per_file
+        self.buffer_size = buffer_size
+        self.pages = 0
+        self.parts = [] # (file name, first page, last page, rows) of every part written so far
+        self._file = None
+        self._part_rows = 0
+
+    def __str__(self):
+        return "HtmlWriter: {}".format(self.destination_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _part_name(self, number):
+        stem, extension = os.path.splitext(os.path.basename(self.destination_file))
+        return "{}_part_{}{}".format(stem, number, extension)
+
+    def _head(self, title, home='#'):
+        return HTML_HEAD.format(
+            title=escape_html(title), home=escape_html(home), heading=self.heading, breadcrumb=escape_html(self.breadcrumb))
+
+    def _open_part(self):
+        if self.pages_per_file:
+            name = self._part_name(len(self.parts) + 1)
+            path = os.path.join(os.path.dirname(self.destination_file), name)
+            title = "{} (part {})".format(self.title, len(self.parts) + 1)
+            home = os.path.basename(self.destination_file)
+        else:
+            name, path, title, home = os.path.basename(self.destination_file), self.destination_file, self.title, '#'
+        self.parts.append([name, self.pages + 1, self.pages + 1, 0])
+        self._file = open(path, 'w', encoding='utf-8', buffering=self.buffer_size)
+        self._file.write(self._head(title, home))
+
+    def _close_part(self, has_next):
+        if self.pages_per_file:
+            number = len(self.parts)
+            links = [HTML_PART_LINK(escape_html(os.path.basename(self.destination_file)), "Index")]
+            if number > 1:
+                links.insert(0, HTML_PART_LINK(escape_html(self._part_name(number - 1)), "Previous"))
+            if has_next:
+                links.append(HTML_PART_LINK(escape_html(self._part_name(number + 1)), "Next"))
+            self._file.write(HTML_PART_LINKS("".join(links)))
+        self._file.write(HTML_FOOT)
+        self._file.close()
+        self._file = None
+
+    def add_page(self, rows):
+        """Write a page of rendered rows (an iterable of html strings)"""
+        if self._file is not None and self.pages_per_file:
+            _, first_page, last_page, _ = self.parts[-1]
+            if last_page - first_page + 1 >= self.pages_per_file:
+                self._close_part(has_next=True)
+        if self._file is None:
+            self._open_part()
+        self.pages += 1
+        rows = list(rows)
+        if METRICS.enabled:
+            METRICS.count('rows_written', len(rows))
+        self._file.write("".join([HTML_PAGE_START(self.pages, self.pages + 1)] + rows + [HTML_PAGE_END]))
+        part = self.parts[-1]
+        part[2] = self.pages
+        part[3] += len(rows)
+
+    def close(self):
+        """Finish the last file and, for split exports, write the index page"""
+        if not self.parts and not self.pages_per_file:
+            self._open_part() # an export without pages still gets its file
+        if self._file is not None:
+            self._close_part(has_next=False)
+        if not self.pages_per_file:
+            return
+        with open(self.destination_file, 'w', encoding='utf-8') as f:
+            f.write(self._head(self.title))
+            f.write("\t\t\t<ul class='list-group'>\n")
+            for name, first_page, last_page, rows in self.parts:
+                f.write("\t\t\t<li class='list-group-item'><a href='{}'>Pages {} to {}</a> ({} items)</li>\n".format(
+                    escape_html(name), first_page, last_page, rows))
+            f.write("\t\t\t</ul>\n")
+            f.write(HTML_FOOT)
+
+@instrumented_export
+def export_user_comments_to_html(username=None, max_page=5, pages_per_file=None):
     """Export all of a user's comments data to a html file
 
     Parameters
@@ -582,103 +2598,26 @@ def export_user_comments_to_html(username=None, max_page=5):
     int
         Maximum page count for user's comments (Default is 5 pages of comments)
         loop breaks if we exceed actual count
+    pages_per_file : int
+        Split the export into files of this many pages, linked from an index page written
+        to the usual file name. Default is one file.
     """
 
     if not username:
         raise NonExistentNairalandUser("Please provide a username.")
 
     destination_file = os.path.join(OUTPUT_DIR, "comments_{}_{}_pages.html".format(username.lower(), max_page))
-    if os.path.exists(destination_file):
-        os.remove(destination_file)
-    with open(destination_file, 'a+', encoding='utf-8') as f:
-
-        # html scaffold
-        f.write("<html xmlns='http://www.w3.org/1999/xhtml'>\n")
-        f.write("\t<head>\n")
-
-
-        # resources
-        f.write("\t\t<link rel='stylesheet' href='https://stackpath.bootstrapcdn.com/bootswatch/4.1.3/superhero/bootstrap.min.css'>\n")
-        f.write("\t\t<meta name='viewport' content='width=device-width, initial-scale=1, shrink-to-fit=no'>\n")
-        f.write("\t\t<script src='https://stackpath.bootstrapcdn.com/bootstrap/4.1.1/js/bootstrap.min.js' integrity='sha384-smHYKdLADwkXOn1EmN1qk/HfnUcbVRZyYmZ4qpPea6sjB/pTJ0euyQp0Mk8ck+5T' crossorigin='anonymous' async></script>\n")
-        f.write("<script defer src='https://use.fontawesome.com/releases/v5.0.6/js/all.js' async></script>")
-        f.write("<script src='https://code.jquery.com/jquery-3.3.1.min.js' integrity='sha256-FgpCb/KJQlLNfOu91ta32o/NMZxltwRo8QtmkMRdAu8=' crossorigin='anonymous'></script>")
-        # end resources
-
-        f.write("\t\t<title>Comment history for {} - Hack Nairaland</title>\n".format(username.lower()))
-        f.write("\t</head>\n")
-        f.write("\t<body style='margin-bottom:5rem;'>\n")
-        # navbar
-        f.write("\t\t<nav class='navbar navbar-expand-lg navbar-dark bg-primary' id='topNav'>\n")
-        f.write("\t\t<a class='navbar-brand' style='font-size:36px;'>Hack Nairaland</a>\n")
-        f.write("\t\t<button type='button' class='navbar-toggler my-toggler' data-toggle='collapse' data-target='.navcontent'>\n")
-        f.write("\t\t<span class='sr-only'>Toggle navigation</span>\n")
-        f.write("\t\t<span class='navbar-toggler-icon'></span>\n")
-        f.write("\t\t</button>\n")
-        f.write("\t\t<div class='collapse navbar-collapse navcontent'>\n")
-        f.write("\t\t<ul class='nav navbar-nav lefthand-navigation'>\n")
-        f.write("\t\t<li class='nav-item'><a class='nav-link' href='#' title='Home'>Home</a></li>\n")
-        f.write("\t\t</ul>\n")
-        f.write("\t\t</div>\n")
-        f.write("\t\t</nav>\n")
-        # end navbar
-        f.write("\t\t<div class='container'>\n")
-        f.write("<h1>Nairaland comment history for <a href='https://nairaland.com/{0}/posts' target='_blank'>{0}</a></h1>\n".format(username))
-        # breadcrumb
-        f.write("\t\t<nav aria-label='breadcrumb'>\n")
-        f.write("\t\t<ol class='breadcrumb'>\n")
-        f.write("\t\t<li class='breadcrumb-item'><a href='#'>Home</a></li>\n")
-        f.write("\t\t<li class='breadcrumb-item'>The first {} pages</li>\n".format(max_page))
-        f.write("\t\t</ol>\n")
-        f.write("\t\t</nav>\n")
-        # end breadcrumb
-
-        i = 1
-        for page in list(UserCommentHistory(username).scrap_comments_for_range_of_user_pages(stop=max_page)):
-
-            f.write("\t\t\t<div id='js-scroll-target{}'>\n".format(i)) # div for targeting scroll
-            f.write("\t\t\t<h2><a href='#js-scroll-target{0}' class='smooth-scroll'>Page {1}</a></h2>".format(i+1, i))
-            i += 1
-
-            for section, topic_plus_comment in page.items():
-                f.write("\t\t\t<h3>Section: {}</h3>\n".format(section.split('**')[0])) # remove the ** separating section and index
-                f.write('\t\t\t<h4>Subject: {}</h4>'.format(topic_plus_comment.topic))
-
-                parsed_comment = topic_plus_comment.parsed_comment
-                f.write("\t\t\t<p class='text-success'>{}</p>\n".format(parsed_comment.focus_user_comment))
-                quotes = parsed_comment.quotes_ordered_dict
-
-                for username, comment in quotes.items():
-                    f.write("\t\t\t\t<h4 class='text-info'>{}</h4>\n".format(username))
-                    f.write("\t\t\t\t<p class='text-primary'><em>{}</em></p>\n".format(comment))
-                f.write("\t\t\t<div class='dropdown-divider' style='border:1px solid white;'></div>\n")
-            f.write("\t\t\t</div>\n") # finish scroll div
-
-        # continue up page structure
-        f.write("\t\t\t<p class='float-right'><a href='#topNav' class='smooth-scroll'>Back to top</a></p>\n") # back to top
-        f.write("\t\t\t<p class='float-left'>Template by <a href='https://bootswatch.com/superhero/' class='smooth-scroll'>Bootswatch</a></p>\n")
-        f.write("\t\t</div>\n")
-        # jquery smooth scroll
-        f.write("<script>\n")
-        f.write("$(document).ready(function(){\n")
-        f.write("\t $('.smooth-scroll').on('click', function(event) {\n")
-        f.write("\t\tif (this.hash !== '') {\n")
-        f.write("\t\t\tevent.preventDefault();\n")
-        f.write("\t\t\tvar hash = this.hash;\n")
-        f.write("\t\t\t$('html, body').animate({\n")
-        f.write("\t\t\t scrollTop: $(hash).offset().top\n")
-        f.write("\t\t\t}, 800, function(){\n")
-        f.write("\t\t\t window.location.hash = hash;\n")
-        f.write("\t\t\t});\n")
-        f.write("\t\t}\n")
-        f.write("\t});\n")
-        f.write("});\n")
-        f.write("</script>\n")
-        # end jquery smooth scroll
-        f.write("\t</body>\n")
-        f.write("</html>")
-    os.startfile(destination_file)
-
+    heading = "Nairaland comment history for <a href='{}' target='_blank'>{}</a>".format(
+        escape_html("{}/{}/posts".format(BASE_URL, username)), escape_html(username))
+    writer = HtmlWriter(
+        destination_file, "Comment history for {}".format(username.lower()), heading,
+        "The first {} pages".format(max_page), pages_per_file)
+    with writer:
+        for page in UserCommentHistory(username).scrap_comments_for_range_of_user_pages(stop=max_page):
+            writer.add_page(user_comment_html(section, topic_plus_comment) for section, topic_plus_comment in page.items())
+    os.startfile(writer.destination_file)
+
+@instrumented_export
 def export_user_comments_to_excel(username=None, max_page=5):
     """Export a user's comments to a excel file
 
@@ -688,37 +2627,37 @@ def export_user_comments_to_excel(username=None, max_page=5):
         Username
     int
         Maximum page count for user's comments (Default is 5). The loop breaks if we exceed actual count
+
+    Notes
+    ------
+    The workbook is written in openpyxl write-only mode while the pages are scraped, so memory
+    use does not grow with the number of pages.
     """
     if not username:
         raise NonExistentNairalandUser("Please provide a username.")
 
-    work_book = OP.Workbook()
-    active_sheet = work_book.active
-    active_sheet.title = username
-
-    active_sheet['A1'] = "SECTION"
-    active_sheet['B1'] = "TOPIC"
-    active_sheet['C1'] = 'USER_COMMENT'
-    active_sheet['D1'] = "QUOTED_USER"
-
-    row_number = 2
+    work_book = OP.Workbook(write_only=True)
+    active_sheet = work_book.create_sheet(title=username)
+    active_sheet.append(["SECTION", "TOPIC", 'USER_COMMENT', "QUOTED_USER"])
 
-    for page in list(UserCommentHistory(username).scrap_comments_for_range_of_user_pages(start=0, stop=1)):
+    for page in UserCommentHistory(username).scrap_comments_for_range_of_user_pages(start=0, stop=max_page):
         for section, topic_plus_comment in page.items():
-
-            active_sheet.cell(row=row_number, column=1, value=section)
-            active_sheet.cell(row=row_number, column=2, value=topic_plus_comment.topic)
-
+            if METRICS.enabled:
+                METRICS.count('rows_written')
             parsed_comment = topic_plus_comment.parsed_comment # a namedtuple instance. Multiple cells here
-            active_sheet.cell(row=row_number, column=3, value=parsed_comment.focus_user_comment)
+            row = [section, topic_plus_comment.topic, parsed_comment.focus_user_comment]
 
             quotes = parsed_comment.quotes_ordered_dict
+            if not quotes:
+                active_sheet.append(row)
+                continue
 
+            # first quote goes on the comment's row, the others on the rows below it
             for _username, comment in quotes.items():
                 user_plus_comment = "{}: {}".format(_username, comment)
-                active_sheet.cell(row=row_number, column=4, value=user_plus_comment)
-                row_number += 1
-            row_number += 1
+                active_sheet.append(row + [user_plus_comment])
+                row = [None, None, None]
+            active_sheet.append([]) # blank row after a comment with quotes
 
     destination_file = os.path.join(OUTPUT_DIR, "{}_comments_{}_pages.xlsx".format(username, max_page))
     if os.path.exists(destination_file):
@@ -727,132 +2666,188 @@ def export_user_comments_to_excel(username=None, max_page=5):
     work_book.save(destination_file)
     os.startfile(destination_file)
 
-def export_topics_to_html(section='romance', start=0, stop=3):
+def _section_pages(section, start, stop, dedupe):
+    pages = TopicCollector(section=section).scrap_topics_for_range_of_pages(start=start, stop=stop)
+    return dedupe_topic_pages(pages, TopicSet()) if dedupe else pages
+
+@instrumented_export
+def export_topics_to_html(section='romance', start=0, stop=3, pages_per_file=None, dedupe=True):
     """
     Writes all topics between start and end of a section to a html file
+
+    pages_per_file splits the export into files of that many pages, linked from an index page
+    written to the usual file name. dedupe leaves out topics already met on an earlier page.
     """
 
     destination_file = os.path.join(OUTPUT_DIR, "{}_page_{}_{}_pages.html".format(section, start, stop))
+    heading = "Topics filed under <a href='{}' target='_blank'>{}</a>".format(
+        escape_html("{}/{}".format(BASE_URL, section)), escape_html(section))
+    writer = HtmlWriter(
+        destination_file, "Topics filed under {}".format(section), heading,
+        "Topics filed under {}".format(section), pages_per_file)
+    with writer:
+        for page in _section_pages(section, start, stop, dedupe):
+            writer.add_page(topic_html(topic) for topic in page)
+    os.startfile(writer.destination_file)
+
+@instrumented_export
+def export_topics_to_excel(section='romance', start=0, stop=3, dedupe=True):
+    """Writes all topics between start and end of a section to excel
+
+    The workbook is written in openpyxl write-only mode while the pages are scraped, so memory
+    use does not grow with the number of pages. dedupe leaves out topics already met on an earlier page.
+    """
+
+    work_book = OP.Workbook(write_only=True)
+    active_sheet = work_book.create_sheet(title=section)
+    active_sheet.append(['POSTER', 'TITLE', 'LINK', 'COMMENTS', 'VIEWS', 'LAST COMMENTER', 'OTHERS'])
+
+    for page in _section_pages(section, start, stop, dedupe):
+        for topic in page:
+            if METRICS.enabled:
+                METRICS.count('rows_written')
+            active_sheet.append([
+                topic.poster, topic.title, topic.url, topic.comments, topic.views, topic.last_commenter,
+                topic.other_meta])
+
+    destination_file = os.path.join(OUTPUT_DIR, "{}_page_{}_{}_pages.xlsx".format(section, start, stop))
     if os.path.exists(destination_file):
         os.remove(destination_file)
-    with open(destination_file, 'a+', encoding='utf-8') as f:
+    work_book.save(destination_file)
+    os.startfile(destination_file)
 
-        # html scaffold
-        f.write("<html xmlns='http://www.w3.org/1999/xhtml'>\n")
-        f.write("\t<head>\n")
-
-        # resources
-        f.write("\t\t<link rel='stylesheet' href='https://stackpath.bootstrapcdn.com/bootswatch/4.1.3/superhero/bootstrap.min.css'>\n")
-        f.write("\t\t<meta name='viewport' content='width=device-width, initial-scale=1, shrink-to-fit=no'>\n")
-        f.write("\t\t<script src='https://stackpath.bootstrapcdn.com/bootstrap/4.1.1/js/bootstrap.min.js' integrity='sha384-smHYKdLADwkXOn1EmN1qk/HfnUcbVRZyYmZ4qpPea6sjB/pTJ0euyQp0Mk8ck+5T' crossorigin='anonymous' async></script>\n")
-        f.write("<script defer src='https://use.fontawesome.com/releases/v5.0.6/js/all.js' async></script>")
-        f.write("<script src='https://code.jquery.com/jquery-3.3.1.min.js' integrity='sha256-FgpCb/KJQlLNfOu91ta32o/NMZxltwRo8QtmkMRdAu8=' crossorigin='anonymous'></script>")
-        # end resources
-
-        f.write("\t\t<title>Topics filed under {} - Hack Nairaland</title>\n".format(section))
-        f.write("\t</head>\n")
-        f.write("\t<body style='margin-bottom:5rem;'>\n")
-        # navbar
-        f.write("\t\t<nav class='navbar navbar-expand-lg navbar-dark bg-primary' id='topNav'>\n")
-        f.write("\t\t<a class='navbar-brand' style='font-size:36px;'>Hack Nairaland</a>\n")
-        f.write("\t\t<button type='button' class='navbar-toggler my-toggler' data-toggle='collapse' data-target='.navcontent'>\n")
-        f.write("\t\t<span class='sr-only'>Toggle navigation</span>\n")
-        f.write("\t\t<span class='navbar-toggler-icon'></span>\n")
-        f.write("\t\t</button>\n")
-        f.write("\t\t<div class='collapse navbar-collapse navcontent'>\n")
-        f.write("\t\t<ul class='nav navbar-nav lefthand-navigation'>\n")
-        f.write("\t\t<li class='nav-item'><a class='nav-link' href='#' title='Home'>Home</a></li>\n")
-        f.write("\t\t</ul>\n")
-        f.write("\t\t</div>\n")
-        f.write("\t\t</nav>\n")
-        # end navbar
-        f.write("\t\t<div class='container'>\n")
-        f.write("<h1>Topics filed under <a href='https://nairaland.com/{0}' target='_blank'>{0}</a></h1>\n".format(section))
-        # breadcrumb
-        f.write("\t\t<nav aria-label='breadcrumb'>\n")
-        f.write("\t\t<ol class='breadcrumb'>\n")
-        f.write("\t\t<li class='breadcrumb-item'><a href='#'>Home</a></li>\n")
-        f.write("\t\t<li class='breadcrumb-item'>Topics filed under{}</li>\n".format(section))
-        f.write("\t\t</ol>\n")
-        f.write("\t\t</nav>\n")
-        # end breadcrumb
+def _dictionary_string():
+    return pa.dictionary(pa.int32(), pa.string())
+
+def topic_schema():
+    """Arrow schema of export_topics_to_parquet. Columns repeated a lot are dictionary encoded."""
+    return pa.schema([
+        ('section', _dictionary_string()),
+        ('page', pa.int32()),
+        ('poster', _dictionary_string()),
+        ('title', pa.string()),
+        ('url', pa.string()),
+        ('comments', pa.int64()),
+        ('views', pa.int64()),
+        ('last_commenter', _dictionary_string()),
+        ('other_meta', pa.string()),
+    ])
+
+def user_comment_schema():
+    """Arrow schema of export_user_comments_to_parquet"""
+    return pa.schema([
+        ('username', _dictionary_string()),
+        ('page', pa.int32()),
+        ('section', _dictionary_string()),
+        ('topic', pa.string()),
+        ('comment', pa.string()),
+        ('quotes', pa.list_(pa.struct([('user', pa.string()), ('text', pa.string())]))),
+    ])
+
+class ParquetRowWriter(object):
+    """Write rows to a parquet file in row groups while they are still being scraped
 
-        i = 1
-        topics = TopicCollector(section=section)
-        for page in topics.scrap_topics_for_range_of_pages(start=start, stop=stop):
+    Parameters
+    -----------
+    destination_file : str
+    schema : pyarrow.Schema
+        Rows are tuples in the order of its fields
+    row_group_rows : int
+        Rows buffered before they are written out as one row group
 
-            f.write("\t\t\t<div id='js-scroll-target{}'>\n".format(i)) # div for targeting scroll
-            f.write("\t\t\t<h2><a href='#js-scroll-target{0}' class='smooth-scroll'>Page {1}</a></h2>".format(i+1, i))
-            i += 1
+    Notes
+    ------
+    Dictionary columns are dictionary encoded in the file too, and come back as categoricals
+    from pandas.read_parquet. Memory use is bounded by row_group_rows, not by the number of pages.
+    """
+    def __init__(self, destination_file, schema, row_group_rows=50000):
+        if pa is None:
+            raise ImportError("The parquet exports need pyarrow. pip install pyarrow")
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.rows_written = 0
+        dictionary_columns = [field.name for field in schema if pa.types.is_dictionary(field.type)]
+        self._writer = pq.ParquetWriter(destination_file, schema, use_dictionary=dictionary_columns)
+        self._columns = [[] for _ in schema]
 
-            for topic in list(page):
-                f.write("\t\t\t<h3><a href='{}' target='_blank'>{}</a></h3>".format(topic.url, topic.title))
-                f.write("\t\t\t<h4>Posted by <a href='https://nairaland.com/{0}/topics' target='_blank'>{0}</a></h4>".format(topic.poster))
-                f.write("\t\t\t<h5>{} <i class='fas fa-comment'></i> | {} <i class='fas fa-eye'></i> | Last commenter: {} | Others: {}</h5>".format(topic.comments, topic.views, topic.last_commenter, topic.other_meta))
-                f.write("\t\t\t<div class='dropdown-divider' style='border:1px solid white;'></div>\n")
-            f.write("\t\t\t</div>\n") # finish scroll div
-
-        f.write("\t\t\t<p class='float-right'><a href='#topNav' class='smooth-scroll'>Back to top</a></p>\n")
-        f.write("\t\t\t<p class='float-left'>Template by <a href='https://bootswatch.com/superhero/' target='_blank'>Bootswatch</a></p>\n")
-        f.write("\t\t</div>\n")
-        # jquery smooth scroll
-        f.write("<script>\n")
-        f.write("$(document).ready(function(){\n")
-        f.write("\t $('.smooth-scroll').on('click', function(event) {\n")
-        f.write("\t\tif (this.hash !== '') {\n")
-        f.write("\t\t\tevent.preventDefault();\n")
-        f.write("\t\t\tvar hash = this.hash;\n")
-        f.write("\t\t\t$('html, body').animate({\n")
-        f.write("\t\t\t scrollTop: $(hash).offset().top\n")
-        f.write("\t\t\t}, 800, function(){\n")
-        f.write("\t\t\t window.location.hash = hash;\n")
-        f.write("\t\t\t});\n")
-        f.write("\t\t}\n")
-        f.write("\t});\n")
-        f.write("});\n")
-        f.write("</script>\n")
-        # end jquery smooth scroll
-
-        # finish up page structure
-        f.write("\t</body>\n")
-        f.write("</html>")
-    os.startfile(destination_file)
+    def __str__(self):
+        return "ParquetRowWriter: {} rows".format(self.rows_written)
 
-def export_topics_to_excel(section='romance', start=0, stop=3):
-    """Writes all topics between start and end of a section to excel"""
+    def __enter__(self):
+        return self
 
-    work_book = OP.Workbook()
-    active_sheet = work_book.active
-    active_sheet.title = section
+    def __exit__(self, *exc_info):
+        self.close()
 
-    active_sheet['A1'] = 'POSTER'
-    active_sheet['B1'] = 'TITLE'
-    active_sheet['C1'] = 'LINK'
-    active_sheet['D1'] = 'COMMENTS'
-    active_sheet['E1'] = 'VIEWS'
-    active_sheet['F1'] = 'LAST COMMENTER'
-    active_sheet['G1'] = 'OTHERS'
+    def append(self, row):
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        if len(self._columns[0]) >= self.row_group_rows:
+            self.flush()
 
-    row_number = 2
+    def flush(self):
+        rows = len(self._columns[0])
+        if not rows:
+            return
+        arrays = [pa.array(column, type=field.type) for column, field in zip(self._columns, self.schema)]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._columns = [[] for _ in self.schema]
+        self.rows_written += rows
+        if METRICS.enabled:
+            METRICS.count('rows_written', rows)
 
-    for page in TopicCollector(section=section).scrap_topics_for_range_of_pages(start=start, stop=stop):
-        for topic in list(page):
-            active_sheet.cell(row=row_number, column=1, value=topic.poster)
-            active_sheet.cell(row=row_number, column=2, value=topic.title)
-            active_sheet.cell(row=row_number, column=3, value=topic.url)
-            active_sheet.cell(row=row_number, column=4, value=topic.comments)
-            active_sheet.cell(row=row_number, column=5, value=topic.views)
-            active_sheet.cell(row=row_number, column=6, value=topic.last_commenter)
-            active_sheet.cell(row=row_number, column=7, value=topic.other_meta)
+    def close(self):
+        self.flush()
+        self._writer.close()
 
-            row_number += 1 # advance to next row
+def _count_or_none(value):
+    return value if isinstance(value, int) else None # counts parse_count could not read
 
-    destination_file = os.path.join(OUTPUT_DIR, "{}_page_{}_{}_pages.xlsx".format(section, start, stop))
-    if os.path.exists(destination_file):
-        os.remove(destination_file)
-    work_book.save(destination_file)
-    os.startfile(destination_file)
+@instrumented_export
+def export_topics_to_parquet(section='romance', start=0, stop=3, row_group_rows=50000, dedupe=True):
+    """Write all topics between start and stop of a section to a parquet file, as the pages are scraped
+
+    dedupe leaves out topics already met on an earlier page.
+
+    Returns
+    --------
+    str
+        Path of the file, e.g. for pandas.read_parquet
+    """
+    destination_file = os.path.join(OUTPUT_DIR, "{}_page_{}_{}_pages.parquet".format(section, start, stop))
+    with ParquetRowWriter(destination_file, topic_schema(), row_group_rows) as writer:
+        for page_number, page in enumerate(_section_pages(section, start, stop, dedupe), start=start):
+            for topic in page:
+                writer.append((
+                    section, page_number, topic.poster, topic.title, topic.url, _count_or_none(topic.comments),
+                    _count_or_none(topic.views), topic.last_commenter, topic.other_meta))
+    return destination_file
+
+@instrumented_export
+def export_user_comments_to_parquet(username=None, max_page=5, row_group_rows=50000):
+    """Write a user's comments to a parquet file, as the pages are scraped
+
+    Returns
+    --------
+    str
+        Path of the file, e.g. for pandas.read_parquet
+    """
+    if not username:
+        raise NonExistentNairalandUser("Please provide a username.")
+
+    destination_file = os.path.join(OUTPUT_DIR, "{}_comments_{}_pages.parquet".format(username, max_page))
+    with ParquetRowWriter(destination_file, user_comment_schema(), row_group_rows) as writer:
+        pages = UserCommentHistory(username).scrap_comments_for_range_of_user_pages(start=0, stop=max_page)
+        for page_number, page in enumerate(pages):
+            for section, topic_plus_comment in page.items():
+                parsed_comment = topic_plus_comment.parsed_comment
+                quotes = [{'user' : user, 'text' : text} for user, text in parsed_comment.quotes_ordered_dict.items()]
+                writer.append((
+                    username, page_number, section.split('**')[0], topic_plus_comment.topic,
+                    parsed_comment.focus_user_comment, quotes))
+    return destination_file
 
+@instrumented_export
 def export_post_docx(post_url, start=0, stop=2, _all_pages=False):
     """Export post to .docx format"""
 
@@ -863,6 +2858,8 @@ def export_post_docx(post_url, start=0, stop=2, _all_pages=False):
     document.add_paragraph(post_url)
     for page in list(post.scrap_comments_for_range_of_post_pages(start=0, stop=2, _all_pages=_all_pages)):
         for _username, parsed_comment in page.items():
+            if METRICS.enabled:
+                METRICS.count('rows_written')
             document.add_paragraph().add_run(_username).bold = True
             document.add_paragraph(parsed_comment.focus_user_comment)
             for commenter, comment in parsed_comment.quotes_ordered_dict.items():
@@ -877,6 +2874,7 @@ def export_post_docx(post_url, start=0, stop=2, _all_pages=False):
     document.save(destination_file)
     os.startfile(destination_file)
 
+@instrumented_export
 def export_post_to_markdown(post_url, start=0, stop=2, _all_pages=False):
     """Export post to markdown format"""
 
@@ -891,6 +2889,8 @@ def export_post_to_markdown(post_url, start=0, stop=2, _all_pages=False):
         f.write('[{0}]({0})\n\n'.format(post_url))
         for page in list(post.scrap_comments_for_range_of_post_pages(start=0, stop=2, _all_pages=_all_pages)):
             for _username, parsed_comment in page.items():
+                if METRICS.enabled:
+                    METRICS.count('rows_written')
                 f.write('**{}**\n\n'.format(_username))
                 f.write('{}\n\n'.format(parsed_comment.focus_user_comment))
 
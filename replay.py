@@ -0,0 +1,281 @@
+"""Local stand-in for nairaland.com, for crawling and load testing without the live site
+
+Usage:
+    python replay.py --port 8000 --latency 0.05 --error-rate 0.01
+
+    server = ReplayServer(latency=0.05)
+    hack.configure_base_url(server.base_url)
+    ...
+    server.stop()
+
+Section, post and user-history pages are generated from the comment blocks in
+comment-blocks/comment-block-collection.html, shaped like nairaland's own pages.
+Pages saved with record() are served instead of generated ones.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+from collections import Counter
+from urllib.parse import urlsplit, quote
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import hack
+
+COMMENT_BLOCK_COLLECTION = os.path.join(hack.BASE_DIR, 'comment-blocks', 'comment-block-collection.html')
+
+def comment_blocks():
+    """Unique comment blocks saved in comment-blocks/comment-block-collection.html"""
+    with open(COMMENT_BLOCK_COLLECTION, 'r', encoding='utf-8') as rh:
+        blocks = rh.read().split("End of file.\n\n")
+    return sorted(set(block for block in blocks if block.strip()))
+
+def _page_count_marker(number_of_pages):
+    return "<p>(of {} pages)</p>".format(number_of_pages) if number_of_pages else ""
+
+def synthetic_post_page(number, blocks, comments_per_page=30, number_of_pages=None):
+    """Html of a post page shaped like nairaland's, built from real comment blocks"""
+    rows = []
+    for n in range(comments_per_page):
+        block = blocks[(number * comments_per_page + n) % len(blocks)]
+        rows.append(
+            "<tr><td class='bold l pu'><a href='/user{0}' class='user'>user{0}</a></td></tr>"
+            "<tr><td id='pb{1}' class='l w pd'>{2}</td></tr>".format(n % 17, n, block))
+        rows.append("<tr><td class='l pu pd'>ad</td></tr>")
+    return "<html><body><h2>Synthetic post</h2>{}<table summary='posts'>{}</table></body></html>".format(
+        _page_count_marker(number_of_pages), "".join(rows))
+
+def synthetic_user_page(number, blocks, comments_per_page=25, number_of_pages=None):
+    """Html of a page of a user's comment history, built from real comment blocks"""
+    rows = []
+    for n in range(comments_per_page):
+        block = blocks[(number * comments_per_page + n) % len(blocks)]
+        rows.append(
+            "<tr><td class='bold l pu'><a href='/section{0}'>Section {0}</a> / <a href='/{1}/topic'>Re: Topic {1}</a></td></tr>"
+            "<tr><td class='l w pd'><div class='narrow'>{2}</div></td></tr>".format(n % 7, number * comments_per_page + n, block))
+    # UserCommentHistory.max_pages reads the page count from the first <b> holding a number
+    pages = "<p>(<b>{}</b>)</p>".format(number_of_pages) if number_of_pages else ""
+    return "<html><body>{}<table>{}</table></body></html>".format(pages, "".join(rows))
+
+def synthetic_section_page(number, topics_per_page=60, number_of_pages=None):
+    """Html of a section page of topics"""
+    cells = "".join(
+        "<tr><td id='top{0}'><b><a href='/{0}/topic-{0}'>Synthetic topic {0}</a></b>"
+        "<span class='s'>by <b>poster{1}</b>. <b>{2}</b> posts &amp; <b>{3}</b> views. "
+        "<b>1:00pm</b> (<b>commenter{1}</b>)</span></td></tr>".format(
+            number * topics_per_page + n, n % 97, n * 3, n * 41) for n in range(topics_per_page))
+    return "<html><body>{}<table>{}</table></body></html>".format(_page_count_marker(number_of_pages), cells)
+
+def home_page(sections):
+    links = "".join("<a href='/{0}'>{1}</a> ".format(section, section.title()) for section in sections)
+    return "<html><body><table class='boards'><tr><td>{}</td></tr></table></body></html>".format(links)
+
+def recording_name(path):
+    """File name a page at path is recorded under"""
+    return quote(path.strip('/') or 'index', safe='') + '.html'
+
+def record(urls, directory):
+    """Save the pages at urls into directory, for a ReplayServer to serve back
+
+    Returns
+    --------
+    list
+        urls that could not be recorded
+    """
+    os.makedirs(directory, exist_ok=True)
+    failed = []
+    for url in urls:
+        response = hack.TRANSPORT.get(url)
+        if response.status_code != 200:
+            failed.append(url)
+            continue
+        with open(os.path.join(directory, recording_name(urlsplit(url).path)), 'w', encoding='utf-8') as wh:
+            wh.write(response.text)
+    return failed
+
+class ReplayServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering like nairaland.com
+
+    Parameters
+    -----------
+    port : int
+        0 (the default) picks a free port. The server listens on 127.0.0.1.
+    latency : float
+        Seconds every response is delayed
+    jitter : float
+        Up to this many more seconds, drawn uniformly, are added to latency
+    error_rate : float
+        Fraction of requests answered with a 503
+    page_counts : dict
+        Number of pages of every section, post and user history, keyed by 'section', 'post' and 'user'
+    sections : iterable
+        Section names, listed on the home page
+    recordings : str
+        Directory of pages saved by record(). They are served in place of generated pages.
+    seed : int
+        Seed of the latency and error draws
+    rate_limit : float
+        Requests per second answered before the server answers 429 with a Retry-After of
+        retry_after seconds, like nairaland under load. The budget refills continuously
+        and holds at most one second's worth. None (the default) never throttles.
+
+    Notes
+    ------
+    Urls are routed as on nairaland:
+    /<section>/<page>, /<topic id>/<slug>/<page>, /<username>/posts/<page>, and /<username> for profiles.
+    Pages past the page count are 404s. 429s do not use up the budget. `served` counts responses by status code and
+    `requests` counts requests by (method, path).
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, page_counts=None,
+                 sections=('politics', 'romance', 'programming'), recordings=None, seed=None, rate_limit=None,
+                 retry_after=1):
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.page_counts = dict({'section' : 50, 'post' : 20, 'user' : 10}, **(page_counts or {}))
+        self.sections = tuple(sections)
+        self.recordings = recordings
+        self.blocks = comment_blocks()
+        self.random = random.Random(seed)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._budget = rate_limit or 0.0
+        self._budget_updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.served = Counter()
+        self.requests = Counter() # (method, path) of every request
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def __str__(self):
+        return "ReplayServer: {}".format(self.base_url)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def draw(self):
+        """Return (delay in seconds, True if this response should fail)"""
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter), self.random.random() < self.error_rate
+
+    def admit(self):
+        """True if the request fits in rate_limit, False if it should be answered with a 429"""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self._budget = min(self.rate_limit, self._budget + (now - self._budget_updated) * self.rate_limit)
+            self._budget_updated = now
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def route(self, path):
+        """Return (kind, page) for a url path, kind being None for urls nairaland would 404"""
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        page = int(parts[-1]) if len(parts) > 1 and parts[-1].isdigit() else 0
+        if not parts:
+            return 'home', 0
+        if parts[0] in self.sections and len(parts) <= 2:
+            return 'section', page
+        if len(parts) >= 2 and parts[1] == 'posts':
+            return 'user', page
+        if parts[0].isdigit() and len(parts) >= 2:
+            return 'post', page
+        if len(parts) == 1:
+            return 'profile', 0
+        return None, 0
+
+    def page(self, path):
+        """Return (status code, html) for a url path"""
+        kind, page = self.route(path)
+        if kind is None or page >= self.page_counts.get(kind, 1):
+            return 404, "<html><body>Not found</body></html>"
+        if self.recordings:
+            recorded = os.path.join(self.recordings, recording_name(path))
+            if os.path.exists(recorded):
+                with open(recorded, 'r', encoding='utf-8') as rh:
+                    return 200, rh.read()
+        number_of_pages = self.page_counts.get(kind)
+        if kind == 'section':
+            return 200, synthetic_section_page(page, number_of_pages=number_of_pages)
+        if kind == 'post':
+            return 200, synthetic_post_page(page, self.blocks, number_of_pages=number_of_pages)
+        if kind == 'user':
+            return 200, synthetic_user_page(page, self.blocks, number_of_pages=number_of_pages)
+        if kind == 'home':
+            return 200, home_page(self.sections)
+        return 200, "<html><body><h1>Profile</h1></body></html>"
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, as the pooled Transport expects
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, send_body):
+        server = self.server
+        headers = {}
+        if not server.admit():
+            status, body = 429, "<html><body>Too many requests</body></html>"
+            headers['Retry-After'] = str(server.retry_after)
+        else:
+            delay, fail = server.draw()
+            time.sleep(delay)
+            status, body = (503, "<html><body>Service unavailable</body></html>") if fail else server.page(self.path)
+        body = body.encode('utf-8')
+        with server.lock:
+            server.served[status] += 1
+            server.requests[self.command, self.path] += 1
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--recordings')
+    parser.add_argument('--rate-limit', type=float, default=None)
+    for kind in ('section', 'post', 'user'):
+        parser.add_argument('--{}-pages'.format(kind), type=int, default=None)
+    options = parser.parse_args(argv)
+
+    page_counts = {kind : getattr(options, '{}_pages'.format(kind)) for kind in ('section', 'post', 'user')}
+    server = ReplayServer(
+        options.port, options.latency, options.jitter, options.error_rate,
+        {kind : count for kind, count in page_counts.items() if count is not None}, recordings=options.recordings,
+        rate_limit=options.rate_limit)
+    print("Serving on {}. Ctrl+C to stop.".format(server.base_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
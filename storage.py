@@ -0,0 +1,512 @@
+"""Indexed SQLite storage for scraped topics, posts, comments and quotes
+
+Usage:
+    store = Store()
+    store_topics(store, hack.TopicCollector('politics'), 0, 9)
+    store_user_comments(store, hack.UserCommentHistory('seun'), 0, 4)
+    store.comments_by_user('seun', section='Politics')
+    store.search('"fuel subsidy" AND remov*', section='Politics') # full-text search of comment bodies
+    update_posts(store, watch_list, concurrency=8) # fetch only what is new on each thread
+"""
+import os
+import copy
+import time
+import sqlite3
+
+from collections import OrderedDict
+
+import hack
+
+DEFAULT_DATABASE = os.path.join(hack.OUTPUT_DIR, 'nairaland.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    url TEXT PRIMARY KEY,
+    section TEXT,
+    page INTEGER,
+    poster TEXT,
+    title TEXT,
+    comments INTEGER,
+    views INTEGER,
+    last_commenter TEXT,
+    other_meta TEXT,
+    crawled REAL
+);
+CREATE INDEX IF NOT EXISTS topics_poster ON topics (poster);
+CREATE INDEX IF NOT EXISTS topics_section_page ON topics (section, page);
+
+CREATE TABLE IF NOT EXISTS posts (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    section TEXT,
+    pages INTEGER,
+    crawled REAL
+);
+CREATE INDEX IF NOT EXISTS posts_section ON posts (section);
+
+-- source is 'post' for comments scraped from a post (thread) and 'user' for comments scraped from
+-- a user's comment history. source_url is the post url or the user's posts page.
+CREATE TABLE IF NOT EXISTS comments (
+    source TEXT,
+    source_url TEXT,
+    page INTEGER,
+    position INTEGER,
+    username TEXT,
+    section TEXT,
+    topic TEXT,
+    topic_url TEXT,
+    body TEXT,
+    crawled REAL,
+    PRIMARY KEY (source, source_url, page, position)
+);
+CREATE INDEX IF NOT EXISTS comments_username ON comments (username, section);
+CREATE INDEX IF NOT EXISTS comments_section ON comments (section);
+CREATE INDEX IF NOT EXISTS comments_topic_url ON comments (topic_url, page);
+
+CREATE TABLE IF NOT EXISTS quotes (
+    source TEXT,
+    source_url TEXT,
+    page INTEGER,
+    position INTEGER,
+    quote_position INTEGER,
+    quoted_user TEXT,
+    body TEXT,
+    PRIMARY KEY (source, source_url, page, position, quote_position)
+);
+CREATE INDEX IF NOT EXISTS quotes_quoted_user ON quotes (quoted_user);
+"""
+
+# Full-text indexes of comment and quote bodies. They are external content tables: the text lives
+# only in comments and quotes, and triggers keep the indexes in step with every insert, update
+# and delete, whichever code path writes the rows. username, section and topic are indexed too,
+# so filtering on them narrows the match inside the index instead of after it.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5 (
+    body, username, section, topic,
+    content='comments', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, body, username, section, topic)
+    VALUES (new.rowid, new.body, new.username, new.section, new.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, body, username, section, topic)
+    VALUES ('delete', old.rowid, old.body, old.username, old.section, old.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE ON comments
+WHEN old.body IS NOT new.body OR old.username IS NOT new.username
+    OR old.section IS NOT new.section OR old.topic IS NOT new.topic BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, body, username, section, topic)
+    VALUES ('delete', old.rowid, old.body, old.username, old.section, old.topic);
+    INSERT INTO comments_fts (rowid, body, username, section, topic)
+    VALUES (new.rowid, new.body, new.username, new.section, new.topic);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5 (
+    body, quoted_user,
+    content='quotes', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS quotes_fts_insert AFTER INSERT ON quotes BEGIN
+    INSERT INTO quotes_fts (rowid, body, quoted_user) VALUES (new.rowid, new.body, new.quoted_user);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_fts_delete AFTER DELETE ON quotes BEGIN
+    INSERT INTO quotes_fts (quotes_fts, rowid, body, quoted_user) VALUES ('delete', old.rowid, old.body, old.quoted_user);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_fts_update AFTER UPDATE ON quotes
+WHEN old.body IS NOT new.body OR old.quoted_user IS NOT new.quoted_user BEGIN
+    INSERT INTO quotes_fts (quotes_fts, rowid, body, quoted_user) VALUES ('delete', old.rowid, old.body, old.quoted_user);
+    INSERT INTO quotes_fts (rowid, body, quoted_user) VALUES (new.rowid, new.body, new.quoted_user);
+END;
+"""
+
+UPSERT_TOPIC = """
+INSERT INTO topics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    section = excluded.section, page = excluded.page, poster = excluded.poster, title = excluded.title,
+    comments = excluded.comments, views = excluded.views, last_commenter = excluded.last_commenter,
+    other_meta = excluded.other_meta, crawled = excluded.crawled
+"""
+
+UPSERT_COMMENT = """
+INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, source_url, page, position) DO UPDATE SET
+    username = excluded.username, section = COALESCE(excluded.section, comments.section), topic = excluded.topic,
+    topic_url = excluded.topic_url, body = excluded.body, crawled = excluded.crawled
+"""
+
+UPSERT_QUOTE = """
+INSERT INTO quotes VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, source_url, page, position, quote_position) DO UPDATE SET
+    quoted_user = excluded.quoted_user, body = excluded.body
+"""
+
+def fts_phrase(text):
+    """text as one FTS5 phrase, matching its words in order whatever characters it holds"""
+    return '"{}"'.format(text.replace('"', '""'))
+
+def _search_filters(match, fts_filters, row_filters):
+    """Add column filters to an FTS5 query
+
+    Parameters
+    -----------
+    match : str
+        FTS5 query over the body column
+    fts_filters : dict
+        {indexed column : value}. The value's words narrow the match inside the index.
+    row_filters : dict
+        {'table.column' : value} compared exactly after the match
+
+    Returns
+    --------
+    (str, str, list)
+        MATCH expression, extra WHERE clauses and their parameters
+    """
+    expression = "body : ({})".format(match)
+    clauses, parameters = "", []
+    for column, value in fts_filters.items():
+        if value is not None:
+            expression += " AND {} : {}".format(column, fts_phrase(value))
+    for column, value in row_filters.items():
+        if value is not None:
+            clauses += " AND {} = ?".format(column)
+            parameters.append(value)
+    return expression, clauses, parameters
+
+def real_username(key):
+    """Collectors append **<row> to repeated usernames and sections; strip it"""
+    return key.split('**')[0]
+
+class Store(object):
+    """SQLite sink for the collectors
+
+    Parameters
+    -----------
+    path : str
+        Database file. ':memory:' works for throwaway stores.
+    batch_size : int
+        Rows buffered before they are written in one transaction
+
+    Notes
+    ------
+    Every table is keyed on where its rows came from (topic url, or source url + page + position),
+    so crawling the same pages again updates rows in place instead of duplicating them.
+    A page that comes back shorter than before loses its extra rows.
+
+    Comment and quote bodies are full-text indexed as they are written (see search).
+    A database created before the indexes existed is indexed the first time it is opened.
+    """
+    def __init__(self, path=DEFAULT_DATABASE, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        # Frontier workers share one database. Taking the write lock when a batch starts (IMMEDIATE)
+        # makes a second writer wait for it, instead of failing when the indexed batch takes a while.
+        self.db = sqlite3.connect(path, timeout=60, isolation_level='IMMEDIATE')
+        self.db.executescript(SCHEMA)
+        self._topics = []
+        self._comments = []
+        self._quotes = []
+        self._replaced_pages = [] # (source, source_url, page, number of comments)
+        indexed = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'comments_fts'").fetchone()
+        self.db.executescript(SEARCH_SCHEMA)
+        if not indexed:
+            self.rebuild_search_index()
+
+    def __str__(self):
+        return "Store: {}".format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _pending(self):
+        return len(self._topics) + len(self._comments) + len(self._quotes)
+
+    def _maybe_flush(self):
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered row in one transaction"""
+        started = time.perf_counter()
+        rows = self._pending()
+        with self.db:
+            self.db.executemany(UPSERT_TOPIC, self._topics)
+            for source, source_url, page, count in self._replaced_pages:
+                self.db.execute(
+                    "DELETE FROM comments WHERE source = ? AND source_url = ? AND page = ? AND position >= ?",
+                    (source, source_url, page, count))
+                self.db.execute(
+                    "DELETE FROM quotes WHERE source = ? AND source_url = ? AND page = ?", (source, source_url, page))
+            self.db.executemany(UPSERT_COMMENT, self._comments)
+            self.db.executemany(UPSERT_QUOTE, self._quotes)
+        self._topics, self._comments, self._quotes, self._replaced_pages = [], [], [], []
+        if hack.METRICS.enabled and rows:
+            hack.METRICS.observe('store', time.perf_counter() - started)
+            hack.METRICS.count('rows_written', rows)
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def add_topics(self, section, page, topics):
+        now = time.time()
+        for topic in topics:
+            self._topics.append((
+                topic.url, section, page, topic.poster, topic.title, topic.comments, topic.views,
+                topic.last_commenter, topic.other_meta, now))
+        self._maybe_flush()
+
+    def add_post(self, post_url, title=None, section=None, pages=None):
+        self.flush()
+        with self.db:
+            self.db.execute(
+                "INSERT INTO posts VALUES (?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+                "title = COALESCE(excluded.title, posts.title), section = COALESCE(excluded.section, posts.section), "
+                "pages = COALESCE(excluded.pages, posts.pages), crawled = excluded.crawled",
+                (post_url, title, section, pages, time.time()))
+
+    def _replace_page(self, source, source_url, page, count):
+        if any(pending[:3] == (source, source_url, page) for pending in self._replaced_pages):
+            self.flush() # deletes run before upserts in a batch, so the same page can't be in it twice
+        self._replaced_pages.append((source, source_url, page, count))
+
+    def _add_comment(self, source, source_url, page, position, username, section, topic, topic_url, parsed_comment, now):
+        self._comments.append((
+            source, source_url, page, position, username, section, topic, topic_url,
+            parsed_comment.focus_user_comment, now))
+        for quote_position, (quoted_user, body) in enumerate(parsed_comment.quotes_ordered_dict.items()):
+            self._quotes.append((source, source_url, page, position, quote_position, quoted_user, body))
+
+    def add_post_page(self, post_url, page, comments_page, section=None):
+        """Add one page of PostCollector.scrap_comments_for_range_of_post_pages"""
+        now = time.time()
+        self._replace_page('post', post_url, page, len(comments_page))
+        for position, (username, parsed_comment) in enumerate(comments_page.items()):
+            self._add_comment(
+                'post', post_url, page, position, real_username(username), section, None, post_url, parsed_comment, now)
+        self._maybe_flush()
+
+    def add_user_page(self, username, user_post_page, page, user_page):
+        """Add one page of UserCommentHistory.scrap_comments_for_range_of_user_pages"""
+        now = time.time()
+        self._replace_page('user', user_post_page, page, len(user_page))
+        for position, (section, comment) in enumerate(user_page.items()):
+            self._add_comment(
+                'user', user_post_page, page, position, username, real_username(section), comment.topic, None,
+                comment.parsed_comment, now)
+        self._maybe_flush()
+
+    def post_progress(self, post_url):
+        """Return (number of pages, (page, position) of the last comment) stored for a post
+
+        (0, None) if the post has never been stored. The number of pages is the one store_post or
+        update_post recorded.
+        """
+        self.flush()
+        row = self.db.execute("SELECT pages FROM posts WHERE url = ?", (post_url,)).fetchone()
+        last_comment = self.db.execute(
+            "SELECT page, position FROM comments WHERE source = 'post' AND source_url = ? "
+            "ORDER BY page DESC, position DESC LIMIT 1", (post_url,)).fetchone()
+        return (row[0] or 0) if row else 0, last_comment
+
+    def comments_by_user(self, username, section=None):
+        """Return (section, topic, topic_url, body) of every stored comment by username"""
+        self.flush()
+        query = "SELECT section, topic, topic_url, body FROM comments WHERE username = ?"
+        parameters = [username]
+        if section is not None:
+            query += " AND section = ?"
+            parameters.append(section)
+        return self.db.execute(query + " ORDER BY source, source_url, page, position", parameters).fetchall()
+
+    def post_comments(self, post_url):
+        """Return {username**page_position : ParsedComment} of a stored post, in page order"""
+        self.flush()
+        comments = self.db.execute(
+            "SELECT page, position, username, body FROM comments WHERE source = 'post' AND source_url = ? "
+            "ORDER BY page, position", (post_url,)).fetchall()
+        quotes = {}
+        for page, position, quoted_user, body in self.db.execute(
+                "SELECT page, position, quoted_user, body FROM quotes WHERE source = 'post' AND source_url = ? "
+                "ORDER BY page, position, quote_position", (post_url,)):
+            quotes.setdefault((page, position), OrderedDict())[quoted_user] = body
+
+        output_ordered_dict = OrderedDict()
+        for page, position, username, body in comments:
+            key = username if username not in output_ordered_dict else "{}**{}_{}".format(username, page, position)
+            output_ordered_dict[key] = hack.ParsedComment(body, quotes.get((page, position), OrderedDict()))
+        return output_ordered_dict
+
+    def rebuild_search_index(self):
+        """Index every stored comment and quote from scratch
+
+        The indexes refer to rows by rowid, which a VACUUM may renumber; rebuild after one.
+        """
+        self.flush()
+        with self.db:
+            self.db.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+            self.db.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('rebuild')")
+
+    def search(self, match, username=None, section=None, topic=None, topic_url=None, limit=20, ranked=False,
+               snippet=False):
+        """Full-text search of stored comments
+
+        Parameters
+        -----------
+        match : str
+            FTS5 query over comment bodies: words, "phrases", prefixes*, AND, OR, NOT, NEAR(a b, 5)
+            and parentheses. Case and diacritics are ignored.
+        username, section : str
+            Only comments by this user / in this section
+        topic : str
+            Only comments on topics whose title holds these words, in this order.
+            Comments scraped from a post have no topic; filter them on topic_url.
+        topic_url : str
+            Only comments of this post
+        limit : int
+            Most rows returned. None returns every match.
+        ranked : bool
+            False returns the newest stored matches first and stops at limit. Words, phrases,
+            boolean queries and filters then take about a millisecond however common the words are;
+            a prefix costs more the more words it expands to. True orders by relevance (bm25),
+            which scores every match: fast for rare words, but seconds for a word or phrase found
+            in a million comments.
+        snippet : bool
+            Return the matched words in [brackets] with some context, instead of the whole body
+
+        Returns
+        --------
+        list
+            (username, section, topic, topic_url, body) of every match
+
+        Notes
+        ------
+        A malformed match raises sqlite3.OperationalError. Use fts_phrase to search for text as it is.
+        """
+        self.flush()
+        expression, clauses, parameters = _search_filters(
+            match, OrderedDict([('username', username), ('section', section), ('topic', topic)]),
+            OrderedDict([('c.username', username), ('c.section', section), ('c.topic_url', topic_url)]))
+        body = "snippet(comments_fts, 0, '[', ']', '...', 16)" if snippet else "c.body"
+        query = (
+            "SELECT c.username, c.section, c.topic, c.topic_url, {} FROM comments_fts "
+            "JOIN comments c ON c.rowid = comments_fts.rowid WHERE comments_fts MATCH ?{} ORDER BY {} LIMIT ?").format(
+                body, clauses, "rank" if ranked else "comments_fts.rowid DESC")
+        return self.db.execute(query, [expression] + parameters + [-1 if limit is None else limit]).fetchall()
+
+    def search_quotes(self, match, quoted_user=None, username=None, section=None, limit=20, ranked=False):
+        """Full-text search of stored quotes
+
+        match, limit and ranked are as in search. quoted_user is whom the quote is from;
+        username and section are of the comment quoting it.
+
+        Returns
+        --------
+        list
+            (quoted_user, body, username, section, topic, topic_url) of every match
+        """
+        self.flush()
+        expression, clauses, parameters = _search_filters(
+            match, OrderedDict([('quoted_user', quoted_user)]),
+            OrderedDict([('q.quoted_user', quoted_user), ('c.username', username), ('c.section', section)]))
+        query = (
+            "SELECT q.quoted_user, q.body, c.username, c.section, c.topic, c.topic_url FROM quotes_fts "
+            "JOIN quotes q ON q.rowid = quotes_fts.rowid "
+            "LEFT JOIN comments c ON (c.source, c.source_url, c.page, c.position) = (q.source, q.source_url, q.page, q.position) "
+            "WHERE quotes_fts MATCH ?{} ORDER BY {} LIMIT ?").format(clauses, "rank" if ranked else "quotes_fts.rowid DESC")
+        return self.db.execute(query, [expression] + parameters + [-1 if limit is None else limit]).fetchall()
+
+def store_topics(store, collector, start=0, stop=0, **range_options):
+    """Scrap a range of section pages into store. range_options go to scrap_topics_for_range_of_pages"""
+    pages = collector.scrap_topics_for_range_of_pages(start, stop, **range_options)
+    for page, topics in enumerate(pages, start=start):
+        if topics is not None: # None is a page a Checkpoint dead-lettered; its stored rows are kept
+            store.add_topics(collector.section, page, topics)
+    store.flush()
+
+def store_post(store, collector, start=0, stop=0, section=None, **range_options):
+    """Scrap a range of a post's pages into store, along with its title and number of pages.
+    range_options go to scrap_comments_for_range_of_post_pages"""
+    pages = collector.scrap_comments_for_range_of_post_pages(start, stop, **range_options)
+    for page, comments_page in enumerate(pages, start=start):
+        if comments_page is not None:
+            store.add_post_page(collector.post_url, page, comments_page, section)
+    store.add_post(collector.post_url, title=collector.get_title(), section=section, pages=collector.max_page())
+
+def _fetch_new_post_pages(collector, known_pages, range_options):
+    """Return (number of pages, first page fetched, pages) of what a post gained since known_pages"""
+    number_of_pages = collector.max_page(refresh=True, known_pages=known_pages)
+    start = max(known_pages - 1, 0)
+    if number_of_pages <= start:
+        return number_of_pages, start, []
+    # the last known page may have filled up since, so it is revalidated instead of read from the page cache
+    fresh = copy.copy(collector)
+    fresh.max_age = 0
+    pages = fresh.scrap_comments_for_range_of_post_pages(start, number_of_pages - 1, **range_options)
+    return number_of_pages, start, list(pages)
+
+def _merge_post_pages(store, collector, last_comment, fetched, section):
+    number_of_pages, start, pages = fetched
+    new_comments = OrderedDict()
+    for page, comments_page in enumerate(pages, start=start):
+        if comments_page is None:
+            continue
+        store.add_post_page(collector.post_url, page, comments_page, section)
+        for position, (username, parsed_comment) in enumerate(comments_page.items()):
+            if last_comment is None or (page, position) > tuple(last_comment):
+                # repeats get a **page_position suffix, which cannot clash with the collectors' **row ones,
+                # so a user's comments on several pages are all kept
+                key = username if username not in new_comments else "{}**{}_{}".format(
+                    real_username(username), page, position)
+                new_comments[key] = parsed_comment
+    if number_of_pages:
+        store.add_post(collector.post_url, section=section, pages=number_of_pages)
+    return new_comments
+
+def update_post(store, collector, section=None, **range_options):
+    """Bring a stored post up to date, fetching only its last known page and any page after it
+
+    Parameters
+    -----------
+    store : Store
+    collector : PostCollector
+    range_options
+        Passed on to scrap_comments_for_range_of_post_pages, e.g. concurrency
+
+    Returns
+    --------
+    OrderedDict
+        Dictionary of {commenter : ParsedComment} of the comments that were not stored before
+    """
+    known_pages, last_comment = store.post_progress(collector.post_url)
+    fetched = _fetch_new_post_pages(collector, known_pages, range_options)
+    return _merge_post_pages(store, collector, last_comment, fetched, section)
+
+def update_posts(store, post_urls, concurrency=1, parser='html5lib', section=None):
+    """update_post every post in a watch-list, `concurrency` posts at a time
+
+    Returns
+    --------
+    OrderedDict
+        Dictionary of {post url : new comments}
+    """
+    collectors = [hack.PostCollector(post_url, parser=parser) for post_url in post_urls]
+    progress = {collector.post_url : store.post_progress(collector.post_url) for collector in collectors}
+
+    # posts are downloaded and parsed in worker threads; the store is only written from this one
+    fetch = lambda collector: _fetch_new_post_pages(collector, progress[collector.post_url][0], {})
+    updates = OrderedDict()
+    for collector, fetched in zip(collectors, hack.ordered_concurrent_map(fetch, collectors, concurrency)):
+        updates[collector.post_url] = _merge_post_pages(store, collector, progress[collector.post_url][1], fetched, section)
+    return updates
+
+def store_user_comments(store, collector, start=0, stop=0, username=None, **range_options):
+    """Scrap a range of a user's comment history into store. range_options go to scrap_comments_for_range_of_user_pages"""
+    username = username or collector.user_post_page.rstrip('/').split('/')[-2]
+    pages = collector.scrap_comments_for_range_of_user_pages(start, stop, **range_options)
+    for page, user_page in enumerate(pages, start=start):
+        if user_page is not None:
+            store.add_user_page(username, collector.user_post_page, page, user_page)
+    store.flush()
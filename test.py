@@ -1,8 +1,15 @@
 import os
 import sys
+import json
+import time
 import unittest
+import tempfile
+import threading
 import types
 
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
 from pathlib import Path
 from unittest import mock
 
@@ -11,40 +18,50 @@ from bs4 import BeautifulSoup
 from collections import OrderedDict
 
 import hack
+import replay
+import storage
+import analytics
+import frontier
 
 TEST_DIRECTORY = Path.joinpath(hack.BASE_DIR, 'test-dir')
 
-# REVISIT
 class TestParseCommentBlock(unittest.TestCase):
-    pass
-
-    # def test_parse_comment_block(self):
-    #     with open(Path.joinpath(TEST_DIRECTORY, 'test_input_comment_parser.html'), 'r+') as rh:
-    #         soup = BeautifulSoup(rh.read(), 'html5lib').find('div', class_='narrow')
-    #     c = hack.parse_comment_block(soup)
-
-    #     excpected = """
-    #     First paragraph
-
-    #     A reply to ...
-    #     Another reply, now to
-    #     Final reply to poster 3
-    #     Final paragraph
-    #     ++++++++++++++++
-
-    #     Poster1
-    #     Poster 1 first paragraph
-    #     Poster 1 second paragraph
-    #     Poster 1 3rd paragraph
-    #     Poster2
-    #     Poster 2 first paragraph
-    #     Poster3
-    #     Poster 3 first paragraph
-    #     """
-
-    #     print("excpected\n", c)
-    #     print("parsed_data\n", c)
-    #     self.assertEqual(c, excpected)
+    def parse(self, name, parser='html5lib'):
+        html = Path.joinpath(TEST_DIRECTORY, name).read_text(encoding='utf-8')
+        return hack.parse_comment_block(find_comment_block(hack.make_soup(html, parser)))
+
+    def test_parse_comment_block(self):
+        for parser in hack.PARSER_BACKENDS:
+            with self.subTest(parser=parser):
+                parsed = self.parse('test_input_comment_parser.html', parser)
+                self.assertEqual(parsed.focus_user_comment, "\n".join([
+                    "First paragraph",
+                    "A reply to ... poster 2",
+                    "Another reply, now to poster 3",
+                    "Final reply to poster 3",
+                    "Final paragraph"]))
+                self.assertEqual(parsed.quotes_ordered_dict, OrderedDict([
+                    ('Poster1', "Poster 1 first paragraph\nPoster 1 second paragraph\nPoster 1 3rd paragraph"),
+                    ('Poster2', "Poster 2 first paragraph"),
+                    ('Poster3', "Poster 3 first paragraph")]))
+
+    def test_parse_comment_block_with_one_quote(self):
+        parsed = self.parse('test_input_comment_parser_2.html')
+        self.assertEqual(parsed.focus_user_comment.split("\n"), [
+            "Don’t mind some of them.",
+            "If you go in as a contractor and prove yourself then you may get picked up.",
+            "As an employer, why would I waste resources to board and then have to fire an employee that didn’t work out."])
+        self.assertEqual(list(parsed.quotes_ordered_dict), ['Mcquine'])
+        self.assertEqual(len(parsed.quotes_ordered_dict['Mcquine'].split("\n")), 8)
+
+    def test_mixed_inline_content(self):
+        html = ("<div class='narrow'>even if u carry car <b>I</b> would\n <a href='/x'>turn</a> down <img src='/faces/huh.png'>"
+                " once<br><br>lol<br>lol<!-- hidden --><div>last <i>one</i></div>trailing:</div>")
+        for parser in hack.PARSER_BACKENDS:
+            with self.subTest(parser=parser):
+                self.assertEqual(
+                    hack.format_comments(find_comment_block(hack.make_soup(html, parser))),
+                    "even if u carry car I would turn down once\nlol\nlol\nlast one\ntrailing")
 
 class TestParsebrTag(unittest.TestCase):
     def test_element_with_only_previous_sibling(self):
@@ -92,42 +109,36 @@ class TestPostCollector(unittest.TestCase):
 
     @mock.patch('hack.os')
     def test_init(self, mock_os):
-        # Save directory exists; 'mkdir' NOT called
-        mock_os.path.join.return_value = 'joined-path'
-        mock_os.path.exists.return_value = True
+        # Pages live in the shared page cache; no per-collector directory is created
         obj = hack.PostCollector(self.base_url)
         self.assertEqual(obj.title, 'url')
         self.assertFalse(mock_os.mkdir.called, "Directory creation method called")
+        self.assertEqual(obj.max_age, hack.CACHE_MAX_AGE['post'])
+        self.assertEqual(hack.PostCollector(self.base_url, refresh=True).max_age, 0)
 
-        # Save directory doesn't exists; 'mkdir' called
-        mock_os.path.join.return_value = 'joined-path'
-        mock_os.path.exists.return_value  = False
-        hack.PostCollector(self.base_url)
-        mock_os.mkdir.assert_called_with('joined-path')
-
-    @mock.patch('hack.requests')
-    def test_url_checker(self, mocked_requests):
+    @mock.patch('hack.TRANSPORT')
+    def test_url_checker(self, mocked_transport):
         check = hack.PostCollector(self.base_url)._check_if_url_exists_and_is_valid('whatever-url')
-        # Assert that requests head method was called during function execution
-        mocked_requests.head.assert_called_with("whatever-url")
+        # Assert that the transport head method was called during function execution
+        mocked_transport.head.assert_called_with("whatever-url")
         self.assertIsInstance(check, bool)
 
-    @mock.patch('hack.requests')
-    def test_max_page(self, mocked_requests):
+    @mock.patch('hack.TRANSPORT')
+    def test_max_page(self, mocked_transport):
         obj = hack.PostCollector(self.base_url)
         obj._check_if_url_exists_and_is_valid = mock.MagicMock(return_value=False)
         self.assertEqual(obj.max_page(), 0)
 
-    @mock.patch('hack.Ripper')
-    def test_scrap_comment_for_single_page(self, mocked_ripper):
+    @mock.patch('hack.rip_page')
+    def test_scrap_comment_for_single_page(self, mocked_rip_page):
         """Test return object type"""
         obj = hack.PostCollector(self.base_url)
         single_page = obj._scrap_comment_for_single_page("page-url")
-        mocked_ripper.assert_called()
+        mocked_rip_page.assert_called()
         self.assertIsInstance(single_page, OrderedDict)
 
-    @mock.patch('hack.Ripper')
-    def test_scrap_comments_for_range_of_post_pages(self, mocked_ripper):
+    @mock.patch('hack.rip_page')
+    def test_scrap_comments_for_range_of_post_pages(self, mocked_rip_page):
         """Test length and type of object returned"""
         obj = hack.PostCollector(self.base_url)
         page_range = obj.scrap_comments_for_range_of_post_pages(0, 3, False)
@@ -139,6 +150,1621 @@ class TestPostCollector(unittest.TestCase):
         page_range = obj.scrap_comments_for_range_of_post_pages(0, 0, True)
         self.assertEqual(len(list(page_range)), 3)
 
+def comment_block_fixtures():
+    """Yield (name, html) of every comment block fixture"""
+    for path in sorted(TEST_DIRECTORY.glob('*.html')):
+        yield path.name, path.read_text(encoding='utf-8')
+    collection = Path.joinpath(hack.BASE_DIR, 'comment-blocks', 'comment-block-collection.html')
+    blocks = collection.read_text(encoding='utf-8').split("End of file.\n\n")
+    for number, block in enumerate(sorted(set(blocks))):
+        if block.strip():
+            yield 'collection block {}'.format(number), block
+
+def find_comment_block(document):
+    if hack.is_native(document):
+        return document.find_class('narrow')[0]
+    return document.find('div', class_='narrow')
+
+class TestParserBackends(unittest.TestCase):
+    backends = [parser for parser in hack.PARSER_BACKENDS if parser != 'html5lib']
+
+    @staticmethod
+    def parse(html, parser):
+        parsed = hack.parse_comment_block(find_comment_block(hack.make_soup(html, parser)))
+        return parsed.focus_user_comment, dict(parsed.quotes_ordered_dict)
+
+    def test_comment_blocks_are_parsed_identically(self):
+        for name, html in comment_block_fixtures():
+            expected = self.parse(html, 'html5lib')
+            for parser in self.backends:
+                with self.subTest(block=name, parser=parser):
+                    self.assertEqual(self.parse(html, parser), expected)
+
+    def test_format_comments_is_identical(self):
+        for name, html in comment_block_fixtures():
+            expected = hack.format_comments(find_comment_block(hack.make_soup(html, 'html5lib')))
+            for parser in self.backends:
+                with self.subTest(block=name, parser=parser):
+                    self.assertEqual(hack.format_comments(find_comment_block(hack.make_soup(html, parser))), expected)
+
+    def test_pages_are_scraped_identically(self):
+        def post_page(html, parser):
+            return [(user, parsed.focus_user_comment, dict(parsed.quotes_ordered_dict))
+                    for user, parsed in hack.scrap_post_page(hack.make_soup(html, parser)).items()]
+
+        def user_page(html, parser):
+            return [(section, comment.topic, comment.parsed_comment.focus_user_comment)
+                    for section, comment in hack.scrap_user_page(hack.make_soup(html, parser)).items()]
+
+        def topics_page(html, parser):
+            return [(topic.poster, topic.title, topic.url, topic.comments, topic.views, topic.last_commenter, topic.other_meta)
+                    for topic in hack.scrap_topics_page(hack.make_soup(html, parser))]
+
+        for scrap, html in [(post_page, LocalNairalandHandler.post_page(3)),
+                            (user_page, LocalNairalandHandler.user_page(3)),
+                            (topics_page, LocalNairalandHandler.section_page(3))]:
+            expected = scrap(html, 'html5lib')
+            self.assertTrue(expected)
+            for parser in self.backends:
+                with self.subTest(page=scrap.__name__, parser=parser):
+                    self.assertEqual(scrap(html, parser), expected)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            hack.make_soup('<p></p>', 'no-such-parser')
+
+class TestDiagnostics(unittest.TestCase):
+    block_html = (TEST_DIRECTORY / 'test_input_comment_parser.html').read_text(encoding='utf-8')
+
+    def setUp(self):
+        self.capture_dir = tempfile.TemporaryDirectory()
+        self.diagnostics = hack.Diagnostics()
+        patcher = mock.patch('hack.DIAGNOSTICS', self.diagnostics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.capture_dir.cleanup)
+        self.addCleanup(self.diagnostics.disable)
+
+    def parse_block(self):
+        soup = BeautifulSoup(self.block_html, 'html5lib')
+        return hack.parse_comment_block(soup.find('div', class_='narrow'))
+
+    def test_disabled_by_default_and_nothing_is_rendered(self):
+        self.assertFalse(hack.Diagnostics().enabled)
+        render = mock.MagicMock()
+        self.diagnostics.capture('channel', render)
+        self.assertFalse(render.called)
+
+    def test_parsing_does_not_touch_the_block_collection(self):
+        collection = Path.joinpath(hack.BASE_DIR, 'comment-blocks', 'comment-block-collection.html')
+        size = collection.stat().st_size
+        self.parse_block()
+        self.assertEqual(collection.stat().st_size, size)
+
+    def test_enabled_captures_comment_blocks(self):
+        self.diagnostics.enable(self.capture_dir.name)
+        self.parse_block()
+        self.diagnostics.disable()
+        captured = Path(self.capture_dir.name, 'comment_blocks.html').read_text(encoding='utf-8')
+        self.assertIn('Poster 3 first paragraph', captured)
+        self.assertTrue(captured.endswith("End of file.\n\n"))
+
+    def test_sampling(self):
+        self.diagnostics.enable(self.capture_dir.name, sample_rate=0.0)
+        render = mock.MagicMock(return_value='x')
+        for _ in range(100):
+            self.diagnostics.capture('channel', render)
+        self.assertFalse(render.called)
+
+    def test_capture_files_are_rotated_and_capped(self):
+        self.diagnostics.enable(self.capture_dir.name, max_bytes=1000, backup_count=2)
+        for _ in range(100):
+            self.diagnostics.capture('channel', lambda: 'x' * 100)
+        self.diagnostics.disable()
+        files = sorted(os.listdir(self.capture_dir.name))
+        self.assertEqual(files, ['channel.html', 'channel.html.1', 'channel.html.2'])
+        for name in files:
+            self.assertLessEqual(os.path.getsize(os.path.join(self.capture_dir.name, name)), 1000)
+
+    def test_full_queue_drops_captures(self):
+        self.diagnostics.enable(self.capture_dir.name, queue_size=1)
+        self.diagnostics.capture('channel', lambda: 'x')
+        with mock.patch.object(self.diagnostics._queue, 'put_nowait', side_effect=hack.queue.Full):
+            self.diagnostics.capture('channel', lambda: 'y')
+        self.assertEqual(self.diagnostics.dropped, 1)
+
+@mock.patch('hack.os.startfile', create=True)
+class TestExcelExport(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.OUTPUT_DIR', self.output_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.output_dir.cleanup)
+
+    def rows(self, file_name):
+        sheet = hack.OP.load_workbook(os.path.join(self.output_dir.name, file_name)).active
+        return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+    @mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages')
+    def test_topics_are_streamed_to_excel(self, mocked_scrap, mocked_startfile):
+        topic = types.SimpleNamespace(
+            poster='poster', title='title', url='url', comments='1', views='2', last_commenter='last', other_meta='meta')
+        pages_consumed = []
+        def pages(**kwargs):
+            for number in range(3):
+                pages_consumed.append(number)
+                yield iter([topic, topic])
+        mocked_scrap.side_effect = pages
+
+        hack.export_topics_to_excel('romance', 0, 2)
+        rows = self.rows('romance_page_0_2_pages.xlsx')
+        self.assertEqual(rows[0], ['POSTER', 'TITLE', 'LINK', 'COMMENTS', 'VIEWS', 'LAST COMMENTER', 'OTHERS'])
+        self.assertEqual(rows[1:], [['poster', 'title', 'url', '1', '2', 'last', 'meta']] * 6)
+        self.assertEqual(pages_consumed, [0, 1, 2])
+
+    @mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+    @mock.patch.object(hack.UserCommentHistory, 'scrap_comments_for_range_of_user_pages')
+    def test_user_comments_layout(self, mocked_scrap, mocked_check, mocked_startfile):
+        def comment(topic, focus, quotes):
+            return types.SimpleNamespace(
+                topic=topic, parsed_comment=types.SimpleNamespace(focus_user_comment=focus, quotes_ordered_dict=OrderedDict(quotes)))
+        mocked_scrap.return_value = iter([OrderedDict([
+            ('Politics', comment('t1', 'c1', [('a', 'qa'), ('b', 'qb')])),
+            ('Crime', comment('t2', 'c2', [])),
+        ])])
+
+        hack.export_user_comments_to_excel('someone', max_page=2)
+        self.assertEqual(mocked_scrap.call_args[1]['stop'], 2)
+        self.assertEqual(self.rows('someone_comments_2_pages.xlsx'), [
+            ['SECTION', 'TOPIC', 'USER_COMMENT', 'QUOTED_USER'],
+            ['Politics', 't1', 'c1', 'a: qa'],
+            [None, None, None, 'b: qb'],
+            [None, None, None, None],
+            ['Crime', 't2', 'c2', None],
+        ])
+
+@mock.patch('hack.os.startfile', create=True)
+class TestHtmlExport(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.OUTPUT_DIR', self.output_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.output_dir.cleanup)
+
+    def read(self, file_name):
+        with open(os.path.join(self.output_dir.name, file_name), 'r', encoding='utf-8') as rh:
+            return BeautifulSoup(rh.read(), 'html5lib')
+
+    @mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages')
+    def test_topics_are_escaped_and_streamed(self, mocked_scrap, mocked_startfile):
+        pages_consumed = []
+        def pages(**kwargs):
+            for number in range(3):
+                pages_consumed.append(number)
+                yield iter([hack.Topic('<b>poster</b>', 'Tom & Jerry', 'url?a=1&b=2', 1, 2, 'last', 'meta')] * 2)
+        mocked_scrap.side_effect = pages
+
+        hack.export_topics_to_html('romance', 0, 2)
+        self.assertEqual(pages_consumed, [0, 1, 2])
+        self.assertEqual(os.listdir(self.output_dir.name), ['romance_page_0_2_pages.html'])
+        mocked_startfile.assert_called_once_with(os.path.join(self.output_dir.name, 'romance_page_0_2_pages.html'))
+
+        soup = self.read('romance_page_0_2_pages.html')
+        self.assertEqual([h2.text for h2 in soup.find_all('h2')], ['Page 1', 'Page 2', 'Page 3'])
+        titles = soup.find_all('h3')
+        self.assertEqual(len(titles), 6)
+        self.assertEqual(titles[0].text, 'Tom & Jerry')
+        self.assertEqual(titles[0].a['href'], 'url?a=1&b=2')
+        self.assertEqual(soup.find('h4').a.text, '<b>poster</b>')
+        self.assertEqual(soup.find('title').text, 'Topics filed under romance - Hack Nairaland')
+
+    def test_nul_in_a_field_does_not_shift_the_others(self, mocked_startfile):
+        topic = hack.Topic('poster', 'Bad\x00title <3', 'https://www.nairaland.com/1/bad', 1, 2, 'last', 'meta')
+        soup = BeautifulSoup(hack.topic_html(topic), 'html5lib')
+        self.assertTrue(soup.find('h3').text.endswith('title <3'))
+        self.assertEqual(soup.find('h3').a['href'], 'https://www.nairaland.com/1/bad')
+        self.assertEqual(hack._escape_fields('a\x00\x00b', '&'), ['a\x00\x00b', '&amp;'])
+
+    @mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages')
+    def test_split_export_links_parts_from_an_index(self, mocked_scrap, mocked_startfile):
+        mocked_scrap.side_effect = lambda **kwargs: (
+            iter([hack.Topic('poster', 'title {}'.format(number), 'url', 1, 2, 'last', 'meta')]) for number in range(5))
+
+        hack.export_topics_to_html('romance', 0, 4, pages_per_file=2)
+        self.assertEqual(sorted(os.listdir(self.output_dir.name)), [
+            'romance_page_0_4_pages.html', 'romance_page_0_4_pages_part_1.html',
+            'romance_page_0_4_pages_part_2.html', 'romance_page_0_4_pages_part_3.html'])
+        mocked_startfile.assert_called_once_with(os.path.join(self.output_dir.name, 'romance_page_0_4_pages.html'))
+
+        index = self.read('romance_page_0_4_pages.html').find('ul', class_='list-group')
+        self.assertEqual([(a['href'], a.text) for a in index.find_all('a')], [
+            ('romance_page_0_4_pages_part_1.html', 'Pages 1 to 2'),
+            ('romance_page_0_4_pages_part_2.html', 'Pages 3 to 4'),
+            ('romance_page_0_4_pages_part_3.html', 'Pages 5 to 5')])
+
+        part = self.read('romance_page_0_4_pages_part_2.html')
+        self.assertEqual([h3.text for h3 in part.find_all('h3')], ['title 2', 'title 3'])
+        self.assertEqual([a.text for a in part.find('ul', class_='pagination').find_all('a')], ['Previous', 'Index', 'Next'])
+        last = self.read('romance_page_0_4_pages_part_3.html')
+        self.assertEqual([a.text for a in last.find('ul', class_='pagination').find_all('a')], ['Previous', 'Index'])
+
+    @mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+    @mock.patch.object(hack.UserCommentHistory, 'scrap_comments_for_range_of_user_pages')
+    def test_user_comments_layout(self, mocked_scrap, mocked_check, mocked_startfile):
+        mocked_scrap.return_value = iter([OrderedDict([
+            ('Politics', hack.Comment('t1', hack.ParsedComment('1 < 2', OrderedDict([('a', 'qa'), ('b', 'qb')])))),
+            ('Politics**2', hack.Comment('t2', hack.ParsedComment('c2', OrderedDict()))),
+        ])])
+
+        hack.export_user_comments_to_html('Someone', max_page=2)
+        soup = self.read('comments_someone_2_pages.html')
+        self.assertEqual([h3.text for h3 in soup.find_all('h3')], ['Section: Politics', 'Section: Politics'])
+        self.assertEqual([p.text for p in soup.find_all('p', class_='text-success')], ['1 < 2', 'c2'])
+        self.assertEqual([h4.text for h4 in soup.find_all('h4', class_='text-info')], ['a', 'b'])
+        self.assertEqual(soup.find('h1').a['href'], '{}/Someone/posts'.format(hack.BASE_URL))
+
+@unittest.skipIf(hack.pa is None, "pyarrow is not installed")
+class TestParquetExport(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.OUTPUT_DIR', self.output_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.output_dir.cleanup)
+
+    @mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages')
+    def test_topics_are_written_in_row_groups(self, mocked_scrap):
+        def pages(**kwargs):
+            for number in range(3):
+                yield iter([hack.Topic('poster{}'.format(n % 2), 'title', 'url', n, 10 * n, 'last', 'meta') for n in range(4)])
+        mocked_scrap.side_effect = pages
+
+        destination_file = hack.export_topics_to_parquet('romance', 2, 4, row_group_rows=5)
+        parquet_file = hack.pq.ParquetFile(destination_file)
+        self.assertEqual(parquet_file.metadata.num_rows, 12)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+
+        table = parquet_file.read()
+        self.assertEqual(table.schema, hack.topic_schema())
+        self.assertEqual(table.column('page').to_pylist(), [2] * 4 + [3] * 4 + [4] * 4)
+        self.assertEqual(table.column('views').to_pylist()[:4], [0, 10, 20, 30])
+        self.assertEqual(table.column('poster').combine_chunks().dictionary.to_pylist(), ['poster0', 'poster1'])
+
+    @mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+    @mock.patch.object(hack.UserCommentHistory, 'scrap_comments_for_range_of_user_pages')
+    def test_user_comments_keep_their_quotes(self, mocked_scrap, mocked_check):
+        mocked_scrap.return_value = iter([OrderedDict([
+            ('Politics', hack.Comment('t1', hack.ParsedComment('c1', OrderedDict([('a', 'qa'), ('b', 'qb')])))),
+            ('Politics**2', hack.Comment('t2', hack.ParsedComment('c2', OrderedDict()))),
+        ])])
+
+        rows = hack.pq.read_table(hack.export_user_comments_to_parquet('someone', max_page=2)).to_pylist()
+        self.assertEqual(rows, [
+            {'username' : 'someone', 'page' : 0, 'section' : 'Politics', 'topic' : 't1', 'comment' : 'c1',
+             'quotes' : [{'user' : 'a', 'text' : 'qa'}, {'user' : 'b', 'text' : 'qb'}]},
+            {'username' : 'someone', 'page' : 0, 'section' : 'Politics', 'topic' : 't2', 'comment' : 'c2', 'quotes' : []},
+        ])
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.checkpoint_dir.cleanup)
+        self.collector = hack.TopicCollector('politics')
+        self.fetched = []
+        self.broken_pages = set()
+
+    def scrap_topics(self, page_url, refresh=False):
+        page = int(page_url.rsplit('/', 1)[1])
+        self.fetched.append(page)
+        if page in self.broken_pages:
+            raise AttributeError("'NoneType' object has no attribute 'find'")
+        yield hack.Topic('poster', 'Topic {}'.format(page), page_url, 1, 2, 'last', 'meta')
+
+    def crawl(self, start=0, stop=4, **kwargs):
+        checkpoint = hack.Checkpoint('politics', directory=self.checkpoint_dir.name, **kwargs)
+        with mock.patch.object(self.collector, '_scrap_topics_for_a_single_page', self.scrap_topics):
+            pages = self.collector.scrap_topics_for_range_of_pages(start, stop, checkpoint=checkpoint)
+            titles = [None if page is None else [topic.title for topic in page] for page in pages]
+        return checkpoint, titles
+
+    def test_failing_pages_are_dead_lettered(self):
+        self.broken_pages = {2}
+        checkpoint, titles = self.crawl(max_attempts=2)
+        self.assertEqual(titles, [['Topic 0'], ['Topic 1'], None, ['Topic 3'], ['Topic 4']])
+        self.assertEqual(checkpoint.completed_pages(), [0, 1, 3, 4])
+        self.assertEqual(self.fetched.count(2), 2)
+        (page, error), = checkpoint.dead_letters.values()
+        self.assertEqual(page, 2)
+        self.assertTrue(error.startswith('AttributeError'))
+
+    def test_resume_skips_finished_pages(self):
+        self.broken_pages = {2}
+        self.crawl()
+        self.fetched = []
+        self.broken_pages = set()
+
+        checkpoint, titles = self.crawl()
+        self.assertEqual(self.fetched, []) # dead letters are skipped too
+        self.assertEqual(titles, [['Topic 0'], ['Topic 1'], None, ['Topic 3'], ['Topic 4']])
+
+        checkpoint, titles = self.crawl(retry_dead_letters=True)
+        self.assertEqual(self.fetched, [2])
+        self.assertEqual(titles, [['Topic {}'.format(page)] for page in range(5)])
+        self.assertEqual(checkpoint.dead_letters, {})
+
+    def test_interrupted_crawl_keeps_finished_pages(self):
+        checkpoint = hack.Checkpoint('politics', directory=self.checkpoint_dir.name)
+        with mock.patch.object(self.collector, '_scrap_topics_for_a_single_page', self.scrap_topics):
+            for number, page in enumerate(self.collector.scrap_topics_for_range_of_pages(0, 9, checkpoint=checkpoint)):
+                if number == 2:
+                    break # the crawl dies here
+        self.fetched = []
+        self.crawl(0, 9)
+        self.assertEqual(self.fetched, list(range(3, 10)))
+
+    def test_dead_page_keeps_later_pages_and_stored_rows_in_place(self):
+        with storage.Store(':memory:') as store:
+            with mock.patch.object(self.collector, '_scrap_topics_for_a_single_page', self.scrap_topics):
+                storage.store_topics(store, self.collector, 0, 4)
+                self.broken_pages = {2}
+                checkpoint = hack.Checkpoint('again', directory=self.checkpoint_dir.name, max_attempts=1)
+                storage.store_topics(store, self.collector, 0, 4, checkpoint=checkpoint)
+            self.assertEqual(store.db.execute("SELECT page, title FROM topics ORDER BY page").fetchall(),
+                             [(page, 'Topic {}'.format(page)) for page in range(5)])
+
+    def test_post_and_user_pages_round_trip(self):
+        parsed = hack.ParsedComment('focus', OrderedDict([('quoted', 'text')]))
+        post_page = OrderedDict([('user', parsed)])
+        restored = hack.PostCollector._page_from_rows(json_round_trip(hack.PostCollector._page_rows(post_page)))
+        self.assertEqual(restored['user'].focus_user_comment, 'focus')
+        self.assertEqual(restored['user'].quotes_ordered_dict, OrderedDict([('quoted', 'text')]))
+
+        user_page = OrderedDict([('Politics', hack.Comment('topic', parsed))])
+        restored = hack.UserCommentHistory._page_from_rows(json_round_trip(hack.UserCommentHistory._page_rows(user_page)))
+        self.assertEqual(restored['Politics'].topic, 'topic')
+        self.assertEqual(restored['Politics'].parsed_comment.quotes_ordered_dict, OrderedDict([('quoted', 'text')]))
+
+def json_round_trip(rows):
+    return json.loads(json.dumps(rows))
+
+class HotSection(object):
+    """A section whose topics get bumped to the front, and new ones added, while it is being crawled"""
+    def __init__(self, topics=50, per_page=5):
+        self.order = list(range(1000, 1000 + topics))
+        self.per_page = per_page
+        self.changes = [] # changes made after each fetch: ('bump', index) or ('new', id)
+
+    def fetch(self, page_url, refresh=False):
+        page = int(page_url.rsplit('/', 1)[1])
+        ids = self.order[page * self.per_page:(page + 1) * self.per_page]
+        if self.changes:
+            kind, value = self.changes.pop(0)
+            self.order.insert(0, self.order.pop(value) if kind == 'bump' else value)
+        return [hack.Topic('poster', 'Topic', 'https://www.nairaland.com/{}/topic'.format(topic), 1, 1, 'x', '') for topic in ids]
+
+class TestTopicDedupe(unittest.TestCase):
+    def setUp(self):
+        self.section = HotSection()
+        patcher = mock.patch.object(hack.TopicCollector, '_scrap_topics_for_a_single_page', self.section.fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.collector = hack.TopicCollector('politics')
+
+    @staticmethod
+    def ids(topics):
+        return [hack.topic_id(topic.url) for topic in topics]
+
+    def test_topic_id(self):
+        self.assertEqual(hack.topic_id('https://www.nairaland.com/4523456/some-title'), 4523456)
+        self.assertEqual(hack.topic_id('https://www.nairaland.com/4523456'), 4523456)
+        self.assertIsNone(hack.topic_id('https://www.nairaland.com/politics/2'))
+        self.assertIsNone(hack.topic_id('url'))
+
+    def test_bitmap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'seen.bits')
+            with hack.TopicBitmap(path) as seen:
+                self.assertTrue(seen.add(5))
+                self.assertFalse(seen.add(5))
+                self.assertTrue(seen.add(4600000))
+                self.assertNotIn(6, seen)
+                self.assertNotIn(10 ** 9, seen)
+            with hack.TopicBitmap(path) as seen:
+                self.assertEqual(len(seen), 2)
+                self.assertIn(4600000, seen)
+                self.assertFalse(seen.add(5))
+
+    def test_shifting_pages_are_deduped_and_resweep_finds_the_skipped(self):
+        # new topics push the rest back onto pages already crawled; bumps pull others forward past the crawl
+        self.section.changes = [('new', 1), ('bump', 30), ('new', 2), ('bump', 40), ('new', 3), ('bump', 45)]
+        plain = [topic for page in self.collector.scrap_topics_for_range_of_pages(0, 9) for topic in page]
+        self.assertGreater(len(self.ids(plain)), len(set(self.ids(plain))))
+
+        self.section.order = list(range(1000, 1050))
+        self.section.changes = [('new', 1), ('bump', 30), ('new', 2), ('bump', 40), ('new', 3), ('bump', 45)]
+        seen = hack.TopicSet()
+        pages = list(self.collector.scrap_topics_for_range_of_pages(0, 9, seen=seen))
+        crawled = [topic_id for page in pages for topic_id in self.ids(page)]
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(len(crawled), len(set(crawled)))
+        in_range = set(self.section.order[:50])
+        missed = in_range - set(crawled)
+        self.assertTrue(missed)
+
+        swept = list(self.collector.resweep(0, 9, seen, passes=3))
+        self.assertEqual({topic_id for _, topics in swept for topic_id in self.ids(topics)}, missed)
+        self.assertTrue(all(topic_id in seen for topic_id in in_range))
+        self.assertEqual(list(self.collector.resweep(0, 9, seen)), [])
+
+    @mock.patch('hack.os.startfile', create=True)
+    def test_exports_drop_duplicates(self, mocked_startfile):
+        self.section.changes = [('new', 1), ('new', 2)]
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch('hack.OUTPUT_DIR', output_dir):
+            hack.export_topics_to_excel('politics', 0, 3)
+            sheet = hack.OP.load_workbook(os.path.join(output_dir, 'politics_page_0_3_pages.xlsx')).active
+            links = [row[2] for row in sheet.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual(len(links), len(set(links)))
+        self.assertEqual(len(links), 18)
+
+class TestSections(unittest.TestCase):
+    homepage = BeautifulSoup(
+        "<table class='boards'><tr><td><a href='/politics'>Politics</a> <a href='/crime'>Crime</a></td></tr></table>",
+        'html5lib')
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.SECTIONS_CACHE_FILE', os.path.join(self.cache_dir.name, 'sections.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+        hack.Nairaland.clear_sections_cache()
+        self.addCleanup(hack.Nairaland.clear_sections_cache)
+
+    @mock.patch('hack.rip_page')
+    def test_constructor_makes_no_network_calls(self, mocked_rip_page):
+        hack.TopicCollector()
+        self.assertFalse(mocked_rip_page.called)
+
+    @mock.patch('hack.rip_page', return_value=homepage)
+    def test_sections_are_fetched_once_per_process(self, mocked_rip_page):
+        expected = {'Politics': '/politics', 'Crime': '/crime'}
+        self.assertEqual(hack.Nairaland().sections, expected)
+        self.assertEqual(hack.TopicCollector().sections, expected)
+        self.assertEqual(mocked_rip_page.call_count, 1)
+
+    @mock.patch('hack.rip_page', return_value=homepage)
+    def test_sections_are_read_back_from_disk(self, mocked_rip_page):
+        hack.Nairaland().sections
+        hack.Nairaland._sections = None # as in a new process
+        self.assertEqual(hack.Nairaland().sections['Crime'], '/crime')
+        self.assertEqual(mocked_rip_page.call_count, 1)
+
+    @mock.patch('hack.rip_page', return_value=homepage)
+    def test_sections_expire(self, mocked_rip_page):
+        hack.Nairaland().sections
+        with mock.patch('hack.time.time', return_value=hack.time.time() + hack.SECTIONS_TTL + 1):
+            hack.Nairaland().sections
+        self.assertEqual(mocked_rip_page.call_count, 2)
+
+class TestPageCounter(unittest.TestCase):
+    def setUp(self):
+        hack.PageCounter.clear_cache()
+        self.probed = []
+
+    def pages_below(self, number_of_pages):
+        def exists(url):
+            self.probed.append(url)
+            return int(url.rsplit('/', 1)[1]) < number_of_pages
+        return exists
+
+    def test_count_by_probing(self):
+        for number_of_pages in [0, 1, 2, 3, 7, 8, 9, 1000]:
+            hack.PageCounter.clear_cache()
+            counter = hack.PageCounter(self.pages_below(number_of_pages))
+            self.assertEqual(counter.count('thread'), number_of_pages)
+
+    def test_probes_are_logarithmic(self):
+        hack.PageCounter(self.pages_below(1000)).count('thread')
+        self.assertLess(len(self.probed), 25)
+
+    def test_probing_is_capped(self):
+        counter = hack.PageCounter(lambda url: True, max_pages=1000)
+        with self.assertRaises(hack.MaximumPageNotFound):
+            counter.count('thread')
+        self.assertEqual(hack.PageCounter(self.pages_below(1000), max_pages=1000).count('thread'), 1000)
+        with self.assertRaises(hack.MaximumPageNotFound):
+            hack.PageCounter(self.pages_below(1001), max_pages=1000).count('other')
+
+    def test_probing_onwards_from_a_known_count(self):
+        for number_of_pages, known_pages in [(1000, 998), (1000, 1000), (3, 1), (5, 9), (0, 4)]:
+            hack.PageCounter.clear_cache()
+            counter = hack.PageCounter(self.pages_below(number_of_pages))
+            self.assertEqual(counter.count('thread', known_pages=known_pages), number_of_pages)
+        self.probed = []
+        hack.PageCounter(self.pages_below(1002)).count('thread', refresh=True, known_pages=1000)
+        self.assertEqual(self.probed, ['thread/999', 'thread/1000', 'thread/1001', 'thread/1003', 'thread/1002'])
+
+    def test_marker_skips_probing(self):
+        fetch_text = mock.MagicMock(return_value="Politics (of 8000 pages)")
+        counter = hack.PageCounter(self.pages_below(10), fetch_text=fetch_text, marker=hack.PAGE_COUNT_MARKER)
+        self.assertEqual(counter.count('section'), 8000)
+        self.assertEqual(self.probed, ['section/0'])
+
+    def test_missing_marker_falls_back_to_probing(self):
+        fetch_text = mock.MagicMock(return_value="no marker here")
+        counter = hack.PageCounter(self.pages_below(5), fetch_text=fetch_text, marker=hack.PAGE_COUNT_MARKER)
+        self.assertEqual(counter.count('section'), 5)
+
+    def test_count_is_cached_until_ttl_expires(self):
+        counter = hack.PageCounter(self.pages_below(5), ttl=60)
+        counter.count('thread')
+        probes = len(self.probed)
+        self.assertEqual(counter.count('thread'), 5)
+        self.assertEqual(len(self.probed), probes)
+
+        with mock.patch('hack.time.time', return_value=hack.time.time() + 61):
+            counter.count('thread')
+        self.assertGreater(len(self.probed), probes)
+
+class RedirectingHandler(BaseHTTPRequestHandler):
+    """Answers pages 0 to 2 of any thread, and redirects every later page back to page 0, as nairaland does"""
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        page = int(self.path.rsplit('/', 1)[1])
+        if page < 3:
+            self.send_response(200)
+        else:
+            self.send_response(302)
+            self.send_header('Location', self.path.rsplit('/', 1)[0] + '/0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+class TestRedirects(unittest.TestCase):
+    def setUp(self):
+        hack.PageCounter.clear_cache()
+        self.server = HTTPServer(('127.0.0.1', 0), RedirectingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/thread'.format(self.server.server_address[1])
+        transport = hack.Transport(retries=0)
+        self.addCleanup(transport.close)
+        patcher = mock.patch('hack.TRANSPORT', transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_redirected_page_does_not_exist(self):
+        self.assertEqual(hack.TRANSPORT.head(self.url + '/5').status_code, 302)
+        self.assertFalse(hack.check_if_url_exists_and_is_valid(self.url + '/5'))
+        self.assertTrue(hack.check_if_url_exists_and_is_valid(self.url + '/2'))
+
+    def test_pages_past_the_end_are_counted_as_missing(self):
+        self.assertEqual(hack.PageCounter(hack.check_if_url_exists_and_is_valid).count(self.url), 3)
+
+@mock.patch('hack.time.sleep')
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        self.transport = hack.Transport(retries=2)
+        self.transport.session.request = mock.MagicMock()
+
+    @staticmethod
+    def response(status_code):
+        return mock.MagicMock(status_code=status_code)
+
+    def test_server_errors_are_retried(self, mocked_sleep):
+        self.transport.session.request.side_effect = [self.response(503), self.response(200)]
+        self.assertEqual(self.transport.get('url').status_code, 200)
+        self.assertEqual(mocked_sleep.call_count, 1)
+        self.assertEqual(self.transport.stats.retries, 1)
+
+    def test_connection_errors_are_retried_then_raised(self, mocked_sleep):
+        self.transport.session.request.side_effect = hack.rqe.ConnectionError
+        with self.assertRaises(hack.rqe.ConnectionError):
+            self.transport.get('url')
+        self.assertEqual(self.transport.session.request.call_count, 3)
+        self.assertEqual(self.transport.stats.errors, 3)
+
+    def test_client_errors_are_not_retried(self, mocked_sleep):
+        self.transport.session.request.return_value = self.response(404)
+        self.assertEqual(self.transport.head('url').status_code, 404)
+        self.assertFalse(mocked_sleep.called)
+
+    def test_last_server_error_is_returned(self, mocked_sleep):
+        self.transport.session.request.return_value = self.response(500)
+        self.assertEqual(self.transport.get('url').status_code, 500)
+        self.assertEqual(self.transport.session.request.call_count, 3)
+
+    def test_backoff_is_jittered_and_capped(self, mocked_sleep):
+        self.transport.max_backoff = 4
+        for attempt in range(10):
+            delay = self.transport.backoff_delay(attempt)
+            self.assertTrue(0 <= delay <= min(4, 0.5 * 2 ** attempt))
+
+    def test_stats(self, mocked_sleep):
+        self.transport.session.request.return_value = self.response(200)
+        for _ in range(10):
+            self.transport.get('url')
+        summary = self.transport.stats.summary()
+        self.assertEqual(summary['requests'], 10)
+        self.assertEqual(summary['status_codes'], {200: 10})
+        self.assertGreaterEqual(summary['p99'], summary['p50'])
+
+    def test_rate_limited_responses_are_retried(self, mocked_sleep):
+        self.transport.session.request.side_effect = [self.response(429), self.response(200)]
+        self.assertEqual(self.transport.get('http://host/a').status_code, 200)
+        self.assertEqual(self.transport.limiter.hosts['host'].throttled, 1)
+
+    def test_retry_after_holds_back_the_host(self, mocked_sleep):
+        clock = [100.0]
+        self.transport.limiter.clock = lambda: clock[0]
+        mocked_sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+        throttled = self.response(429)
+        throttled.headers = {'Retry-After': '30'}
+        self.transport.session.request.side_effect = [throttled, self.response(200)]
+        self.transport.get('http://host/a')
+        # the retry waited for Retry-After, not only for the jittered backoff
+        self.assertGreaterEqual(clock[0], 130.0)
+
+    def test_limiter_can_be_turned_off(self, mocked_sleep):
+        transport = hack.Transport(limiter=False)
+        transport.session.request = mock.MagicMock(return_value=self.response(200))
+        for _ in range(50):
+            transport.get('http://host/a')
+        self.assertFalse(mocked_sleep.called)
+
+class TestHostRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = [0.0]
+        self.limiter = hack.HostRateLimiter(rate=2.0, burst=2)
+        self.limiter.clock = lambda: self.clock[0]
+
+    def advance(self, seconds):
+        self.clock[0] += seconds
+
+    def bucket(self):
+        return self.limiter.hosts['host']
+
+    @mock.patch('hack.time.sleep')
+    def test_tokens_pace_requests(self, mocked_sleep):
+        mocked_sleep.side_effect = self.advance
+        for _ in range(6):
+            self.limiter.acquire('host')
+        # 2 from the full bucket, then 4 more at 2 per second
+        self.assertAlmostEqual(self.clock[0], 2.0)
+
+    def test_slow_start_then_additive_increase(self):
+        for _ in range(4):
+            self.limiter.record('host', 200, 0.1)
+        self.assertEqual(self.bucket().rate, 6.0)
+        self.advance(10)
+        self.limiter.record('host', 429, 0.1)
+        self.assertEqual(self.bucket().rate, 3.0)
+        self.limiter.record('host', 200, 0.1)
+        self.assertAlmostEqual(self.bucket().rate, 3.0 + 1 / 3.0)
+
+    def test_rate_is_cut_once_per_round_trip(self):
+        self.advance(10)
+        for _ in range(5):
+            self.limiter.record('host', 503)
+        self.assertEqual(self.bucket().rate, 1.0)
+        self.assertEqual(self.bucket().throttled, 5)
+        self.advance(1.0)
+        self.limiter.record('host', 503)
+        self.assertEqual(self.bucket().rate, 0.5)
+
+    def test_latency_spike_slows_down(self):
+        self.advance(10)
+        self.limiter.record('host', 200, 0.1)
+        rate = self.bucket().rate
+        self.limiter.record('host', 200, 10.0)
+        self.assertAlmostEqual(self.bucket().rate, rate * 0.9)
+        self.assertFalse(self.bucket().slow_start)
+
+    def test_share_splits_the_budget(self):
+        limiter = hack.HostRateLimiter(rate=8.0, burst=8, share=0.25)
+        limiter.clock = lambda: self.clock[0]
+        limiter.record('host', 200, 0.1)
+        self.assertEqual((limiter.hosts['host'].rate, limiter.burst, limiter.max_rate), (2.25, 2, 25.0))
+
+    def test_retry_after_seconds(self):
+        response = mock.MagicMock(headers={'Retry-After': '120'})
+        self.assertEqual(hack.retry_after_seconds(response), 120.0)
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(hack.retry_after_seconds(response, now=1445412460.0), 20.0)
+        response.headers['Retry-After'] = 'soon'
+        self.assertIsNone(hack.retry_after_seconds(response))
+        self.assertIsNone(hack.retry_after_seconds(mock.MagicMock()))
+
+@mock.patch('hack.TRANSPORT')
+class TestRateLimitedIsNotMissing(unittest.TestCase):
+    def test_user_check(self, transport):
+        transport.head.return_value = mock.MagicMock(status_code=429)
+        with self.assertRaises(hack.RateLimited):
+            hack.UserCommentHistory('seun')
+        transport.head.return_value = mock.MagicMock(status_code=404)
+        with self.assertRaises(hack.NonExistentNairalandUser):
+            hack.UserCommentHistory('seun')
+
+    def test_post_page_count(self, transport):
+        transport.head.return_value = mock.MagicMock(status_code=429)
+        with self.assertRaises(hack.RateLimited):
+            hack.PostCollector('https://www.nairaland.com/1/throttled-post').max_page(refresh=True)
+
+    def test_page_fetch(self, transport):
+        transport.get.return_value = mock.MagicMock(status_code=503)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with self.assertRaises(hack.RateLimited):
+                hack.PageCache(cache_dir).fetch('https://www.nairaland.com/politics')
+
+class LocalNairaland(ThreadingMixIn, HTTPServer):
+    """Local HTTP stand-in for nairaland.com serving generated section, post and user pages.
+
+    Earlier pages are answered more slowly than later ones, so a fetcher that yields
+    pages as they complete (instead of in page order) gets caught.
+    """
+    daemon_threads = True
+    page_count = 6
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), LocalNairalandHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.revision = '' # bump when a test changes the pages served, so their ETags change too
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class LocalNairalandHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            kind, last = self.path.strip('/').split('/')[0], self.path.rstrip('/').split('/')[-1]
+            page = int(last) if last.isdigit() else 0 # a post's own url is its page 0
+            time.sleep(max(0, 0.02 * (server.page_count - page)))
+            body = getattr(self, '{}_page'.format(kind))(page).encode('utf-8')
+            etag = '"{}-{}{}"'.format(kind, page, server.revision)
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    @staticmethod
+    def section_page(page):
+        cells = "".join(
+            "<tr><td id='top{0}{1}'><b><a href='/{0}{1}/topic-{0}-{1}'>Topic {0}.{1}</a></b>"
+            "<span class='s'>by <b>poster{0}</b>. <b>{1}</b> posts &amp; <b>{0}</b> views. "
+            "<b>1:00pm</b> (<b>last{0}</b>)</span></td></tr>".format(page, n) for n in range(3))
+        return "<html><body><table>{}</table></body></html>".format(cells)
+
+    @staticmethod
+    def post_page(page):
+        rows = "".join(
+            "<tr><td class='bold l pu'><a href='/u{0}' class='user'>user{0}x{1}</a></td></tr>"
+            "<tr><td id='pb{0}{1}' class='l w pd'><div class='narrow'>Comment {0}.{1}</div></td></tr>".format(page, n)
+            for n in range(2))
+        return "<html><body><h2>Local post</h2><table summary='posts'>{}</table></body></html>".format(rows)
+
+    @staticmethod
+    def user_page(page):
+        rows = "".join(
+            "<tr><td class='bold l pu'><a href='/section{0}'>Section{0}x{1}</a> / "
+            "<a href='/topic{0}'>Re: Topic {0}.{1}</a></td></tr>"
+            "<tr><td class='l w pd'><div class='narrow'>Comment {0}.{1}</div></td></tr>".format(page, n)
+            for n in range(2))
+        return "<html><body><table>{}</table></body></html>".format(rows)
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.server.page_count = 0 # no artificial delay
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = hack.PageCache(self.cache_dir.name)
+        self.url = '{}/section/3'.format(self.server.base_url)
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        self.cache_dir.cleanup()
+
+    def test_fresh_pages_are_served_without_a_request(self):
+        first = self.cache.fetch(self.url, max_age=60)
+        with mock.patch('hack.TRANSPORT') as mocked_transport:
+            self.assertEqual(self.cache.fetch(self.url, max_age=60), first)
+        self.assertFalse(mocked_transport.get.called)
+        self.assertEqual(self.cache.stats['fresh'], 1)
+
+    def test_stale_pages_are_revalidated(self):
+        first = self.cache.fetch(self.url, max_age=0)
+        self.assertIn('Topic 3.0', first)
+        self.assertEqual(self.cache.fetch(self.url, max_age=0), first)
+        self.assertEqual(self.cache.stats['downloaded'], 1)
+        self.assertEqual(self.cache.stats['revalidated'], 1)
+        self.assertEqual(self.cache.lookup(self.url)[1], '"section-3"')
+
+    def test_bodies_are_compressed_and_shared(self):
+        self.cache.store('a', 'same body' * 1000)
+        self.cache.store('b', 'same body' * 1000)
+        self.assertEqual(self.cache.lookup('a')[0], self.cache.lookup('b')[0])
+        self.assertLess(self.cache.size(), 1000)
+
+    def test_least_recently_used_pages_are_evicted(self):
+        self.cache.max_bytes = 2500
+        for n in range(5):
+            self.cache.store('page{}'.format(n), os.urandom(500).hex())
+            time.sleep(0.01)
+        self.assertLessEqual(self.cache.size(), 2500)
+        self.assertIsNone(self.cache.lookup('page0'))
+        self.assertIsNotNone(self.cache.lookup('page4'))
+
+    def test_max_age_policy(self):
+        self.assertEqual(hack.cache_max_age('section'), hack.CACHE_MAX_AGE['section'])
+        self.assertEqual(hack.cache_max_age('section', max_age=7), 7)
+        self.assertEqual(hack.cache_max_age('section', refresh=True, max_age=7), 0)
+
+@mock.patch.object(hack.Nairaland, '__init__', lambda self: None)
+@mock.patch('hack.parse_comment_block', lambda block: block.text.strip())
+class TestConcurrentRangeScraping(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        self.cache_dir.cleanup()
+
+    def test_post_pages_are_yielded_in_page_order(self):
+        obj = hack.PostCollector('{}/post'.format(self.server.base_url))
+        pages = list(obj.scrap_comments_for_range_of_post_pages(0, 5, concurrency=3))
+        self.assertEqual([list(page)[0] for page in pages], ['user{}x0'.format(n) for n in range(6)])
+        self.assertEqual(pages[4]['user4x1'], 'Comment 4.1')
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+
+    def test_topic_pages_are_yielded_in_page_order(self):
+        obj = hack.TopicCollector()
+        obj.post_url = '{}/section'.format(self.server.base_url)
+        pages = list(obj.scrap_topics_for_range_of_pages(0, 5, concurrency=4))
+        self.assertEqual([[topic.title for topic in page][0] for page in pages], ['Topic {}.0'.format(n) for n in range(6)])
+        self.assertLessEqual(self.server.max_in_flight, 4)
+
+    @mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+    def test_user_pages_are_yielded_in_page_order(self, mocked_check):
+        obj = hack.UserCommentHistory('someone')
+        obj.user_post_page = '{}/user'.format(self.server.base_url)
+        pages = list(obj.scrap_comments_for_range_of_user_pages(0, 5, concurrency=2))
+        self.assertEqual([page['Section{}x0'.format(n)].topic for n, page in enumerate(pages)], ['Topic {}.0'.format(n) for n in range(6)])
+
+    def test_sequential_and_concurrent_results_match(self):
+        obj = hack.PostCollector('{}/post'.format(self.server.base_url), refresh=True)
+        sequential = list(obj.scrap_comments_for_range_of_post_pages(0, 3))
+        concurrent = list(obj.scrap_comments_for_range_of_post_pages(0, 3, concurrency=4))
+        self.assertEqual(sequential, concurrent)
+
+@mock.patch.object(hack.Nairaland, '__init__', lambda self: None)
+class TestCommenterStatsUpdate(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.server.page_count = 0
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        self.cache_dir.cleanup()
+
+    def test_update_revalidates_the_cached_last_page(self):
+        post_page = LocalNairalandHandler.post_page
+        late_comment = "<tr><td class='bold l pu'><a href='/late' class='user'>latecomer</a></td></tr>" \
+                       "<tr><td id='pblate' class='l w pd'><div class='narrow'>Late</div></td></tr></table>"
+        obj = hack.PostCollector('{}/post'.format(self.server.base_url))
+        with mock.patch.object(obj, 'max_page', return_value=2):
+            self.assertNotIn('latecomer', obj.commenter_stats().counts)
+            self.server.revision = '-2'
+            with mock.patch.object(LocalNairalandHandler, 'post_page',
+                                   staticmethod(lambda page: post_page(page).replace('</table>', late_comment))):
+                stats = obj.commenter_stats(update=True)
+        self.assertEqual(stats.counts['latecomer'], 1)
+        self.assertEqual(stats.counts['user0x0'], 1)
+        self.assertEqual(hack.PAGE_CACHE.stats['downloaded'], 3)
+
+@mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+class TestParseWorkers(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.server.page_count = 0
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        self.cache_dir.cleanup()
+
+    def collectors(self):
+        post = hack.PostCollector('{}/post'.format(self.server.base_url))
+        user = hack.UserCommentHistory('someone')
+        user.user_post_page = '{}/user'.format(self.server.base_url)
+        section = hack.TopicCollector(parser=hack.NATIVE_PARSER)
+        section.post_url = '{}/section'.format(self.server.base_url)
+        return [
+            (post, post.scrap_comments_for_range_of_post_pages),
+            (user, user.scrap_comments_for_range_of_user_pages),
+            (section, section.scrap_topics_for_range_of_pages),
+        ]
+
+    def test_process_pool_results_match_in_process_parsing(self, mocked_check):
+        for collector, scrap_range in self.collectors():
+            with self.subTest(collector=str(collector)):
+                expected = [collector._page_rows(page) for page in scrap_range(0, 4)]
+                pooled = [collector._page_rows(page) for page in scrap_range(0, 4, parse_workers=2)]
+                self.assertEqual(pooled, expected)
+                self.assertEqual(len(pooled), 5)
+
+    def test_parse_page_returns_picklable_rows(self, mocked_check):
+        import pickle
+        rows = hack.parse_page('post', LocalNairalandHandler.post_page(1))
+        self.assertEqual(pickle.loads(pickle.dumps(rows)), rows)
+        self.assertEqual(rows[0][:2], ['user1x0', 'Comment 1.0'])
+
+class TestRecords(unittest.TestCase):
+    def test_topics_are_immutable_tuples_with_int_counts(self):
+        topic = next(hack.scrap_topics_page(hack.make_soup(LocalNairalandHandler.section_page(3), 'html.parser')))
+        self.assertEqual(topic, hack.Topic('poster3', 'Topic 3.0', hack.BASE_URL + '/30/topic-3-0', 0, 3, 'last3', '1:00pm'))
+        self.assertFalse(hasattr(topic, '__dict__'))
+        with self.assertRaises(AttributeError):
+            topic.views = 4
+
+    def test_records_share_one_class(self):
+        soup = hack.make_soup(LocalNairalandHandler.user_page(1), 'html.parser')
+        comments = list(hack.scrap_user_page(soup).values())
+        self.assertIs(type(comments[0]), type(comments[1]))
+        self.assertIsInstance(comments[0].parsed_comment, hack.ParsedComment)
+
+    def test_parse_count(self):
+        self.assertEqual(hack.parse_count(' 1,234 '), 1234)
+        self.assertEqual(hack.parse_count('n/a'), 'n/a')
+
+class TestCommenterStats(unittest.TestCase):
+    @staticmethod
+    def page(*comments):
+        """comments are (username, [quoted users])"""
+        output = OrderedDict()
+        for position, (username, quoted) in enumerate(comments):
+            key = username if username not in output else "{}**{}".format(username, position * 2)
+            output[key] = hack.ParsedComment('text', OrderedDict((user, 'quoted') for user in quoted))
+        return output
+
+    def test_activity(self):
+        stats = hack.CommenterStats()
+        stats.add_page(0, self.page(('ada', []), ('bayo', ['ada']), ('ada', ['bayo'])))
+        stats.add_page(1, self.page(('chi', ['ada', 'bayo']), ('ada', [])))
+        activity = stats.activity()
+        self.assertEqual(list(activity), ['ada', 'bayo', 'chi'])
+        self.assertEqual(activity['ada'], hack.CommenterActivity(3, (0, 0), (1, 1), 1, 2))
+        self.assertEqual(activity['chi'], hack.CommenterActivity(1, (1, 0), (1, 0), 2, 0))
+        self.assertEqual(stats.quotes[('chi', 'ada')], 1)
+
+    def test_a_page_added_again_replaces_the_old_one(self):
+        stats = hack.CommenterStats()
+        stats.add_page(0, self.page(('ada', []), ('bayo', [])))
+        stats.add_page(1, self.page(('chi', ['ada'])))
+        stats.add_page(1, self.page(('dayo', []), ('bayo', [])))
+        self.assertEqual(stats.counts, {'ada' : 1, 'bayo' : 2, 'dayo' : 1})
+        self.assertEqual(stats.quotes, {})
+        self.assertEqual(stats.activity()['bayo'].last_seen, (1, 1))
+        self.assertNotIn('chi', stats.activity())
+
+    @mock.patch.object(hack.Nairaland, '__init__', lambda self: None)
+    def test_collector_scrapes_once_and_updates_incrementally(self):
+        pages = [self.page(('ada', []), ('bayo', ['ada'])), self.page(('ada', []))]
+        obj = hack.PostCollector('http://nairaland.test/1/post')
+        with mock.patch.object(obj, 'max_page', return_value=2), \
+                mock.patch.object(obj, 'scrap_comments_for_range_of_post_pages',
+                                  side_effect=lambda start, stop, **kwargs: iter(pages[start:stop + 1])) as scrap:
+            self.assertEqual(obj.all_commenters(), ['ada', 'ada', 'bayo'])
+            self.assertEqual(obj.unique_commenters(), ['ada', 'bayo'])
+            self.assertEqual(obj.commenters_activity_summary(), ['ada', 'bayo'])
+            self.assertEqual(scrap.call_count, 1)
+
+            pages[1] = self.page(('ada', []), ('chi', []))
+            pages.append(self.page(('chi', ['bayo'])))
+            obj.max_page.return_value = 3
+            stats = obj.commenter_stats(update=True)
+            self.assertEqual(scrap.call_args[0], (1, 2))
+            self.assertEqual(stats.counts, {'ada' : 2, 'bayo' : 1, 'chi' : 2})
+            self.assertEqual([stats.activity()[user].quoted_by for user in ('ada', 'bayo', 'chi')], [1, 1, 0])
+
+@mock.patch.object(hack.UserCommentHistory, '_check_if_url_exists_and_is_valid', return_value=True)
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.server.page_count = 0
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = storage.Store(':memory:', batch_size=4)
+
+    def tearDown(self):
+        self.store.close()
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        self.cache_dir.cleanup()
+
+    def count(self, table):
+        return self.store.db.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+
+    def test_repeated_crawls_update_rows_in_place(self, mocked_check):
+        section = hack.TopicCollector('local')
+        section.post_url = '{}/section'.format(self.server.base_url)
+        post = hack.PostCollector('{}/post'.format(self.server.base_url))
+        for _ in range(2):
+            storage.store_topics(self.store, section, 0, 2, concurrency=2)
+            with mock.patch.object(hack.PostCollector, 'max_page', return_value=3):
+                storage.store_post(self.store, post, 0, 2)
+        self.assertEqual(self.count('topics'), 9)
+        self.assertEqual(self.count('comments'), 6)
+        self.assertEqual(self.store.db.execute("SELECT url, title, pages FROM posts").fetchall(),
+                         [(post.post_url, 'Local post', 3)])
+        self.assertEqual(
+            self.store.db.execute("SELECT section, page, poster, comments, views FROM topics WHERE title = 'Topic 2.1'").fetchone(),
+            ('local', 2, 'poster2', 1, 2))
+
+    def test_comments_by_user_in_section(self, mocked_check):
+        user = hack.UserCommentHistory('someone')
+        user.user_post_page = '{}/user'.format(self.server.base_url)
+        storage.store_user_comments(self.store, user, 0, 2, username='someone')
+        self.assertEqual(self.count('comments'), 6)
+        self.assertEqual(
+            self.store.comments_by_user('someone', section='Section1x0'),
+            [('Section1x0', 'Topic 1.0', None, 'Comment 1.0')])
+
+    def test_post_comments_round_trip(self, mocked_check):
+        post = hack.PostCollector('{}/post'.format(self.server.base_url))
+        with mock.patch.object(hack.PostCollector, 'max_page', return_value=2):
+            storage.store_post(self.store, post, 0, 1)
+        expected = OrderedDict()
+        for page in post.scrap_comments_for_range_of_post_pages(0, 1):
+            expected.update(page)
+        self.assertEqual(
+            [(key, value.focus_user_comment) for key, value in self.store.post_comments(post.post_url).items()],
+            [(key, value.focus_user_comment) for key, value in expected.items()])
+
+    def test_repeat_commenter_in_the_same_slot_of_two_pages(self, mocked_check):
+        comment = lambda body: hack.ParsedComment(body, OrderedDict())
+        for page in range(2):
+            self.store.add_post_page('post', page, OrderedDict([
+                ('b', comment('b{}'.format(page))), ('a', comment('a{}'.format(page))),
+                ('c', comment('c{}'.format(page))), ('a**3', comment('a{} again'.format(page)))]))
+        comments = self.store.post_comments('post')
+        self.assertEqual(len(comments), 8)
+        self.assertEqual([comment.focus_user_comment for key, comment in comments.items() if key.startswith('a')],
+                         ['a0', 'a0 again', 'a1', 'a1 again'])
+
+    def test_shorter_page_drops_stale_rows(self, mocked_check):
+        quoted = hack.ParsedComment('Reply', OrderedDict([('other', 'Quoted'), ('another', 'Also quoted')]))
+        self.store.add_post_page('post', 0, OrderedDict([('a', quoted), ('b', quoted), ('c', quoted)]))
+        self.store.flush()
+        self.assertEqual((self.count('comments'), self.count('quotes')), (3, 6))
+        self.store.add_post_page('post', 0, OrderedDict([('a', hack.ParsedComment('Edited', OrderedDict()))]))
+        self.store.flush()
+        self.assertEqual((self.count('comments'), self.count('quotes')), (1, 0))
+        self.assertEqual(self.store.post_comments('post')['a'].focus_user_comment, 'Edited')
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.store = storage.Store(':memory:')
+        comment = lambda body, quotes=(): hack.ParsedComment(body, OrderedDict(quotes))
+        self.store.add_post_page('post', 0, OrderedDict([
+            ('ada', comment("Fuel subsidy removal will hurt everyone")),
+            ('bayo', comment("The subsidy was a scam", [('ada', "Fuel subsidy removal will hurt everyone")])),
+            ('chidi', comment("Café owners are happy")),
+        ]), section='Politics')
+        self.store.add_user_page('ada', 'ada/posts', 0, OrderedDict([
+            ('Politics', hack.Comment('Subsidy Debate', comment("Removing the subsidy is overdue"))),
+            ('Romance', hack.Comment('Valentine Plans', comment("No fuel for the road trip"))),
+        ]))
+
+    def tearDown(self):
+        self.store.close()
+
+    def bodies(self, match, **filters):
+        return sorted(row[4] for row in self.store.search(match, **filters))
+
+    def test_phrase_prefix_and_boolean_queries(self):
+        self.assertEqual(self.bodies('"fuel subsidy"'), ["Fuel subsidy removal will hurt everyone"])
+        self.assertEqual(self.bodies('remov*'), ["Fuel subsidy removal will hurt everyone", "Removing the subsidy is overdue"])
+        self.assertEqual(self.bodies('subsidy NOT fuel'), ["Removing the subsidy is overdue", "The subsidy was a scam"])
+        self.assertEqual(self.bodies('fuel OR scam', username='bayo'), ["The subsidy was a scam"])
+        self.assertEqual(self.bodies('cafe'), ["Café owners are happy"])
+
+    def test_filters(self):
+        self.assertEqual(self.bodies('fuel', username='ada', section='Romance'), ["No fuel for the road trip"])
+        self.assertEqual(self.bodies('subsidy', topic='subsidy debate'), ["Removing the subsidy is overdue"])
+        self.assertEqual(len(self.store.search('subsidy', topic_url='post')), 2)
+        # usernames only match whole
+        self.assertEqual(self.store.search('subsidy', username='ad'), [])
+        # words of the filters are not searched as body text
+        self.assertEqual(self.store.search('ada'), [])
+
+    def test_ranked_limit_and_snippet(self):
+        self.assertEqual(len(self.store.search('subsidy', limit=2)), 2)
+        self.assertEqual(len(self.store.search('subsidy', limit=None)), 3)
+        self.assertEqual(len(self.store.search('subsidy', limit=None, ranked=True)), 3)
+        # newest stored first unless ranked
+        newest = self.store.search('subsidy', limit=None)
+        self.assertEqual(newest, self.store.db.execute(
+            "SELECT username, section, topic, topic_url, body FROM comments "
+            "WHERE body LIKE '%subsidy%' ORDER BY rowid DESC").fetchall())
+        self.assertEqual(self.store.search('scam', snippet=True)[0][4], "The subsidy was a [scam]")
+
+    def test_index_follows_updates_and_deletes(self):
+        self.store.add_post_page('post', 0, OrderedDict([('ada', hack.ParsedComment("Edited to say tomatoes", OrderedDict()))]))
+        self.assertEqual(self.bodies('removal'), [])
+        self.assertEqual(self.bodies('scam'), [])
+        self.assertEqual(self.bodies('tomatoes'), ["Edited to say tomatoes"])
+        self.assertEqual(self.store.search_quotes('removal'), [])
+
+    def test_quotes(self):
+        self.assertEqual(
+            self.store.search_quotes('hurt', quoted_user='ada'),
+            [('ada', "Fuel subsidy removal will hurt everyone", 'bayo', 'Politics', None, 'post')])
+        self.assertEqual(self.store.search_quotes('hurt', username='ada'), [])
+
+    def test_existing_database_is_indexed_on_open(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'old.sqlite')
+            with storage.Store(path) as store:
+                store.add_post_page('post', 0, OrderedDict([('ada', hack.ParsedComment("Old comment", OrderedDict()))]))
+                store.flush()
+                store.db.executescript("DROP TABLE comments_fts; DROP TABLE quotes_fts;")
+            with storage.Store(path) as store:
+                self.assertEqual(len(store.search('old')), 1)
+
+    def test_phrase_escaping(self):
+        self.assertEqual(self.bodies(storage.fts_phrase('scam" OR "fuel')), [])
+        self.assertEqual(self.bodies(storage.fts_phrase('was a scam')), ["The subsidy was a scam"])
+
+class TestIncrementalPostUpdate(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalNairaland()
+        self.server.page_count = 0
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = storage.Store(':memory:')
+        self.post_url = '{}/post'.format(self.server.base_url)
+        self.fetched = []
+        scrap = hack.PostCollector._scrap_comment_for_single_page
+        def recording_scrap(collector, page_url):
+            self.fetched.append(int(page_url.split('/')[-1]))
+            return scrap(collector, page_url)
+        patcher = mock.patch.object(hack.PostCollector, '_scrap_comment_for_single_page', recording_scrap)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        self.cache_dir.cleanup()
+
+    def update(self, number_of_pages):
+        self.fetched = []
+        with mock.patch.object(hack.PostCollector, 'max_page', return_value=number_of_pages):
+            return storage.update_posts(self.store, [self.post_url], concurrency=2)[self.post_url]
+
+    def test_only_new_pages_are_fetched(self):
+        self.assertEqual(list(self.update(3)), ['user{}x{}'.format(page, n) for page in range(3) for n in range(2)])
+        self.assertEqual(self.fetched, [0, 1, 2])
+
+        self.assertEqual(list(self.update(5)), ['user{}x{}'.format(page, n) for page in (3, 4) for n in range(2)])
+        self.assertEqual(self.fetched, [2, 3, 4])
+        self.assertEqual(self.store.post_progress(self.post_url), (5, (4, 1)))
+        self.assertEqual(len(self.store.post_comments(self.post_url)), 10)
+
+    def test_unchanged_post_fetches_only_its_last_page(self):
+        self.update(2)
+        self.assertEqual(self.update(2), OrderedDict())
+        self.assertEqual(self.fetched, [1])
+
+    def test_update_after_store_post_fetches_only_the_last_page(self):
+        collector = hack.PostCollector(self.post_url)
+        with mock.patch.object(hack.PostCollector, 'max_page', return_value=5):
+            storage.store_post(self.store, collector, 0, 4)
+            self.fetched = []
+            self.assertEqual(storage.update_post(self.store, collector), OrderedDict())
+        self.assertEqual(self.fetched, [4])
+
+    def test_user_commenting_on_several_new_pages_keeps_every_comment(self):
+        comment = lambda body: hack.ParsedComment(body, OrderedDict())
+        pages = [OrderedDict([('alice', comment('a1')), ('bob', comment('b1'))]),
+                 OrderedDict([('alice', comment('a2'))])]
+        collector = types.SimpleNamespace(post_url=self.post_url)
+        new_comments = storage._merge_post_pages(self.store, collector, (0, 5), (3, 1, pages), None)
+        self.assertEqual([(storage.real_username(key), value.focus_user_comment) for key, value in new_comments.items()],
+                         [('alice', 'a1'), ('bob', 'b1'), ('alice', 'a2')])
+
+    def test_repeat_commenter_on_both_pages_keeps_every_comment(self):
+        comment = lambda body: hack.ParsedComment(body, OrderedDict())
+        pages = [OrderedDict([('a', comment('1')), ('a**2', comment('2'))]), OrderedDict([('a', comment('3'))])]
+        collector = types.SimpleNamespace(post_url=self.post_url)
+        new_comments = storage._merge_post_pages(self.store, collector, None, (2, 0, pages), None)
+        self.assertEqual([value.focus_user_comment for value in new_comments.values()], ['1', '2', '3'])
+
+    def test_update_post_revalidates_the_cached_last_page(self):
+        post_page = LocalNairalandHandler.post_page
+        late_comment = "<tr><td class='bold l pu'><a href='/late' class='user'>latecomer</a></td></tr>" \
+                       "<tr><td id='pblate' class='l w pd'><div class='narrow'>Late</div></td></tr></table>"
+        collector = hack.PostCollector(self.post_url)
+        with mock.patch.object(hack.PostCollector, 'max_page', return_value=2):
+            storage.store_post(self.store, collector, 0, 1)
+            self.server.revision = '-2'
+            with mock.patch.object(LocalNairalandHandler, 'post_page',
+                                   staticmethod(lambda page: post_page(page).replace('</table>', late_comment))):
+                self.assertEqual(list(storage.update_post(self.store, collector)), ['latecomer'])
+
+    def test_update_probes_pages_from_the_stored_count(self):
+        self.update(3)
+        probed = []
+        def exists(url):
+            probed.append(int(url.rsplit('/', 1)[1]))
+            return probed[-1] < 4
+        with mock.patch.object(hack.PostCollector, '_check_if_url_exists_and_is_valid', side_effect=exists):
+            self.assertEqual(list(storage.update_post(self.store, hack.PostCollector(self.post_url))), ['user3x0', 'user3x1'])
+        self.assertEqual(probed, [2, 3, 4])
+        self.assertEqual(self.store.post_progress(self.post_url)[0], 4)
+
+    def test_missing_post_is_left_alone(self):
+        self.assertEqual(self.update(0), OrderedDict())
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(self.store.post_progress(self.post_url), (0, None))
+
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        topics = [
+            hack.Topic('ada', 'Buhari on recession', 'u1', 10, 100, 'x', '2:42pm'),
+            hack.Topic('ada', 'Atiku in Lagos', 'u2', 0, 0, 'y', '12:14am Apr 18'),
+            hack.Topic('obi', 'PMB and the recession', 'u3', 30, 60, 'x', '3:12pm On Dec 30'),
+            hack.Topic('obi', 'Old news', 'u4', 5, 1000, 'z', 'Apr 18, 2016'),
+            hack.Topic('chi', 'Unreadable', 'u5', 'n/a', 7, 'z', ''),
+        ]
+        self.store = storage.Store(':memory:')
+        self.store.add_topics('politics', 0, topics[:3])
+        self.store.add_topics('romance', 1, topics[3:])
+        self.topics = analytics.TopicFrame.from_records(topics, section='politics', page=0, crawled='2018-01-02 10:00')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_last_activity_is_read_relative_to_the_crawl(self):
+        self.assertEqual([str(stamp) for stamp in self.topics.frame['last_activity']], [
+            '2018-01-02 14:42:00', '2017-04-18 00:14:00', '2017-12-30 15:12:00', '2016-04-18 00:00:00', 'NaT'])
+
+    def test_columns_are_typed_once(self):
+        frame = self.topics.frame
+        self.assertEqual(str(frame['views'].dtype), 'int64')
+        self.assertEqual(frame['comments'].tolist(), [10, 0, 30, 5, 0])
+        for column in analytics.CATEGORY_COLUMNS:
+            self.assertEqual(str(frame[column].dtype), 'category')
+
+    def test_aggregates(self):
+        posters = self.topics.by_poster()
+        self.assertEqual(posters.loc['obi', ['topics', 'comments', 'views', 'max_views']].tolist(), [2, 35, 1060, 1000])
+        self.assertAlmostEqual(posters.loc['ada', 'engagement'], 0.1)
+        self.assertEqual(self.topics.by_section()['topics'].tolist(), [5])
+
+        engagement = self.topics.engagement()
+        self.assertTrue(engagement.isna()[1])
+        self.assertEqual(self.topics.top(2, by='engagement')['url'].tolist(), ['u3', 'u1'])
+        self.assertEqual(self.topics.top(3)['url'].tolist(), ['u4', 'u1', 'u3'])
+        self.assertEqual(len(self.topics.top(10)), 5)
+
+    def test_time_buckets(self):
+        months = self.topics.activity('MS')
+        self.assertEqual(months['topics'].sum(), 4)
+        self.assertEqual(months.loc['2017-12-01', 'comments'], 30)
+        weeks = self.topics.activity('W', by='poster')
+        self.assertEqual(list(weeks.index.names), ['poster', 'last_activity'])
+        self.assertEqual({(poster, str(week.date())) : topics for (poster, week), topics in weeks['topics'].items()}, {
+            ('ada', '2017-04-23') : 1, ('obi', '2017-12-31') : 1, ('ada', '2018-01-07') : 1, ('obi', '2016-04-24') : 1})
+        self.assertEqual(self.topics.activity('h')['topics'].tolist(), [1, 1, 1, 1])
+        self.assertEqual(self.topics.hour_of_day()[[0, 14, 15]].tolist(), [2, 1, 1])
+        self.assertEqual(self.topics.title_contains('buhari', 'PMB').tolist(), [True, False, True, False, False])
+
+    def test_from_store(self):
+        topics = analytics.TopicFrame.from_store(self.store)
+        self.assertEqual(len(topics), 5)
+        self.assertEqual(topics.by_section()['topics'].to_dict(), {'politics' : 3, 'romance' : 2})
+        self.assertEqual(len(analytics.TopicFrame.from_store(self.store, section='romance')), 2)
+        self.assertEqual(len(analytics.TopicFrame.from_store(self.store, section='nothing')), 0)
+
+    def test_dedupe(self):
+        topics = [hack.Topic('ada', 'Bumped', 'https://www.nairaland.com/{}/bumped'.format(n), 1, 2, 'x', '2:42pm')
+                  for n in (7, 8, 7, 7)]
+        frame = analytics.TopicFrame.from_records(topics + [topics[0]._replace(url='u1')] * 2, crawled='2018-01-02')
+        self.assertEqual(frame.dedupe().frame['url'].tolist(), [
+            'https://www.nairaland.com/7/bumped', 'https://www.nairaland.com/8/bumped', 'u1', 'u1'])
+
+class TestReplayServer(unittest.TestCase):
+    def setUp(self):
+        self.server = replay.ReplayServer(page_counts={'section' : 4, 'post' : 3, 'user' : 2}, seed=0)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        for patcher in (mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name)),
+                        mock.patch('hack.TRANSPORT', hack.Transport(backoff=0.001)),
+                        mock.patch('hack.BASE_URL', self.server.base_url)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        hack.PageCounter.clear_cache()
+
+    def tearDown(self):
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        hack.TRANSPORT.close()
+        self.cache_dir.cleanup()
+
+    def test_collectors_crawl_the_replay_server(self):
+        section = hack.TopicCollector('politics', parser=hack.NATIVE_PARSER)
+        self.assertEqual(section.max_pages(), 4)
+        topics = [topic for page in section.scrap_topics_for_range_of_pages(0, 3, concurrency=2) for topic in page]
+        self.assertEqual(len(topics), 240)
+        self.assertTrue(topics[0].url.startswith(self.server.base_url))
+
+        post = hack.PostCollector('{}/1234/synthetic'.format(self.server.base_url))
+        self.assertEqual(post.max_page(), 3)
+        self.assertEqual(len(list(post.scrap_comments_for_range_of_post_pages(0, 2))), 3)
+
+        user = hack.UserCommentHistory('someone', parser='lxml')
+        self.assertEqual(user.max_pages(), 2)
+        self.assertEqual([len(page) for page in user.scrap_comments_for_range_of_user_pages(0, 1)], [25, 25])
+
+    def test_pages_past_the_page_count_are_missing(self):
+        self.assertEqual(hack.TRANSPORT.get('{}/politics/4'.format(self.server.base_url)).status_code, 404)
+        self.assertEqual(hack.TRANSPORT.get('{}/politics/3'.format(self.server.base_url)).status_code, 200)
+
+    def test_errors_are_served_at_the_error_rate(self):
+        self.server.error_rate = 1.0
+        response = hack.TRANSPORT.get('{}/politics/0'.format(self.server.base_url))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(hack.TRANSPORT.stats.retries, 3)
+        self.assertEqual(self.server.served[503], 4)
+
+    def test_recorded_pages_are_replayed(self):
+        with tempfile.TemporaryDirectory() as recordings:
+            with open(os.path.join(recordings, replay.recording_name('/politics/1')), 'w', encoding='utf-8') as wh:
+                wh.write('recorded')
+            self.server.recordings = recordings
+            self.assertEqual(hack.TRANSPORT.get('{}/politics/1'.format(self.server.base_url)).text, 'recorded')
+
+    def test_configure_base_url(self):
+        with mock.patch.object(hack.Nairaland, 'clear_sections_cache'), \
+                mock.patch.object(hack.Nairaland, 'site_url'), mock.patch.dict(os.environ):
+            hack.configure_base_url(self.server.base_url + '/')
+            self.assertEqual(hack.BASE_URL, self.server.base_url)
+            self.assertEqual(hack.Nairaland.site_url, self.server.base_url + '/')
+            self.assertEqual(hack.TopicCollector('politics').post_url, self.server.base_url + '/politics')
+
+class TestFrontier(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'frontier.sqlite')
+        self.frontier = frontier.Frontier(self.path, lease_seconds=60, max_attempts=2, backoff=0)
+        self.addCleanup(self.frontier.close)
+
+    def test_pages_are_deduplicated_and_leased_by_priority(self):
+        self.assertEqual(self.frontier.add_section('politics', 0, 4), 5)
+        self.assertEqual(self.frontier.add_section('politics', 3, 6), 2)
+        self.assertEqual(self.frontier.add_users(['Seun', 'seun'], 0, 1, priority=1), 2)
+        self.assertEqual(self.frontier.add_section('politics', 5, 5, priority=2), 0)
+        self.assertEqual(self.frontier.counts(), {'pending' : 9})
+
+        tasks = self.frontier.lease('a', 4)
+        self.assertEqual([(task.kind, task.page) for task in tasks], [('section', 5), ('user', 0), ('user', 1), ('section', 0)])
+        self.assertEqual(tasks[1].url, '{}/seun/posts/0'.format(hack.BASE_URL))
+
+    def test_lease_runs_on_sqlite_before_returning(self):
+        statements = []
+        self.frontier.db.set_trace_callback(statements.append)
+        self.frontier.add_section('politics', 0, 2)
+        self.assertEqual([task.attempts for task in self.frontier.lease('a', 2)], [1, 1])
+        self.assertFalse([statement for statement in statements if 'RETURNING' in statement.upper()])
+
+    @mock.patch('frontier.run_worker', return_value=0)
+    def test_worker_processes_split_the_rate_limit(self, mocked_run_worker):
+        with mock.patch('hack.TRANSPORT'), mock.patch('hack.PAGE_CACHE'):
+            frontier._worker_process(self.path, ':memory:', {'concurrency' : 2}, processes=4)
+            self.assertEqual(hack.TRANSPORT.limiter.share, 0.25)
+        self.assertTrue(mocked_run_worker.called)
+
+    def test_leases_are_exclusive_until_they_expire(self):
+        self.frontier.add_section('politics', 0, 4)
+        other = frontier.Frontier(self.path, lease_seconds=60)
+        self.addCleanup(other.close)
+        first = {task.url for task in self.frontier.lease('a', 3)}
+        second = {task.url for task in other.lease('b', 5)}
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(first & second)
+        self.assertEqual(other.lease('b', 5), [])
+
+        with mock.patch('frontier.time.time', return_value=time.time() + 120):
+            taken_over = {task.url for task in other.lease('b', 5)}
+        self.assertEqual(taken_over, first | second)
+        self.assertEqual(self.frontier.complete(sorted(first), 'a'), 0) # a's leases are gone
+        self.assertEqual(other.complete(sorted(taken_over), 'b'), 5)
+        self.assertEqual(self.frontier.counts(), {'done' : 5})
+        self.assertEqual(self.frontier.outstanding(), 0)
+
+    def test_failures_are_retried_then_dead_lettered(self):
+        self.frontier.add_section('politics', 0, 0)
+        for attempt in (1, 2):
+            task = self.frontier.lease('a')[0]
+            self.assertEqual(task.attempts, attempt)
+            self.assertTrue(self.frontier.fail(task.url, 'a', 'ValueError: bad page'))
+        self.assertEqual(self.frontier.dead_letters(), [('{}/politics/0'.format(hack.BASE_URL), 'ValueError: bad page')])
+        self.assertEqual(self.frontier.lease('a'), [])
+
+        self.frontier.add_section('politics', 1, 1)
+        task = self.frontier.lease('a')[0]
+        self.frontier.fail(task.url, 'a', 'NonExistentNairalandUser', permanent=True)
+        self.assertEqual(self.frontier.counts(), {'dead' : 2})
+        self.assertEqual(self.frontier.retry_dead(), 2)
+        self.assertEqual([task.attempts for task in self.frontier.lease('a', 2)], [1, 1])
+        self.assertEqual(self.frontier.release('a'), 2)
+        self.assertEqual(self.frontier.counts(), {'pending' : 2})
+
+    @mock.patch.object(hack.TopicCollector, 'scrap_topics_for_range_of_pages')
+    def test_worker_dead_letters_failing_pages(self, mocked_scrap):
+        def pages(start, stop):
+            if start == 1:
+                raise ValueError("unreadable page")
+            yield iter([hack.Topic('poster', 'title', 'url{}'.format(start), 1, 2, 'last', 'meta')])
+        mocked_scrap.side_effect = pages
+        self.frontier.add_section('politics', 0, 2)
+        with storage.Store(':memory:') as store:
+            self.assertEqual(frontier.run_worker(self.frontier, store, owner='a', wait=0), 2)
+            self.assertEqual(store.db.execute("SELECT url FROM topics ORDER BY url").fetchall(), [('url0',), ('url2',)])
+        self.assertEqual(self.frontier.counts(), {'done' : 2, 'dead' : 1})
+        self.assertEqual(mocked_scrap.call_count, 4)
+
+    def test_workers_share_a_crawl_without_fetching_a_page_twice(self):
+        server = replay.ReplayServer(page_counts={'section' : 12, 'post' : 6, 'user' : 3}, seed=0)
+        self.addCleanup(server.stop)
+        cache_dir = os.path.join(self.directory.name, 'cache')
+        for patcher in (mock.patch('hack.PAGE_CACHE', hack.PageCache(cache_dir)),
+                        mock.patch('hack.BASE_URL', server.base_url)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: hack.PAGE_CACHE.close())
+
+        self.frontier.add_section('politics', 0, 11)
+        self.frontier.add_post('{}/1234/synthetic'.format(server.base_url), 0, 5)
+        self.frontier.add_users(['someone'], 0, 2)
+        database = os.path.join(self.directory.name, 'crawl.sqlite')
+        completed = []
+        def work():
+            with frontier.Frontier(self.path) as connection, storage.Store(database) as store:
+                completed.append(frontier.run_worker(connection, store, concurrency=2, parser=hack.NATIVE_PARSER))
+        workers = [threading.Thread(target=work) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(sum(completed), 21)
+        self.assertEqual(self.frontier.counts(), {'done' : 21})
+        gets = {path : count for (method, path), count in server.requests.items() if method == 'GET'}
+        self.assertEqual(len(gets), 21)
+        self.assertEqual(set(gets.values()), {1})
+        with storage.Store(database) as store:
+            self.assertEqual(store.db.execute("SELECT COUNT(*) FROM topics").fetchone()[0], 12 * 60)
+            self.assertEqual(len(store.comments_by_user('user0')), 12)
+            self.assertEqual(store.post_progress('{}/1234/synthetic'.format(server.base_url))[1], (5, 29))
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.server = replay.ReplayServer(page_counts={'section' : 3, 'post' : 3, 'user' : 2}, seed=0)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        for patcher in (mock.patch('hack.PAGE_CACHE', hack.PageCache(self.cache_dir.name)),
+                        mock.patch('hack.TRANSPORT', hack.Transport(backoff=0.001)),
+                        mock.patch('hack.BASE_URL', self.server.base_url),
+                        mock.patch('hack.METRICS', hack.Metrics())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        hack.PageCounter.clear_cache()
+
+    def tearDown(self):
+        hack.METRICS.disable()
+        self.server.stop()
+        hack.PAGE_CACHE.close()
+        hack.TRANSPORT.close()
+        self.cache_dir.cleanup()
+
+    def test_nothing_is_collected_while_disabled(self):
+        post = hack.PostCollector('{}/1234/synthetic'.format(self.server.base_url))
+        list(post.scrap_comments_for_range_of_post_pages(0, 1))
+        summary = hack.METRICS.summary()
+        self.assertEqual((summary['counters'], summary['timers']), ({}, {}))
+
+    def test_crawl_stages_are_counted(self):
+        hack.METRICS.enable()
+        post = hack.PostCollector('{}/1234/synthetic'.format(self.server.base_url), parser=hack.NATIVE_PARSER)
+        self.assertEqual(post.max_page(), 3)
+        list(post.scrap_comments_for_range_of_post_pages(0, 2))
+        list(post.scrap_comments_for_range_of_post_pages(0, 2))
+        summary = hack.METRICS.summary()
+        counters = summary['counters']
+        self.assertEqual(counters['probes'], 1)
+        self.assertEqual((counters['comment_pages'], counters['comments']), (6, 180))
+        self.assertEqual(summary['comments_per_page'], 30)
+        # page 0 is read once as <post url> by max_page, then as <post url>/0 by the crawls
+        self.assertEqual((counters['cache_downloaded'], counters['cache_fresh']), (4, 3))
+        self.assertEqual(summary['cache_hit_rate'], 3 / 7)
+        self.assertGreater(counters['bytes'], 0)
+        self.assertEqual(summary['timers']['parse_comment_block']['count'], 180)
+        self.assertEqual(
+            set(summary['timers']), {'probe', 'fetch', 'parse', 'parse_comment_block'})
+
+    def test_exported_rows_are_counted(self):
+        hack.METRICS.enable()
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch('hack.OUTPUT_DIR', output_dir), \
+                mock.patch('hack.os.startfile', create=True):
+            hack.export_topics_to_excel('politics', 0, 1)
+        summary = hack.METRICS.summary()
+        self.assertEqual((summary['counters']['rows_written'], summary['counters']['topics']), (120, 120))
+        self.assertEqual(summary['timers']['export']['count'], 1)
+
+    def test_periodic_json_log_and_prometheus_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file, prometheus_file = os.path.join(directory, 'metrics.jsonl'), os.path.join(directory, 'metrics.prom')
+            hack.METRICS.enable(log_file=log_file, interval=0.05, prometheus_file=prometheus_file)
+            hack.METRICS.count('fetches', 2)
+            hack.METRICS.observe('fetch', 0.25)
+            time.sleep(0.2)
+            hack.METRICS.disable()
+            with open(log_file, 'r', encoding='utf-8') as rh:
+                reports = [json.loads(line) for line in rh]
+            with open(prometheus_file, 'r', encoding='utf-8') as rh:
+                prometheus = rh.read()
+        self.assertGreater(len(reports), 1)
+        self.assertEqual(reports[-1]['counters'], {'fetches' : 2})
+        self.assertIn("nairaland_fetches_total 2\n", prometheus)
+        self.assertIn("nairaland_fetch_seconds_sum 0.25\nnairaland_fetch_seconds_count 1\n", prometheus)
+
 if __name__ == '__main__':
     print("Testing")
     unittest.main()